@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks background2025.py:
+
+    1. Store the background as raw .npy arrays plus a small metadata file
+    2. Load the background lazily, memory-mapping each array on first access
+
+Layout of the store (one folder per year, e.g. data/bg/background2016/):
+    meta.pkl        the kind of each field and the settings of the LeontiefSolver
+    <field>.pkl     other objects (labels, aggregation, sheet names, ...)
+    <field>.npy     dense arrays (B, M, H, Y, Q, Ystim, Hstim, Vstim, ...)
+    <field>.npz     sparse arrays (A in sparse mode)
+    L.<part>.npy    arrays of the LeontiefSolver (LU factors and pivots; a float32
+                    solver refines against the stored A, attached on loading)
+
+The labels are pandas objects in their own file, so opening a store and reading
+arrays (e.g. the totals of cli2025.py footprint --totals) does not import pandas.
+Stores written before labels were split off keep them in meta.pkl and load as before.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import os
+import pickle as pkl
+from leontief2025 import LeontiefSolver
+from profile2025 import traced
+
+
+##############################################
+# Write background store
+##############################################
+
+# Path of the store of a given year
+def background_path(bg_dir, year):
+    return os.path.join(bg_dir, 'background' + year)
+
+# Save a background dictionary (as returned by createBackground) to the store
+@traced()
+def save_background(bg, bg_dir, year):
+    store_dir = background_path(bg_dir, year)
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    kinds = {}
+    values = {}
+    for key, val in bg.items():
+        if isinstance(val, np.ndarray):
+            np.save(os.path.join(store_dir, key + '.npy'), val)
+            kinds[key] = 'array'
+        elif sp.issparse(val):
+            sp.save_npz(os.path.join(store_dir, key + '.npz'), sp.csr_matrix(val))
+            kinds[key] = 'sparse'
+        elif isinstance(val, LeontiefSolver):
+            # arrays of the solver are stored one by one, the rest goes to meta.pkl
+            state = val.__getstate__()
+            parts = {}
+            for part, pval in state.items():
+                if isinstance(pval, np.ndarray):
+                    np.save(os.path.join(store_dir, key + '.' + part + '.npy'), pval)
+                    parts[part] = 'array'
+                elif sp.issparse(pval):
+                    sp.save_npz(os.path.join(store_dir, key + '.' + part + '.npz'), sp.csc_matrix(pval))
+                    parts[part] = 'sparse'
+                else:
+                    parts[part] = pval
+            kinds[key] = 'solver'
+            values[key] = parts
+        else:
+            pkl_out = open(os.path.join(store_dir, key + '.pkl'), "wb")
+            pkl.dump(val, pkl_out)
+            pkl_out.close()
+            kinds[key] = 'object'
+
+    pkl_out = open(os.path.join(store_dir, 'meta.pkl'), "wb")
+    pkl.dump({'kinds': kinds, 'values': values}, pkl_out)
+    pkl_out.close()
+    return store_dir
+
+
+##############################################
+# Lazily loaded background
+##############################################
+
+# Dictionary-like background: bg['B'], bg['L'], ... are read on first access.
+# Dense arrays are memory-mapped read-only, so only the pages used are read.
+class Background:
+
+    def __init__(self, store_dir, mmap_mode='r'):
+        self.store_dir = store_dir
+        self.mmap_mode = mmap_mode
+        pkl_in = open(os.path.join(store_dir, 'meta.pkl'), "rb")
+        meta = pkl.load(pkl_in)
+        pkl_in.close()
+        self._kinds = meta['kinds']
+        self._values = meta['values']
+        self._loaded = {}
+
+    def _path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def _load(self, key):
+        kind = self._kinds[key]
+        if kind == 'array':
+            return np.load(self._path(key + '.npy'), mmap_mode=self.mmap_mode)
+        if kind == 'sparse':
+            return sp.load_npz(self._path(key + '.npz'))
+        if kind == 'solver':
+            state = {}
+            for part, pval in self._values[key].items():
+                if pval == 'array':
+                    # only the LU factors are memory-mapped, LAPACK does not accept read-only pivots
+                    state[part] = np.load(self._path(key + '.' + part + '.npy'), mmap_mode=self.mmap_mode)
+                    if state[part].ndim < 2:
+                        state[part] = np.array(state[part])
+                elif pval == 'sparse':
+                    state[part] = sp.load_npz(self._path(key + '.' + part + '.npz')).tocsc()
+                else:
+                    state[part] = pval
+            solver = LeontiefSolver.__new__(LeontiefSolver)
+            solver.__dict__.update(state)
+            if solver.A is None and 'A' in self._kinds:
+                solver.attach(self['A'])  # A of the background for the refinement (float32 mode)
+            return solver
+        if key in self._values:  # store with the objects in meta.pkl
+            return self._values[key]
+        pkl_in = open(self._path(key + '.pkl'), "rb")
+        val = pkl.load(pkl_in)
+        pkl_in.close()
+        return val
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            self._loaded[key] = self._load(key)
+        return self._loaded[key]
+
+    def __contains__(self, key):
+        return key in self._kinds
+
+    def __iter__(self):
+        return iter(self._kinds)
+
+    def keys(self):
+        return self._kinds.keys()
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+# Open the background store of a given year
+def load_background(bg_dir, year, mmap_mode='r'):
+    return Background(background_path(bg_dir, year), mmap_mode)
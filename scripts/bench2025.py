@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks bench2025.py:
+
+    1. Generate a synthetic MRIO (A, Y, V, R, H, Q, labels and the waste
+       extension) of any number of regions and sectors, seeded, with the
+       structure of Exiobase: dense-ish domestic blocks, sparse import blocks
+    2. Time the Leontief factorisation, the process step (x and Z),
+       createBackground, calc_contrib, calc_hotspot, the aggregation and the
+       report writers on it, without Exiobase
+    3. Keep the timings in a baseline file and flag regressions
+
+Run from the envr-footprint-healthcare2025 folder:
+
+    python scripts/bench2025.py --sizes 10x10 25x60 49x163 --update     (store a baseline)
+    python scripts/bench2025.py --sizes 10x10 25x60 49x163              (compare, exit code 1 on regressions)
+
+A stage regresses when its median time exceeds the baseline median by more
+than --threshold (relative) and by more than --min-diff seconds. Timings are
+stored per size, dense/sparse A (--sparse) and report format (--format), and only
+compared with the baseline of the same configuration. Baselines are only
+comparable on the same machine and BLAS settings, which are stored with them.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import pickle as pkl
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+##############################################
+# Synthetic MRIO
+##############################################
+
+# Exiobase-like labels: DESIRE regions cycle through the six aggregates used by createBackground
+desire = [('NL', 'Netherlands'), ('WE', 'Europe'), ('WA', 'Asia'), ('WL', 'America'), ('WM', 'Middle East'), ('WF', 'Africa')]
+char_names = [('Global warming', 'kg CO2 eq'), ('Material extraction', 'kt'), ('Blue water consumption', 'Mm3'),
+              ('Land use', 'km2'), ('Value added', 'M.EUR'), ('Employment', '1000 p.')]
+
+# Sparse n x n matrix with blocks of ns x ns: diagonal blocks with density dom, the others with density imp
+def _block_sparse(rng, nr, ns, dom, imp):
+    n = nr * ns
+    rows, cols = [], []
+    # domestic blocks
+    k = rng.binomial(ns * ns, dom, nr)
+    for r in range(nr):
+        pos = rng.choice(ns * ns, k[r], replace=False)
+        rows.append(r * ns + pos // ns)
+        cols.append(r * ns + pos % ns)
+    # imports, drawn over the whole matrix and dropped inside the diagonal blocks
+    m = rng.binomial(n * n, imp)
+    i = rng.integers(0, n, m)
+    j = rng.integers(0, n, m)
+    keep = i // ns != j // ns
+    rows.append(i[keep])
+    cols.append(j[keep])
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    vals = rng.lognormal(0, 1.5, len(rows))
+    return sp.csc_matrix((vals, (rows, cols)), shape=(n, n))
+
+# Synthetic MRIO of nr regions and ns sectors
+#   dom, imp: density of the domestic and import blocks of A
+#   nx: number of extensions (rows of R and H, columns of Q)
+# Returns {'mrio', 'waste', 'cbs_data', 'positions', 'reg_labels', 'sec_labels'}, where
+# mrio has the keys of the output of exiobase_3_7-load2025.py
+def synthetic_mrio(nr=10, ns=10, seed=0, dom=0.3, imp=0.01, nx=40, ny=7, sparse=False):
+    rng = np.random.default_rng(seed)
+    n = nr * ns
+
+    # A: column sums (intermediate input share) between 0.2 and 0.8, about 70% domestic
+    A = _block_sparse(rng, nr, ns, dom, imp).tocoo()
+    is_dom = A.row // ns == A.col // ns
+    domestic = sp.csc_matrix((A.data[is_dom], (A.row[is_dom], A.col[is_dom])), shape=(n, n))
+    imports = sp.csc_matrix((A.data[~is_dom], (A.row[~is_dom], A.col[~is_dom])), shape=(n, n))
+    target = rng.uniform(0.2, 0.8, n)
+    share = rng.uniform(0.5, 0.9, n)
+    s_dom = np.asarray(domestic.sum(0)).ravel()
+    s_imp = np.asarray(imports.sum(0)).ravel()
+    f_dom = np.divide(target * share, s_dom, out=np.zeros(n), where=s_dom > 0)
+    f_imp = np.divide(target * (1 - share), s_imp, out=np.zeros(n), where=s_imp > 0)
+    A = (domestic @ sp.diags(f_dom) + imports @ sp.diags(f_imp)).tocsr()
+    A.eliminate_zeros()
+
+    # final demand: mostly domestic, each region buys a sample of imported products
+    Y = np.zeros((n, nr * ny))
+    for r in range(nr):
+        Y[r * ns:(r + 1) * ns, r * ny:(r + 1) * ny] = rng.lognormal(3, 1.5, (ns, ny)) * (rng.random((ns, ny)) < 0.6)
+        mask = rng.random((n, ny)) < 0.05
+        Y[:, r * ny:(r + 1) * ny] += rng.lognormal(1, 1.5, (n, ny)) * mask
+
+    # extensions: most sectors emit a few stressors, households a few more
+    R = sp.random(nx, n, density=0.3, random_state=np.random.RandomState(seed), data_rvs=lambda k: rng.lognormal(2, 2, k)).tocsr()
+    H = rng.lognormal(2, 2, (nx, nr * ny)) * (rng.random((nx, nr * ny)) < 0.2)
+    V = rng.lognormal(2, 1, (9, n))
+    Q = rng.random((len(char_names), nx)) * (rng.random((len(char_names), nx)) < 0.3)
+
+    region = pd.DataFrame({'DESIRE region': [desire[k % 6][0] for k in range(nr)],
+                           'DESIRE region name': [desire[k % 6][1] for k in range(nr)],
+                           'ISO3': ['R%02d' % k for k in range(nr)],
+                           'Name': ['Region %d' % k for k in range(nr)]}, index=['C%02d' % k for k in range(nr)])
+    industry = pd.DataFrame({'Name': ['Sector %d' % k for k in range(ns)]}, index=pd.Index(['S%03d' % k for k in range(ns)], name='CodeTxt'))
+    final = pd.DataFrame({'Name': ['Final demand %d' % k for k in range(ny)]})
+    primary = pd.DataFrame({'Name': ['Primary input %d' % k for k in range(9)]})
+    extension = pd.DataFrame({'Name': ['Extension %d' % k for k in range(nx)]})
+    characterization = pd.DataFrame(char_names, columns=['Name', 'Unit'])
+    label = {'region': region, 'industry': industry, 'final': final, 'primary': primary, 'extension': extension, 'characterization': characterization}
+
+    if not sparse:
+        A = A.toarray()
+        R = R.toarray()
+    mrio = {'Y': Y, 'A': A, 'V': V, 'R': R, 'H': H, 'Q': Q, 'label': label}
+    waste = {'label': {'region': region, 'industry': industry, 'final': final, 'unit': 'tonne'},
+             'r': rng.lognormal(0, 2, (1, n)), 'h': rng.lognormal(0, 2, (1, nr * ny))}
+
+    # stimulus of the middle region, on three distinct sectors
+    positions = {'region': nr // 2, 'health': ns - 1, 'pharm': ns // 3, 'appl': (2 * ns) // 3}
+    cbs_data = pd.DataFrame({'HC service': [1000.0 * nr, 1, 50.0], 'Pharm': [100.0 * nr, 0.7, 0], 'MedAppl': [50.0 * nr, 0.8, 0]},
+                            index=pd.MultiIndex.from_tuples([('Expenditure', 'MEUR'), ('Conversion', 'na'), ('DirectEm', 'kt CO2e')], names=['Index', 'Unit']))
+
+    reg_labels = pd.DataFrame({'ISO3': region['ISO3'].values, 'RegName': region['Name'].values, 'Region': region['DESIRE region name'].values})
+    nagg = max(2, ns // 8)
+    sec_labels = pd.DataFrame({'SecTxtCode': industry.index, 'SecName': industry['Name'].values,
+                               'SAggDescription': ['Aggregate %d' % (k % nagg) for k in range(ns)],
+                               'Scope': ['Scope %d' % (k % 3 + 1) for k in range(ns)],
+                               'Scope_hotspot': ['Scope %d' % (k % 2 + 1) for k in range(ns)]})
+    return {'mrio': mrio, 'waste': waste, 'cbs_data': cbs_data, 'positions': positions, 'reg_labels': reg_labels, 'sec_labels': sec_labels}
+
+# Pickles in the layout of the prep scripts (waste.pkl, leontief<year>.pkl, mrio<year>.pkl), for createBackground
+def write_synthetic(synth, mrio_dir, year='2016'):
+    from leontief2025 import LeontiefSolver, scale_columns
+    mrio = dict(synth['mrio'])
+    L = LeontiefSolver(mrio['A'])
+    x = L.solve(mrio['Y'].sum(1).reshape((-1, 1)))
+    mrio['x'] = x
+    mrio['Z'] = scale_columns(mrio['A'], x[:, 0])
+    for (name, obj) in [('waste.pkl', synth['waste']), ('leontief' + year + '.pkl', L), ('mrio' + year + '.pkl', mrio)]:
+        with open(os.path.join(mrio_dir, name), 'wb') as f:
+            pkl.dump(obj, f, protocol=5)
+
+
+##############################################
+# Benchmark
+##############################################
+
+stages = ['leontief', 'process', 'createBackground', 'calc_contrib', 'calc_hotspot', 'aggregation', 'output']
+
+# Median and minimum of repeated calls of f (f is called once more before, as warm-up, when warmup)
+def _time(f, repeat, warmup=False):
+    if warmup:
+        f()
+    times = []
+    for k in range(repeat):
+        t0 = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t0)
+    return {'median': float(np.median(times)), 'min': float(np.min(times)), 'repeat': repeat}
+
+# Timings of all stages on a synthetic MRIO of nr x ns, {stage: {'median', 'min', 'repeat'}}
+def run_size(nr, ns, repeat=3, seed=0, sparse=False, fmt='csv'):
+    from functions2025 import createBackground, calc_contrib, calc_hotspot, df_fromarray
+    from leontief2025 import LeontiefSolver, scale_columns
+    from labels2025 import LabelTable, AggregationCube
+    from output2025 import open_report
+
+    synth = synthetic_mrio(nr, ns, seed, sparse=sparse)
+    mrio = synth['mrio']
+    work = tempfile.mkdtemp(prefix='bench2025-')
+    res = {}
+    try:
+        mrio_dir = os.path.join(work, 'pickled_mrio', '')
+        bg_dir = os.path.join(work, 'bg', '')
+        os.makedirs(mrio_dir)
+        write_synthetic(synth, mrio_dir)
+
+        res['leontief'] = _time(lambda: LeontiefSolver(mrio['A']), repeat)
+        L = LeontiefSolver(mrio['A'])
+        y = mrio['Y'].sum(1).reshape((-1, 1))
+        res['process'] = _time(lambda: scale_columns(mrio['A'], L.solve(y)[:, 0]), repeat)
+
+        state = {}
+        def background():
+            state['bg'] = createBackground(mrio_dir, synth['cbs_data'], bg_dir, '2016', positions=synth['positions'])
+        res['createBackground'] = _time(background, repeat)
+        bg = state['bg']
+
+        res['calc_contrib'] = _time(lambda: calc_contrib(bg['B'], bg['L'], bg['Ystim'], bg['M']), repeat)
+        res['calc_hotspot'] = _time(lambda: calc_hotspot(bg['B'], bg['L'], bg['Ystim']), repeat)
+
+        # aggregation of the hotspot result of the total stimulus to the levels of main2025.py
+        multiindex = pd.MultiIndex.from_product([synth['reg_labels']['ISO3'], synth['sec_labels']['SecTxtCode']])
+        char_labels = [str(nm) + ' (' + str(u) + ')' for (nm, u) in zip(bg['label']['characterization']['Name'], bg['label']['characterization']['Unit'])]
+        df_h = df_fromarray(calc_hotspot(bg['B'], bg['L'], bg['Ystim'][:, :1]), char_labels, multiindex, char_labels)[0]
+        levels = {'aggsec': ['Scope', 'SAggDescription'], 'aggsec_aggreg': ['Scope', 'RegName', 'SAggDescription'],
+                  'aggreg': ['Scope', 'Region', 'RegName'], 'allsec': ['Scope', 'SecTxtCode', 'SecName']}
+        def aggregation():
+            labels = LabelTable(synth['reg_labels'], synth['sec_labels'], multiindex)
+            state['full'] = labels.attach(df_h, ['RegName', 'Region', 'SecName', 'SAggDescription', 'Scope_hotspot'], rename={'Scope_hotspot': 'Scope'})
+            state['cube'] = AggregationCube(labels, df_h, char_labels, levels, rename={'Scope_hotspot': 'Scope'})
+        res['aggregation'] = _time(aggregation, repeat)
+
+        def output():
+            writer = open_report(os.path.join(work, 'HotspotAnalysis'), fmt)
+            writer.write(state['full'], 'full')
+            for name in levels:
+                writer.write(state['cube'][name], name)
+            writer.close()
+        res['output'] = _time(output, repeat)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return res
+
+# Machine and library versions stored with a baseline
+def bench_meta():
+    meta = {'host': platform.node(), 'machine': platform.machine(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'cpu_count': os.cpu_count()}
+    meta.update({k: os.environ[k] for k in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'] if k in os.environ})
+    return meta
+
+# Key of the timings of one configuration: size, dense/sparse A and report format,
+# e.g. '25x60 dense csv'; timings are only compared with the same configuration
+def bench_key(size, sparse, fmt):
+    return '%s %s %s' % (size, 'sparse' if sparse else 'dense', fmt)
+
+# Timings of a baseline file by bench_key. Files written before the key held the
+# configuration are keyed by size, with one sparse flag and the default format csv
+def baseline_results(stored):
+    results = {}
+    for (key, res) in stored.get('results', {}).items():
+        if ' ' not in key:
+            key = bench_key(key, stored.get('sparse', False), 'csv')
+        results[key] = res
+    return results
+
+# Stages slower than the baseline, as a DataFrame with the medians and their ratio
+#   results, baseline: {bench_key: {stage: {'median', ...}}}
+# Configurations without a baseline are left out
+def find_regressions(results, baseline, threshold=0.2, min_diff=0.05):
+    rows = []
+    for (size, res) in results.items():
+        for (stage, t) in res.items():
+            base = baseline.get(size, {}).get(stage)
+            if base is None:
+                continue
+            ratio = t['median'] / base['median'] if base['median'] > 0 else np.inf
+            regressed = ratio > 1 + threshold and t['median'] - base['median'] > min_diff
+            rows.append({'size': size, 'stage': stage, 'median': t['median'], 'baseline': base['median'], 'ratio': ratio, 'regression': regressed})
+    return pd.DataFrame(rows, columns=['size', 'stage', 'median', 'baseline', 'ratio', 'regression'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the footprint model on synthetic MRIOs')
+    parser.add_argument('--root', default=os.getcwd(), help='envr-footprint-healthcare2025 folder')
+    parser.add_argument('--sizes', nargs='+', default=['10x10', '25x60'], help='regions x sectors, e.g. 49x163')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sparse', action='store_true', help='A and R as sparse matrices')
+    parser.add_argument('--format', default='csv', help='report format of the output stage (see output2025.py)')
+    parser.add_argument('--baseline', default=None, help='baseline file, output/bench_baseline.json by default')
+    parser.add_argument('--update', action='store_true', help='store the timings as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slow-down that counts as a regression')
+    parser.add_argument('--min-diff', type=float, default=0.05, help='seconds of slow-down below which nothing is flagged')
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(args.root, 'scripts'))
+    baseline_file = args.baseline or os.path.join(args.root, 'output', 'bench_baseline.json')
+
+    results = {}
+    for size in args.sizes:
+        (nr, ns) = [int(k) for k in size.lower().split('x')]
+        tstart = time.time()
+        results[bench_key(size, args.sparse, args.format)] = run_size(nr, ns, args.repeat, args.seed, args.sparse, args.format)
+        print('Done %s in %5.2f s' % (size, time.time() - tstart))
+    table = pd.DataFrame({(size, stage): t for (size, res) in results.items() for (stage, t) in res.items()}).T
+    print(table[['median', 'min']].round(4))
+
+    if args.update or not os.path.exists(baseline_file):
+        stored = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file) as f:
+                stored = baseline_results(json.load(f))
+        stored.update(results)
+        if os.path.dirname(baseline_file) and not os.path.exists(os.path.dirname(baseline_file)):
+            os.makedirs(os.path.dirname(baseline_file))
+        with open(baseline_file, 'w') as f:
+            json.dump({'meta': bench_meta(), 'results': stored}, f, indent=1)
+        print('Baseline written to %s' % baseline_file)
+    else:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline.get('meta', {}).get('host') != platform.node():
+            print('Baseline was recorded on %s, timings may not be comparable' % baseline['meta'].get('host'))
+        base_results = baseline_results(baseline)
+        for key in results:
+            if key not in base_results:
+                print('No baseline for %s, store one with --update' % key)
+        reg = find_regressions(results, base_results, args.threshold, args.min_diff)
+        if len(reg):
+            print(reg.round(4).to_string(index=False))
+        if reg['regression'].any():
+            print('Regressions: %s' % ', '.join(reg[reg['regression']]['size'] + '/' + reg[reg['regression']]['stage']))
+            sys.exit(1)
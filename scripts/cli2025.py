@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks cli2025.py:
+
+    1. One command-line entry point for the steps of the model, so a step
+       can be run without the others
+    2. Import the heavy modules (pandas, functions2025, matplotlib, xlsxwriter)
+       only in the subcommands that need them, so questions to a stored
+       background are answered in well under a second
+
+Subcommands, from the envr-footprint-healthcare2025 folder:
+
+    python scripts/cli2025.py prep [--year 2016] [--jobs 2] [--force]    load, leontief, process and waste (pipeline2025.py)
+    python scripts/cli2025.py background [--year 2016]                   createBackground and the background store
+    python scripts/cli2025.py footprint --totals                         totals per impact and stimulus (Table 1)
+    python scripts/cli2025.py footprint --kind hotspot --by region        breakdown of one stimulus column
+    python scripts/cli2025.py footprint --tiers [--tol 1e-4]             footprint per production tier (spa2025.py)
+    python scripts/cli2025.py report                                     main2025.py on the stored background, without figures
+    python scripts/cli2025.py figures                                    Figure 1-3 from the data written by report
+
+footprint only opens the background store (numpy and the memory-mapped
+arrays it uses); the totals are M Ystim plus the direct emissions Hstim, as in
+Table 1 without the bottom-up rows (anaesthetic gases, pMDI, travel).
+"""
+
+import os
+import sys
+import json
+import argparse
+
+
+# Stages of pipeline2025.py run by prep; background runs the last stage (and stale ones before it)
+prep_stages = ['load', 'leontief', 'process', 'waste']
+
+
+##############################################
+# Subcommands
+##############################################
+
+def cmd_prep(args):
+    from pipeline2025 import run_pipeline
+    run_pipeline(args.root, args.year, {'sparse': args.sparse, 'precision': args.precision}, args.jobs, args.force, prep_stages)
+
+def cmd_background(args):
+    from pipeline2025 import run_pipeline
+    run_pipeline(args.root, args.year, {'sparse': args.sparse, 'precision': args.precision}, args.jobs, args.force, ['background'])
+
+# Impact labels 'Name (Unit)' of a background; stores written before char_labels was
+# added only have the label frames, which need pandas
+def _impacts(bg):
+    if 'char_labels' in bg:
+        return list(bg['char_labels'])
+    char = bg['label']['characterization']
+    return [str(n) + ' (' + str(u) + ')' for (n, u) in zip(char['Name'], char['Unit'])]
+
+# Totals per impact (rows) and stimulus column, M * Ystim + Hstim
+def footprint_totals(bg):
+    import numpy as np
+    tot = np.dot(np.asarray(bg['M'], dtype=np.float64), np.asarray(bg['Ystim'], dtype=np.float64))
+    tot = tot + np.asarray(bg['Hstim'], dtype=np.float64)
+    return {'impacts': _impacts(bg), 'stimulus': list(bg['excelname']), 'total': tot.tolist()}
+
+def _print_table(rows, row_labels, col_labels):
+    width = max(len(r) for r in row_labels)
+    print(' ' * width + ''.join('%18s' % c[:17] for c in col_labels))
+    for (name, row) in zip(row_labels, rows):
+        print(name.ljust(width) + ''.join('%18.6g' % v for v in row))
+
+def cmd_footprint(args):
+    from background2025 import load_background
+    bg = load_background(os.path.join(args.root, 'data', 'bg', ''), args.year)
+    if args.totals:
+        res = footprint_totals(bg)
+        if args.json:
+            print(json.dumps(res))
+        else:
+            _print_table(res['total'], res['impacts'], res['stimulus'])
+        return
+    if args.tiers:
+        cmd_tiers(bg, args)
+        return
+    from service2025 import FootprintModel
+    model = FootprintModel(bg)
+    y = model.demand({'stimulus': {args.stimulus: 1.0}})
+    if args.kind == 'footprint':
+        res = model.footprint(y)
+    else:
+        res = model.summarise(model.breakdown(args.kind, y), args.by, args.top)
+    if args.json:
+        print(json.dumps(res))
+    elif args.kind == 'footprint':
+        _print_table([[v] for v in res['total']], res['impacts'], [args.stimulus])
+    elif args.by is not None:
+        _print_table(list(zip(*res['values'])), res[args.by], res['impacts'])
+    else:
+        for name in res['impacts']:
+            print('\n' + name)
+            for r in res['top'][name]:
+                print('  %-4s %-12s %14.6g %8.2f%%' % (r['ISO3'], r['SecTxtCode'], r['value'], 100 * (r['share'] or 0)))
+
+# Footprint of one stimulus column per production tier (B A^k y), the tail with M when stored
+def cmd_tiers(bg, args):
+    from spa2025 import calc_tiers
+    s = ['Tot', 'HC', 'Pharm', 'Appl'].index(args.stimulus)
+    res = calc_tiers(bg['A'], bg['B'], bg['Ystim'][:, s], args.tol, args.max_tier, bg.get('M'))
+    rows = [list(t[:, 0]) for t in res['tiers']] + [list(res['tail'][:, 0]), list(res['total'][:, 0])]
+    names = ['tier %d' % k for k in range(len(res['tiers']))] + ['tail', 'total']
+    if args.json:
+        print(json.dumps({'impacts': _impacts(bg), 'tiers': names, 'values': rows, 'converged': res['converged']}))
+        return
+    _print_table(rows, names, _impacts(bg))
+    if not res['converged']:
+        print('Tail above %g after %d tiers' % (args.tol, args.max_tier))
+
+# main2025.py on the stored background (EXIO_LOAD_BACKGROUND), the figures are left to cmd_figures
+def cmd_report(args):
+    import runpy
+    from background2025 import background_path
+    if not os.path.exists(os.path.join(background_path(os.path.join(args.root, 'data', 'bg'), args.year), 'meta.pkl')):
+        sys.exit('No background for %s, run: python scripts/cli2025.py background --year %s' % (args.year, args.year))
+    os.environ['EXIO_YEAR'] = args.year
+    os.environ['EXIO_LOAD_BACKGROUND'] = '1'
+    os.environ['EXIO_FIGURES'] = '1' if args.figures else '0'
+    os.chdir(args.root)
+    runpy.run_path(os.path.join(args.root, 'scripts', 'main2025.py'), run_name='__main__')
+
+def cmd_figures(args):
+    from figures2025 import load_figure_data, plot_figures
+    output_dir = os.path.join(args.root, 'output')
+    path = os.path.join(output_dir, 'FigureData.pkl')
+    if not os.path.exists(path):
+        sys.exit('No figure data in %s, run: python scripts/cli2025.py report' % output_dir)
+    plot_figures(load_figure_data(path), os.path.join(output_dir, 'AllFigures.pdf'), output_dir)
+
+
+##############################################
+# Arguments
+##############################################
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Environmental footprint of the healthcare sector')
+    parser.add_argument('--root', default=os.getcwd(), help='envr-footprint-healthcare2025 folder')
+    parser.add_argument('--year', default=os.environ.get('EXIO_YEAR', '2016'))
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for (name, f, text) in [('prep', cmd_prep, 'load, Leontief, process and waste stages of pipeline2025.py'),
+                            ('background', cmd_background, 'createBackground, stored in data/bg/background<year>')]:
+        p = sub.add_parser(name, help=text)
+        p.add_argument('--jobs', type=int, default=2, help='number of stages run at the same time')
+        p.add_argument('--sparse', action='store_true', help='store A and R as sparse matrices')
+        p.add_argument('--precision', default='float64', choices=['float64', 'float32'])
+        p.add_argument('--force', action='store_true', help='rerun all stages')
+        p.set_defaults(func=f)
+
+    p = sub.add_parser('footprint', help='footprint of the stored background')
+    p.add_argument('--totals', action='store_true', help='totals per impact and stimulus column (Table 1)')
+    p.add_argument('--kind', default='footprint', choices=['footprint', 'contrib', 'hotspot'])
+    p.add_argument('--stimulus', default='Tot', choices=['Tot', 'HC', 'Pharm', 'Appl'])
+    p.add_argument('--by', default=None, choices=['region', 'sector'], help='totals per region or sector instead of the top positions')
+    p.add_argument('--top', type=int, default=20)
+    p.add_argument('--tiers', action='store_true', help='footprint per production tier of the stimulus column')
+    p.add_argument('--tol', type=float, default=1e-4, help='relative size of the tail at which --tiers stops')
+    p.add_argument('--max-tier', type=int, default=30)
+    p.add_argument('--json', action='store_true', help='print JSON (as service2025.py)')
+    p.set_defaults(func=cmd_footprint)
+
+    p = sub.add_parser('report', help='reports and tables of main2025.py on the stored background')
+    p.add_argument('--figures', action='store_true', help='also plot the figures')
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('figures', help='Figure 1-3 from output/FigureData.pkl')
+    p.set_defaults(func=cmd_figures)
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    args.root = os.path.abspath(args.root)
+    sys.path.append(os.path.join(args.root, 'scripts'))
+    args.func(args)
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks exioreader2025.py:
+
+    1. Read the Exiobase tab-separated text files (A.txt, Y.txt, satellite/F.txt, ...)
+       in a single pass, with several threads
+    2. Return the numerical block as a float array and the labels separately
+    3. Cache parsed Excel sheets (e.g. the waste extensions .xlsb) in a binary
+       columnar file, keyed by the content hash of the workbook
+    4. Fill the waste extension (h, r) from the sheets in one scatter per sheet
+    5. Build the characterisation matrix Q, which does not depend on the year,
+       and cache it in characterisation.pkl (stage 'characterisation' of pipeline2025.py)
+
+The files have n_header rows with column labels (region, sector/category), an
+optional row with the names of the index columns, and then one row per
+industry/extension starting with n_index label columns.
+The body of the file is split in blocks of whole lines. Every thread parses one
+block with the pandas C parser (which releases the GIL while tokenizing) and
+writes the numbers straight into its rows of the preallocated output array.
+"""
+
+import numpy as np
+import pandas as pd
+import io
+import mmap
+import os
+import pickle as pkl
+from concurrent.futures import ThreadPoolExecutor
+from hashing2025 import file_hash
+from profile2025 import traced
+
+
+##############################################
+# Reader for Exiobase text files
+##############################################
+
+# Split the bytes in [start, end) in n blocks that end on a line break
+def _line_blocks(buf, start, end, n):
+    bounds = [start]
+    step = max((end - start) // n, 1)
+    for k in range(1, n):
+        pos = buf.find(b'\n', max(start + k * step, bounds[-1]), end)
+        if pos == -1:
+            break
+        bounds.append(pos + 1)
+    bounds.append(end)
+    return [(bounds[k], bounds[k + 1]) for k in range(len(bounds) - 1) if bounds[k + 1] > bounds[k]]
+
+# Number of lines in a block, counting a last line without line break
+def _count_lines(buf, start, end):
+    nlines = buf[start:end].count(b'\n')
+    if end > start and buf[end - 1:end] != b'\n':
+        nlines += 1
+    return nlines
+
+# Read an Exiobase text file
+#   path: file to read
+#   n_index: number of label columns at the start of every row
+#   n_header: number of label rows at the top of the file
+# Returns (values, row_labels, col_labels):
+#   values: float array (rows x columns)
+#   row_labels: DataFrame with the n_index label columns
+#   col_labels: MultiIndex (or Index if n_header = 1) with the column labels
+@traced()
+def read_exio_txt(path, n_index=1, n_header=2, n_threads=None, dtype=np.float64):
+    if n_threads is None:
+        n_threads = min(os.cpu_count() or 1, 8)
+
+    f = open(path, 'rb')
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        # column labels
+        pos = 0
+        header = []
+        for k in range(n_header):
+            eol = buf.find(b'\n', pos)
+            line = buf[pos:eol].decode('utf-8').rstrip('\r')
+            header.append(line.split('\t')[n_index:])
+            pos = eol + 1
+        ncol = len(header[0])
+
+        # skip the row with the index names, if present (all numeric fields empty)
+        eol = buf.find(b'\n', pos)
+        line = buf[pos:eol].decode('utf-8').rstrip('\r').split('\t')
+        if all(x == '' for x in line[n_index:]):
+            pos = eol + 1
+
+        # blocks of lines and their position in the output array; line breaks at the
+        # end of the file are left out, pandas skips the blank lines they make
+        end = len(buf)
+        while end > pos and buf[end - 1:end] in (b'\n', b'\r'):
+            end -= 1
+        blocks = _line_blocks(buf, pos, end, n_threads)
+        with ThreadPoolExecutor(n_threads) as pool:
+            nlines = list(pool.map(lambda b: _count_lines(buf, b[0], b[1]), blocks))
+        offsets = np.concatenate(([0], np.cumsum(nlines)))
+
+        values = np.empty((offsets[-1], ncol), dtype=dtype)
+        labels = [None] * len(blocks)
+
+        def parse(k):
+            start, end = blocks[k]
+            dtypes = {j: str for j in range(n_index)}
+            dtypes.update({j: dtype for j in range(n_index, n_index + ncol)})
+            df = pd.read_csv(io.BytesIO(buf[start:end]), sep='\t', header=None, dtype=dtypes, engine='c', keep_default_na=False, na_values=[''])
+            if len(df) != offsets[k + 1] - offsets[k]:
+                raise ValueError('%s: %d rows parsed in block %d, %d lines counted (blank lines inside the file?)' % (path, len(df), k, offsets[k + 1] - offsets[k]))
+            values[offsets[k]:offsets[k + 1]] = df.iloc[:, n_index:].to_numpy(dtype)
+            labels[k] = df.iloc[:, :n_index]
+
+        with ThreadPoolExecutor(n_threads) as pool:
+            list(pool.map(parse, range(len(blocks))))
+    finally:
+        buf.close()
+        f.close()
+
+    row_labels = pd.concat(labels, ignore_index=True)
+    if n_header == 1:
+        col_labels = pd.Index(header[0])
+    else:
+        col_labels = pd.MultiIndex.from_arrays(header)
+    return values, row_labels, col_labels
+
+
+##############################################
+# Cached Excel sheets
+##############################################
+
+# Path of the cache file of a sheet of a workbook with content hash digest
+def _sheet_cache_path(cache_dir, sheet_name, digest):
+    return os.path.join(cache_dir, '%s.%s.npz' % (sheet_name, digest[:16]))
+
+# Read a sheet with labelled rows and columns, parsed once per version of the workbook
+#   index_col, header: label rows and columns, as in pd.read_excel
+#   digest: content hash of the workbook, computed if not given
+# The values are stored column by column (Fortran order) as float64 and the
+# labels as strings, in cache_dir/<sheet>.<hash>.npz
+@traced()
+def read_excel_cached(path, sheet_name, cache_dir, index_col, header, engine='pyxlsb', digest=None):
+    if digest is None:
+        digest = file_hash(path)
+    cache_path = _sheet_cache_path(cache_dir, sheet_name, digest)
+    if not os.path.exists(cache_path):
+        df = pd.read_excel(path, sheet_name=sheet_name, index_col=index_col, header=header, engine=engine)
+        _write_sheet_cache(cache_path, df)
+
+    data = np.load(cache_path)
+    index = pd.MultiIndex.from_arrays([data['row%d' % k] for k in range(int(data['nrow_levels']))])
+    columns = pd.MultiIndex.from_arrays([data['col%d' % k] for k in range(int(data['ncol_levels']))])
+    return pd.DataFrame(data['values'], index=index, columns=columns)
+
+def _write_sheet_cache(cache_path, df):
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    index = df.index if isinstance(df.index, pd.MultiIndex) else pd.MultiIndex.from_arrays([df.index])
+    columns = df.columns if isinstance(df.columns, pd.MultiIndex) else pd.MultiIndex.from_arrays([df.columns])
+    arrays = {'values': np.asfortranarray(df.to_numpy(np.float64)),
+              'nrow_levels': index.nlevels, 'ncol_levels': columns.nlevels}
+    for k in range(index.nlevels):
+        arrays['row%d' % k] = index.get_level_values(k).astype(str).to_numpy(str)
+    for k in range(columns.nlevels):
+        arrays['col%d' % k] = columns.get_level_values(k).astype(str).to_numpy(str)
+
+    # written under a temporary name, an interrupted run leaves no partial cache
+    tmp_path = cache_path + '.tmp'
+    f = open(tmp_path, 'wb')
+    np.savez(f, **arrays)
+    f.close()
+    os.replace(tmp_path, cache_path)
+
+
+##############################################
+# Waste extension
+##############################################
+
+# Scatter vals into row 0 of out at positions pos. Positions that receive more
+# than one value keep the last one, as the original loops did; pos < 0 is left out
+def scatter_last(out, pos, vals):
+    keep = pos >= 0
+    pos, vals = pos[keep], vals[keep]
+    _, last = np.unique(pos[::-1], return_index = True)
+    last = len(pos) - 1 - last
+    out[0, pos[last]] = vals[last]
+
+# Waste extension of final demand (h) and industries (r) in the Exiobase v3.7
+# classification, from the sheets of the SUT extensions workbook
+#   waste_final: waste_sup_FD plus waste_from_stock (48 regions x 6 final demand categories)
+#   waste_industry: waste_sup_act (48 regions x 164 industries)
+#   region, final, industry: label tables of Exiobase (49 regions, 7 categories, 163 industries)
+# A_MGWG (Manufacture of gas, i40.2.a) is not in Exiobase v3.7, it goes to A_GASD
+# (i40.2, position 109) and is kept over A_GASD; industries without a match are left out
+# Returns (h, r)
+def fill_waste(waste_final, waste_industry, region, final, industry):
+    nreg = region.shape[0]
+    nreg_waste = nreg - 1
+    nfin = final.shape[0]
+    nfin_waste = nfin - 1
+    nind = industry.shape[0]
+    nind_waste = nind + 1
+
+    #position of regions
+    print('concordance of regions')
+    reg_waste = np.array(waste_final.columns.get_level_values(0)[::nfin_waste][:nreg_waste])
+    reg_waste_alt = np.array(waste_industry.columns.get_level_values(0)[::nind_waste][:nreg_waste])
+    reg_pos = pd.Index(region.index).get_indexer(reg_waste)
+    print(list(reg_waste))
+    for i in np.where(reg_waste != reg_waste_alt)[0]:
+        print(i, reg_waste[i], reg_waste_alt[i])
+    if (reg_pos < 0).any():
+        raise KeyError('Regions not in Exiobase: %s' % list(reg_waste[reg_pos < 0]))
+
+    #position of industries
+    print('concordance of industries')
+    ind_waste = np.array(waste_industry.columns.get_level_values(3)[:nind_waste])
+    ind_pos = pd.Index(industry.index).get_indexer(ind_waste)
+    ind_pos[ind_waste == 'A_MGWG'] = 109
+    for i in np.where(ind_pos < 0)[0]:
+        print(i, ind_waste[i])
+
+    # final demand, one scatter of the column sums
+    h = np.zeros((1, nreg * nfin))
+    pos = (reg_pos[:, None] * nfin + np.arange(nfin_waste)[None, :]).ravel()
+    scatter_last(h, pos, waste_final.sum().values[:nreg_waste * nfin_waste])
+
+    # industry
+    r = np.zeros((1, nreg*nind))
+    pos = np.where(ind_pos[None, :] >= 0, reg_pos[:, None] * nind + ind_pos[None, :], -1).ravel()
+    scatter_last(r, pos, waste_industry.sum().values[:nreg_waste * nind_waste])
+    return h, r
+
+
+##############################################
+# Characterisation factors
+##############################################
+
+# Characterisation matrix Q (6 impacts x n_ext extensions) and its labels from the
+# adapted DESIRE workbook (characterisation_DESIRE_version3.4_adapted.xlsx)
+#   n_ext: number of extensions in satellite/unit.txt of the IOT
+# Returns (Q, label_char)
+def build_characterisation(path, n_ext):
+    Q_factorinputs = pd.read_excel(path, sheet_name = 'Q_factorinputs', index_col=[0,1], header=[0,1])
+
+    Q_emissions = pd.read_excel(path, sheet_name = 'Q_emissions', index_col=[0,1,2,3], header=[0,1])
+
+    Q_resources = pd.read_excel(path, sheet_name = 'Q_resources', index_col=[0,1], header=[0,1])
+
+    Q_materials = pd.read_excel(path, sheet_name = 'Q_materials', index_col=[0,1], header=[0,1])
+
+    # initial step that should be added to each
+    # extension position to be in the right place:
+    step_factorinputs = 0
+    step_emissions = 23
+    step_resources = 446
+    step_materials = 466
+
+    # build conversion factor matrix with selected
+    # six themes and truncate extensions to only
+    # those that matter
+    # 6 themes - GWP100, Mat extr, Water use, LU, VA, Employment
+
+    n_char = 6  
+    Q = np.zeros((n_char, n_ext))
+    Q_name = []
+    Q_unit = []
+
+    #GWP 100
+    pos_gwp = 5  # position for impcat in characterisation table
+    vtmp = np.array(Q_emissions.iloc[pos_gwp])  # select CFs for relevant impcat
+    vpos = np.where(vtmp)[0]  # get indices number for which CF != 0
+    Q[0, vpos + step_emissions]= vtmp[vpos]  # fill in CF for index in empty 6x1113 array
+    Q_name.append(Q_emissions.index[pos_gwp][1])  # collect name of impact
+    Q_unit.append(Q_emissions.index[pos_gwp][3])  # collect unit of impact
+
+    # Abiotic material extraction
+    pos_mat = 4  # position domestic extraction
+    vtmp = np.array(Q_materials.iloc[pos_mat])
+    vpos = np.where(vtmp)[0] #all positions v != 0
+    Q[1,vpos + step_materials]= vtmp[vpos]
+    Q_name.append(Q_materials.index[pos_mat][0])
+    Q_unit.append(Q_materials.index[pos_mat][1])
+
+    #Water use
+    pos_water = 12
+    vtmp = np.array(Q_materials.iloc[pos_water])
+    vpos = np.where(vtmp)[0]
+    Q[2,vpos + step_materials]= vtmp[vpos]
+    Q_name.append(Q_materials.index[pos_water][0])
+    Q_unit.append(Q_materials.index[pos_water][1])
+
+    #Land use
+    pos_land = 0
+    vtmp = np.array(Q_resources.iloc[pos_land])
+    vpos = np.where(vtmp)[0]
+    Q[3,vpos + step_resources]= vtmp[vpos]
+    Q_name.append(Q_resources.index[pos_land][0])
+    Q_unit.append(Q_resources.index[pos_land][1])
+
+    #Added value
+    pos_gva = 0
+    vtmp = np.array(Q_factorinputs.iloc[pos_gva])
+    vpos = np.where(vtmp)[0]
+    Q[4,vpos + step_factorinputs]= vtmp[vpos]
+    Q_name.append(Q_factorinputs.index[pos_gva][0])
+    Q_unit.append(Q_factorinputs.index[pos_gva][1])
+
+    #Employment - eventually not used in the calculation
+    pos_emp = 1
+    vtmp = np.array(Q_factorinputs.iloc[pos_emp])
+    vpos = np.where(vtmp)[0]
+    Q[5,vpos + step_factorinputs]= vtmp[vpos]
+    Q_name.append(Q_factorinputs.index[pos_emp][0])
+    Q_unit.append(Q_factorinputs.index[pos_emp][1])
+
+    Q_data = []
+    for k in range(n_char):
+        Q_data.append([Q_name[k],Q_unit[k]]) 
+
+    label_char = pd.DataFrame(index = list(range(n_char)), columns = ['Name', 'Unit'], data = Q_data)
+    return Q, label_char
+
+# Q and its labels from a cache written by save_characterisation, None when the
+# cache is missing, was written for another workbook or number of extensions
+# (key), or cannot be read (e.g. a partial file of an interrupted run)
+def load_characterisation(cache_path, key):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        pkl_in = open(cache_path, "rb")
+        try:
+            char = pkl.load(pkl_in)
+        finally:
+            pkl_in.close()
+        if char['key'] != key:
+            return None
+        return char['Q'], char['label_char']
+    except (EOFError, pkl.UnpicklingError, KeyError, TypeError, ValueError, AttributeError):
+        print('Characterisation cache ' + cache_path + ' cannot be read, it is rebuilt\n')
+        return None
+
+# Write the cache under a temporary name first, so readers never see a partial file
+def save_characterisation(cache_path, key, Q, label_char):
+    tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    pkl_out = open(tmp_path, "wb")
+    pkl.dump({'key': key, 'Q': Q, 'label_char': label_char}, pkl_out)
+    pkl_out.close()
+    os.replace(tmp_path, cache_path)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks figures2025.py:
+
+    1. Store the data of Figure 1, 2 and 3 (section 7F of main2025.py), so
+       the figures can be drawn again without the footprint calculation
+    2. Plot the figures as PNG files and one PDF
+
+matplotlib is only imported when the figures are drawn (cli2025.py figures or
+section 7F of main2025.py), the reports do not need it.
+"""
+
+import os
+import pickle as pkl
+
+
+# Figures and their file names, in the order of the manuscript
+figure_names = ['fig_1', 'fig_2', 'fig_3']
+
+
+# Write the frames of the figures ({'fig_1': DataFrame, ...}, impacts as columns)
+def save_figure_data(figs, path):
+    pkl_out = open(path, "wb")
+    pkl.dump(figs, pkl_out)
+    pkl_out.close()
+
+def load_figure_data(path):
+    pkl_in = open(path, "rb")
+    figs = pkl.load(pkl_in)
+    pkl_in.close()
+    return figs
+
+# Stacked bars of the share of every group in each impact, fig_<n>.png in png_dir
+# and all figures in one PDF (figures in manuscript are composed in MS Excel)
+def plot_figures(figs, pdf_path='AllFigures.pdf', png_dir=''):
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with PdfPages(pdf_path) as pdf:
+        for name in figure_names:
+            df = figs[name].copy()
+            for col in df.columns:
+                df[col] = 100 * df[col]/df[col].sum()
+            ax = df.T.plot(kind='bar', stacked=True, colormap='tab10', figsize=(10, 6))
+            plt.legend(bbox_to_anchor=(1.05, 1.0), loc='upper left')
+            plt.xlabel("Impact category")
+            plt.ylabel("Share of footprint")
+            plt.tight_layout()
+            png_name = os.path.join(png_dir, name + '.png')
+            plt.savefig(png_name)
+            pdf.savefig(ax.get_figure())
+            plt.close()  # Close the figure to avoid popups and memory issues
+            print(png_name)
+    print(f"All figures saved to {pdf_path}")
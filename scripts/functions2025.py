@@ -16,13 +16,19 @@ Tasks functions.py:
 
 import pandas as pd
 import numpy as np
-import numpy.matlib
 import os
 import time
 import pickle as pkl
-import requests
 np.set_printoptions(precision=2)
 import sys
+import scipy.sparse as sp
+from leontief2025 import LeontiefSolver, leontief_solve, calc_multipliers, update_leontief, calc_xinv, scale_columns
+from background2025 import Background, save_background, load_background
+from scenarios2025 import ScenarioIndex, scatter_B, scatter_Ystim, scatter_A, calc_scenarios
+from output2025 import open_report, output_formats
+from labels2025 import LabelTable, AggregationCube
+from profile2025 import span, traced, step, end_step
+from stimulus2025 import read_country_data, country_frame, build_stimulus, region_totals, region_levels, default_positions
 
 
 ##############################################
@@ -31,6 +37,7 @@ import sys
 #   conversion supply > basic price from sheet
 ##############################################
 # snippet from https://www.cbs.nl/nl-nl/onze-diensten/open-data/open-data-v4/snelstartgids-odata-v4
+# (needs import requests)
 #def get_odata(target_url):
 #    data = pd.DataFrame()
 #    while target_url:
@@ -143,9 +150,14 @@ def get_val_GWP_health(cbs_data):
 ##############################################
 #Create baseline object, dictionary containing
 #   
-#
+#   precision: 'float64' or 'float32', the latter stores A, Y, B, M and Ystim
+#   in single precision (see also calc_precision_error)
+#   country_data: expenditure and direct emissions of several regions (see
+#   read_country_data), their stimulus is stored as Ystim_reg, Hstim_reg, Vstim_reg
+#   positions: region and products of the stimulus, default_positions of stimulus2025.py
 ##############################################
-def createBackground(mrio_dir, cbs_data, bg_dir, year):
+@traced()
+def createBackground(mrio_dir, cbs_data, bg_dir, year, precision = 'float64', country_data = None, positions = None):
     tstart = time.time()
 
     # Load waste
@@ -154,7 +166,7 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
     waste = pkl.load(pkl_in)
     pkl_in.close()
 
-    # Load Leontief inverse
+    # Load factorised Leontief system (LeontiefSolver, see leontief2025.py)
     mrio_str = 'leontief'+ year +'.pkl'  
     pkl_in = open(mrio_dir + mrio_str,"rb")
     L = pkl.load(pkl_in)
@@ -178,10 +190,11 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
     H = mrio['H']
     Q = mrio['Q']
     A = mrio['A']
+    L.attach(A)  # A is not pickled with the solver, a float32 solver refines against it
     
-    # convert extensions to footprints
-    xinv = (x != 0) / (x + (x ==0))
-    R = np.dot(Q, R)
+    # convert extensions to footprints (R can be sparse, the product is dense)
+    xinv = calc_xinv(x[:,0])
+    R = Q @ R
     H = np.dot(Q, H)
 
     # add waste
@@ -191,8 +204,8 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
     characterization_waste = pd.DataFrame(data = [['Waste generation', 'tonne']], columns = ['Name', 'Unit'], index = [6])
     label['characterization'] = pd.concat([label['characterization'], characterization_waste], ignore_index=True)
 
-    # generate coefficients
-    B = np.dot(R, np.diag(xinv[:,0]))
+    # generate coefficients, B = R*diag(xinv) scaled in place (R is a new array after Q @ R)
+    B = scale_columns(R, xinv, out = R)
 
     # determine aggregation of regions
     coderagg = ['NL', 'WE', 'WA', 'WL', 'WM', 'WF']
@@ -222,66 +235,22 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
     label['characterization']['Name'].iloc[4] = 'Value added'
 
     ##################################################
-    # Determine the stimulus
-
-    # Extract NL, GWP and healthcare
-    k_NL = 20
-    k_GWP = 0 
-    k_health = 137
-    val_GWP_health = float(cbs_data.iloc[2,0]) * 1e6  # kt to kg
-
-    k_pharm = 62
-    val_pharm_pp = float(cbs_data.iloc[0,1])  # purchaser price
-    val_pharm_conv = float(cbs_data.iloc[1,1])  # could round up for same result as in paper 
-    val_pharm_bp = val_pharm_conv * val_pharm_pp
-
-    # Source conversion to basic price: 
-    k_appl = 89
-    val_appl_pp = float(cbs_data.iloc[0,2])  
-    val_appl_conv = float(cbs_data.iloc[1,2])  
-    val_appl_bp = val_appl_pp * val_appl_conv
-
-    # vector to allocate across imports of pharmaceuticals
-    vy = Y[:, k_NL * ny: (k_NL + 1)* ny].sum(1).reshape((nr,ns))
-    vtmp = vy[:,k_pharm]
-    vtmp = vtmp / vtmp.sum()
-    vy = np.zeros((nr, ns))
-    vy[:,k_pharm] = vtmp
-    valloc_pharm = vy.reshape((nr*ns, ))
-
-    # vector to allocate across imports of appliances
-    vy = Y[:, k_NL * ny: (k_NL + 1)* ny].sum(1).reshape((nr,ns))
-    vtmp = vy[:,k_appl]
-    vtmp = vtmp / vtmp.sum()
-    vy = np.zeros((nr, ns))
-    vy[:,k_appl] = vtmp
-    valloc_appl = vy.reshape((nr*ns, ))
-
-    vy = Y[:, k_NL * ny: (k_NL + 1)* ny].sum(1).reshape((nr,ns))
-    vtmp = Y[k_NL*ns + k_health,:] 
+    # Determine the stimulus (see stimulus2025.py)
 
+    # Dutch healthcare, pharmaceuticals and appliances: region NL among 49 countries
     # Healthcare service expenditure, ignore conversoin to basic price (0.38% difference)
-    val_HCserv = float(cbs_data.iloc[0, 0])
-    
-    # Find scale factor to scale healthcare sector in Z column
-    scale_factor = val_HCserv / x[k_NL*ns + k_health].sum()
-
-    # filling in
-    Ystim = np.zeros((nr*ns,3))
-    Hstim = np.zeros((nq,3))
-    Vstim = np.zeros((nv,3))
-
-    Ystim[:,0] = Z[:,k_NL*ns + k_health] * scale_factor
-    Ystim[:,1] = val_pharm_bp * valloc_pharm
-    Ystim[:,2] = val_appl_bp * valloc_appl
-    Hstim[:,0] = B[:, k_NL*ns + k_health] * (x[k_NL*ns + k_health] * scale_factor) 
-    Hstim[k_GWP,0] = val_GWP_health 
-    Vstim[:,0] = V[:, k_NL*ns + k_health] * scale_factor
-
-    # agg grand total to first col in stimulus
-    Ystim = np.concatenate((Ystim.sum(1).reshape((nr*ns,1)), Ystim),1)
-    Hstim = np.concatenate((Hstim.sum(1).reshape((nq,1)), Hstim),1)
-    Vstim = np.concatenate((Vstim.sum(1).reshape((nv,1)), Vstim),1)
+    positions = dict(default_positions, **(positions or {}))
+    k_prod = {'k_health': positions['health'], 'k_pharm': positions['pharm'], 'k_appl': positions['appl']}
+    k_NL = positions['region']
+    nl_data = country_frame(cbs_data, label['region']['ISO3'].iloc[k_NL])
+    Ystim, Hstim, Vstim, _ = build_stimulus(Z, x, B, V, Y, nl_data, label['region'], ns, ny, **k_prod)
+
+    # same stimulus for every region in country_data, four columns per region
+    if country_data is not None:
+        Ystim_reg, Hstim_reg, Vstim_reg, stim_reg = build_stimulus(Z, x, B, V, Y, country_data, label['region'], ns, ny, **k_prod)
+
+    # Z is only needed for the healthcare column, release it before the multipliers are computed
+    del Z, mrio
 
     # converting unit from kgCO2 to ktCO2
     label['characterization']['Unit'][0] = 'ktCO2eq'
@@ -294,6 +263,23 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
     H[-1,:] = H[-1,:] * 1e-3
     B[-1,:] = B[-1,:] * 1e-3
 
+    if country_data is not None:
+        Hstim_reg[0,:] = Hstim_reg[0,:] * 1e-6
+        Hstim_reg[-1,:] = Hstim_reg[-1,:] * 1e-3
+
+    # multipliers M = B * L (nq x n), computed once for all consumers of the background
+    M = calc_multipliers(B, L)
+
+    if precision != 'float64':
+        A = A.astype(precision)
+        Y = Y.astype(precision)
+        B = B.astype(precision)
+        M = M.astype(precision)
+        Ystim = Ystim.astype(precision)
+        if country_data is not None:
+            Ystim_reg = Ystim_reg.astype(precision)
+        L.attach(A)  # the A of the background, as after load_background
+
     ##############################################
     # Save relevant objects as background
 
@@ -302,12 +288,16 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
     excelname = ['healthcare_total', 'healthcare_only', 'pharmaceuticals', 'appliances']
     exceltext = ['Healthcare combined with household purchases of pharmaceuticals and medical appliances', 'Healthcare sector only', 'Household purchases of pharmaceuticals', 'Household purchases of medical appliances']
 
-    bg = {'label': label, 'ragg': ragg, 'L': L, 'A': A,  'B': B, 'H': H, 'Y': Y, 'Q':Q, 'Ystim': Ystim, 'Vstim': Vstim, 'Hstim': Hstim, 'sheetname': sheetname, 'sheettext': sheettext, 'excelname': excelname, 'exceltext': exceltext}
+    # impact labels 'Name (Unit)' as a plain list, read without pandas by cli2025.py
+    char_labels = [str(nm) + ' (' + str(u) + ')' for (nm, u) in zip(label['characterization']['Name'], label['characterization']['Unit'])]
 
-    pkl_str = 'gddz_background_information_' + year + '.pkl'  
-    pkl_out = open(bg_dir + pkl_str,"wb")
-    pkl.dump(bg, pkl_out)
-    pkl_out.close()
+    bg = {'label': label, 'ragg': ragg, 'L': L, 'A': A,  'B': B, 'M': M, 'H': H, 'Y': Y, 'Q':Q, 'Ystim': Ystim, 'Vstim': Vstim, 'Hstim': Hstim, 'sheetname': sheetname, 'sheettext': sheettext, 'excelname': excelname, 'exceltext': exceltext, 'char_labels': char_labels}
+
+    if country_data is not None:
+        bg.update({'Ystim_reg': Ystim_reg, 'Hstim_reg': Hstim_reg, 'Vstim_reg': Vstim_reg, 'stim_reg': stim_reg})
+
+    # raw arrays plus metadata, reopened lazily with load_background(bg_dir, year)
+    save_background(bg, bg_dir, year)
 
     tend = time.time()
     print('Prepared background in %5.2f s\n'% (tend - tstart))
@@ -322,24 +312,66 @@ def createBackground(mrio_dir, cbs_data, bg_dir, year):
 ##############################################
 
 # Hotspot analysis / indirect footprint broken down from production perspective
+# L is either the explicit Leontief inverse or a LeontiefSolver
+@traced()
 def calc_hotspot(B, L, Y):
-    R = []
-    for k in range(Y.shape[1]):
-        LxY = np.diag(np.dot(L,Y[:,k]))
-        R_ = np.dot(B, LxY) 
-        R.append(R_.T)
+    R = calc_hotspot_batch(B, L, Y)
+    return list(R)
+
+# Batched hotspot kernel: result k is diag(L * Y[:,k]) * B', without forming the diagonal
+# Yields (k0, k1, R_) with R_ of shape (k1 - k0, n, nq), one solve per chunk of columns of Y
+def iter_hotspot(B, L, Y, chunk = 256):
+    BT = np.asarray(B).T
+    for k0 in range(0, Y.shape[1], chunk):
+        k1 = min(k0 + chunk, Y.shape[1])
+        LxY = leontief_solve(L, Y[:, k0:k1]).astype(BT.dtype, copy = False)
+        R_ = LxY.T[:, :, None] * BT[None, :, :]
+        yield k0, k1, R_
+
+# Hotspot results for all columns of Y in one array of shape (n_stim, n, nq)
+@traced()
+def calc_hotspot_batch(B, L, Y, chunk = 256):
+    R = np.empty((Y.shape[1], B.shape[1], B.shape[0]), dtype = B.dtype)
+    for k0, k1, R_ in iter_hotspot(B, L, Y, chunk):
+        R[k0:k1] = R_
     return R
 
 # Contribution analysis /indirect footprint broken down from consumption perspective
-def calc_contrib(B, L, Y):
+# L is either the explicit Leontief inverse or a LeontiefSolver
+# M are the multipliers B * L (bg['M']), calculated from B and L if not given
+@traced()
+def calc_contrib(B, L, Y, M = None):
+    if M is None:
+        M = calc_multipliers(B, L)
     R = []
     for k in range(Y.shape[1]):
-        BxL = np.dot(B, L)
-        R_ = np.dot(BxL, np.diag(Y[:,k]))
+        R_ = M * Y[:,k]
         R.append(R_.T)        
     return R
 
+# Contribution results for all columns of Y in one array of shape (n_stim, n, nq),
+# e.g. for the stimulus of all regions (bg['Ystim_reg']) in one pass over the multipliers
+@traced()
+def calc_contrib_batch(M, Y):
+    M = np.asarray(M)
+    return np.asarray(Y, dtype = M.dtype).T[:, :, None] * M.T[None, :, :]
+
+# Relative error of the indirect footprint totals (as in Table 1) when computed in
+# lower precision, against float64; rows are impact categories, columns stimulus vectors
+def calc_precision_error(bg, dtype = np.float32):
+    A = bg['A']
+    B = np.asarray(bg['B'], dtype = np.float64)
+    Y = np.asarray(bg['Ystim'], dtype = np.float64)
+    tot = np.dot(LeontiefSolver(A, sparse = False).multipliers(B), Y)
+    L_ = LeontiefSolver(A, sparse = False, dtype = dtype)
+    tot_ = np.dot(L_.multipliers(B.astype(dtype)).astype(dtype), Y.astype(dtype))
+    err = np.abs(tot_ - tot) / np.where(tot != 0, np.abs(tot), 1)
+    err = pd.DataFrame(err, index = bg['label']['characterization']['Name'], columns = bg['excelname'])
+    print('Maximum relative error of the totals in %s: %.2e\n' % (np.dtype(dtype).name, err.values.max()))
+    return err
+
 # Make dataframe from the array results from calc_contrib() and calc_hotspot()
+@traced()
 def df_fromarray(arrs_hotspot, char_labels, multiindex, cols_impcat):
     l_df = []
     for i in range(len(arrs_hotspot)):
@@ -356,33 +388,43 @@ def df_fromarray(arrs_hotspot, char_labels, multiindex, cols_impcat):
 ##############################################
 
 # new B
+# args: (impact label, region, sector, value), applied in one scatter on a copy of bg['B']
 def adapt_B(bg, multiindex, charlabels, *args):
-    B = pd.DataFrame(bg['B'], columns = multiindex, index = charlabels)
-    for x in args:
-        B.loc[x[0], (x[1],x[2])] = x[3]
-    B = B.to_numpy()
+    B = scatter_B(bg['B'], ScenarioIndex(multiindex, charlabels), args)
     return B
 
 # new Ystim
+# args: (region, sector, column 'HC'/'Pharm'/'Appl', value), the total column is recomputed
 def adapt_Ystim(bg, multiindex, *args):
-    Y = pd.DataFrame(bg['Ystim'], columns = ['Tot','HC','Pharm','Appl'], index = multiindex)
-    for x in args:
-        Y.loc[(x[0], x[1]),x[2]] = x[3]
-    Y['Tot'] = Y['HC'] +Y['Pharm'] +Y['Appl']
-    Y = Y.to_numpy()     # terug naar numpy array
+    Y = scatter_Ystim(bg['Ystim'], ScenarioIndex(multiindex, []), args)
     return Y
 
 # new A
+# args: (region, sector, region, sector, value)
 def adapt_A(bg, multiindex, *args):
-    A = pd.DataFrame(bg['A'], columns = multiindex, index = multiindex)
-    for x in args:
-        A.loc[(x[0], x[1]), (x[2],x[3])] = x[4]
-    A = A.to_numpy()     # terug naar numpy array
+    A = scatter_A(bg['A'], ScenarioIndex(multiindex, []), args)
     return A
 
-# new L
+# new L for a few changed coefficients of A, same arguments as adapt_A
+# Low-rank update of bg['L'] instead of a new factorisation; the multipliers of the
+# scenario follow from L.multipliers(bg['B'], bg['M'])
+def adapt_L(bg, multiindex, *args):
+    n = len(multiindex)
+    idx = ScenarioIndex(multiindex, [])
+    rows = idx.sector_pos([x[0] for x in args], [x[1] for x in args])
+    cols = idx.sector_pos([x[2] for x in args], [x[3] for x in args])
+    # last edit of a coefficient wins, as in adapt_A (csr_matrix would add duplicates)
+    last = dict(zip(zip(rows, cols), [x[4] for x in args]))
+    rows = [i for (i, j) in last]
+    cols = [j for (i, j) in last]
+    vals = [v - bg['A'][i, j] for ((i, j), v) in last.items()]
+    dA = sp.csr_matrix((vals, (rows, cols)), shape = (n, n))
+    L = update_leontief(bg['L'], bg['A'], dA)
+    return L
+
+# new L, factorised instead of inverted (use like bg['L'] in calc_contrib/calc_hotspot)
 def calcnew_L(bg):
-    L = np.linalg.inv(np.eye(163*49) - bg['A'])  
+    L = LeontiefSolver(bg['A'])
     return L
 
 
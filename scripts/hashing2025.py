@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks hashing2025.py:
+
+    1. Content hash of a file, the key of the cached Excel sheets and of the
+       characterisation factors (exioreader2025.py) and of the stage
+       fingerprints (pipeline2025.py)
+
+Only the standard library is imported, so the readers and the pipeline runner
+can both use it without depending on each other.
+"""
+
+import hashlib
+
+
+# Content hash of a file (sha256, read in blocks)
+def file_hash(path, blocksize=2**24):
+    h = hashlib.sha256()
+    f = open(path, 'rb')
+    block = f.read(blocksize)
+    while block:
+        h.update(block)
+        block = f.read(blocksize)
+    f.close()
+    return h.hexdigest()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks labels2025.py:
+
+    1. Code the region and sector labels (RegName, Region, SecName,
+       SAggDescription, Scope, Scope_hotspot, ...) once, as integer codes
+       aligned with the (region, sector) positions of the MRIO
+    2. Attach labels to result frames by position, instead of merging on the
+       ISO3 and SecTxtCode strings
+    3. Aggregate result frames to all reporting levels (aggsec, allsec,
+       aggsec_aggreg, ...) with sparse concordance matrices, in one product
+
+Result frames of calc_contrib/calc_hotspot start with one row per position in
+the order of multiindex; rows appended after these (direct emissions, bottom-up
+data) are looked up by their ISO3 and SecTxtCode, with NaN for codes that are
+not in the classification (as the left merge did).
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from profile2025 import traced
+
+
+##############################################
+# Label table
+##############################################
+
+class LabelTable:
+
+    #   reg_labels: DataFrame with 'ISO3' and the region labels (RegName, Region)
+    #   sec_labels: DataFrame with 'SecTxtCode' and the sector labels (from classifications2025.xlsx)
+    #   multiindex: (ISO3, SecTxtCode) of every position
+    def __init__(self, reg_labels, sec_labels, multiindex):
+        self.reg = reg_labels.drop_duplicates('ISO3').reset_index(drop=True)
+        self.sec = sec_labels.drop_duplicates('SecTxtCode').reset_index(drop=True)
+        self.reg_index = pd.Index(self.reg['ISO3'])
+        self.sec_index = pd.Index(self.sec['SecTxtCode'])
+
+        # row of the region and sector tables for every position
+        self.reg_pos = self.reg_index.get_indexer(multiindex.get_level_values(0))
+        self.sec_pos = self.sec_index.get_indexer(multiindex.get_level_values(1))
+
+        # every label column as (categories, code per row of its table), the
+        # categories are sorted so that codes sort like the labels (as in groupby)
+        self.columns = {}
+        for table in [self.reg, self.sec]:
+            for col in table.columns:
+                try:
+                    codes, categories = pd.factorize(table[col], sort=True)
+                except TypeError:
+                    codes, categories = pd.factorize(table[col])
+                self.columns[col] = (table is self.reg, np.asarray(categories, dtype=object), codes)
+
+    def __len__(self):
+        return len(self.reg_pos)
+
+    # Integer code of column col for rows given by their region and sector table rows (-1 = missing)
+    def _codes(self, col, reg_pos, sec_pos):
+        is_reg, categories, codes = self.columns[col]
+        pos = reg_pos if is_reg else sec_pos
+        return np.where(pos >= 0, codes[pos], -1)
+
+    # Rows of the region and sector tables for the rows of a result frame: the
+    # first rows are the positions, the rows after these are looked up by code
+    def row_pos(self, df):
+        n = min(len(self), len(df))
+        reg_pos = np.concatenate((self.reg_pos[:n], self.reg_index.get_indexer(df['ISO3'].iloc[n:])))
+        sec_pos = np.concatenate((self.sec_pos[:n], self.sec_index.get_indexer(df['SecTxtCode'].iloc[n:])))
+        return reg_pos, sec_pos
+
+    # Concordance matrix of a label column: categories x positions, 1 where a position has the label
+    def concordance(self, col):
+        codes = self._codes(col, self.reg_pos, self.sec_pos)
+        valid = np.where(codes >= 0)[0]
+        return sp.csr_matrix((np.ones(len(valid)), (codes[valid], valid)), shape=(len(self.columns[col][1]), len(self)))
+
+    # Table of categorical labels, one row per position
+    def table(self, cols=None):
+        cols = list(self.columns) if cols is None else cols
+        out = {}
+        for col in cols:
+            categories = self.columns[col][1]
+            out[col] = pd.Categorical.from_codes(self._codes(col, self.reg_pos, self.sec_pos), categories)
+        return pd.DataFrame(out)
+
+    # Copy of df with the label columns cols added by position
+    #   rename: new names of label columns, e.g. {'Scope_hotspot': 'Scope'}
+    # The values are plain labels (not categorical), so the frames can be edited and grouped as before
+    @traced()
+    def attach(self, df, cols, rename=None):
+        reg_pos, sec_pos = self.row_pos(df)
+        df = df.copy()
+        rename = rename or {}
+        for col in cols:
+            categories = self.columns[col][1]
+            values = np.append(categories, np.nan)  # code -1 picks the last entry
+            df[rename.get(col, col)] = values[self._codes(col, reg_pos, sec_pos)]
+        return df
+
+
+##############################################
+# Aggregation cube
+##############################################
+
+# Sums of the value columns of a result frame at several levels of aggregation.
+# Every level is a concordance matrix (groups x rows) of the combinations of
+# its label columns that occur; the matrices of all levels are stacked and
+# applied to the values in one sparse product. Groups are sorted by their labels
+# and rows with a missing label are left out, as in DataFrame.groupby(keys).sum().
+class AggregationCube:
+
+    #   labels: LabelTable
+    #   df: result frame with ISO3 and SecTxtCode, rows aligned as in LabelTable.attach
+    #   value_cols: columns to aggregate
+    #   levels: {name: [label columns]} or {name: ([label columns], [label columns that must not be missing])}
+    #   rows: boolean mask of the rows to include, all when None
+    #   rename: names of label columns in levels, e.g. {'Scope_hotspot': 'Scope'}
+    @traced('AggregationCube')
+    def __init__(self, labels, df, value_cols, levels, rows=None, rename=None):
+        self.value_cols = list(value_cols)
+        reg_pos, sec_pos = labels.row_pos(df)
+        source = {}
+        for (col, new) in (rename or {}).items():
+            source[new] = col
+        nrow = len(df)
+        include = np.ones(nrow, dtype=bool) if rows is None else np.asarray(rows, dtype=bool)
+
+        blocks = []
+        self.index = {}
+        for (name, spec) in levels.items():
+            keys, require = (spec, []) if isinstance(spec, list) else spec
+            cols = [source.get(k, k) for k in keys]
+            C = np.stack([labels._codes(c, reg_pos, sec_pos) for c in cols], 1)
+            valid = include & (C >= 0).all(1)
+            for c in require:
+                valid &= labels._codes(source.get(c, c), reg_pos, sec_pos) >= 0
+            groups, inverse = np.unique(C[valid], axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            G = sp.csr_matrix((np.ones(len(inverse)), (inverse, np.where(valid)[0])), shape=(len(groups), nrow))
+            blocks.append(G)
+
+            arrays = [labels.columns[c][1][groups[:, k]] for (k, c) in enumerate(cols)]
+            if len(keys) == 1:
+                self.index[name] = pd.Index(arrays[0], name=keys[0])
+            else:
+                self.index[name] = pd.MultiIndex.from_arrays(arrays, names=keys)
+
+        values = df[self.value_cols].to_numpy(np.float64)
+        total = sp.vstack(blocks, format='csr') @ values
+        self.levels = {}
+        k0 = 0
+        for name in levels:
+            k1 = k0 + len(self.index[name])
+            self.levels[name] = pd.DataFrame(total[k0:k1], index=self.index[name], columns=self.value_cols)
+            k0 = k1
+
+    # Aggregated frame of a level (a copy, it can be modified)
+    def __getitem__(self, name):
+        return self.levels[name].copy()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks leontief2025.py:
+
+    1. Factorise the Leontief system (I - A) once
+    2. Serve footprint calculations by solves instead of the explicit inverse
+
+The Leontief inverse L = (I - A)^(-1) is never formed. Every product with L
+is computed from the LU factors of (I - A):
+    L * y    = solve(y)
+    L' * b   = solve_T(b)
+    B * L    = multipliers(B)
+    L[:, j]  = column(j)
+
+A can be dense or sparse (CSR/CSC). Sparse systems are solved with a sparse
+LU (method = 'direct') or with GMRES (method = 'iterative'). For a productive A
+(column sums below one) GMRES needs only a few dozen sparse products per
+column, while the sparse LU suffers from fill-in unless A is very sparse.
+
+With dtype = np.float32 the dense LU factors are stored in single precision,
+half the memory of the float64 factors. Solves start from the float32 solution
+and apply a few steps of iterative refinement, with the residual y - (I - A) x
+computed in float64. The solver keeps a reference to the A it was built from
+for the residuals, not a copy, and A is not pickled with the factors: after
+loading, attach(A) gives it the A of the background (createBackground and
+load_background of background2025.py do this).
+
+A scenario that changes a few coefficients of A (A' = A + dA) is served by
+UpdatedLeontiefSolver: with dA = U * V' of rank k (the smaller of the number
+of changed rows and changed columns), the Sherman-Morrison-Woodbury identity
+    (I - A - U V')^(-1) = L + L U (I - V' L U)^(-1) V' L
+only needs k solves with the baseline factorisation and a k x k system.
+
+Derived matrices such as Z = A * diag(x) and B = R * diag(1 / x) are built as
+column scalings (scale_columns), never as products with an n x n diagonal.
+"""
+
+import numpy as np
+import time
+import scipy.linalg as sla
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from profile2025 import traced
+
+
+# Share of non-zero entries in A below which the sparse path is used by default,
+# run report_sparsity() on the actual A to find the crossover point
+sparse_density = 0.001
+
+# Relative tolerance of the iterative sparse solver
+iterative_rtol = 1e-10
+
+# Relative size of the correction at which iterative refinement stops (float32 mode)
+refine_rtol = 1e-12
+
+# Rows of A upcast to float64 at a time when computing residuals (float32 mode)
+refine_chunk = 1024
+
+
+##############################################
+# Factorised Leontief system
+##############################################
+
+class LeontiefSolver:
+
+    # defaults, also for solvers pickled before these options existed
+    method = 'direct'
+    dtype = np.dtype(np.float64)
+    refine = 0
+    A = None
+
+    # dtype only applies to the dense path, the sparse paths work in float64
+    @traced('LeontiefSolver')
+    def __init__(self, A, sparse=None, method='direct', dtype=np.float64, refine=5):
+        if sparse is None:
+            sparse = calc_density(A) < sparse_density
+        self.n = A.shape[0]
+        self.sparse = sparse
+        self.method = method
+        self._cols = {}
+        self._splu = None
+        if sparse:
+            # (I - A) kept in CSC, the SuperLU factors are rebuilt after unpickling
+            self.IA = sp.csc_matrix(sp.identity(self.n, format='csc') - sp.csc_matrix(A))
+            if method == 'direct':
+                self._factorize()
+        else:
+            self.dtype = np.dtype(dtype)
+            IA = -np.array(A.toarray() if sp.issparse(A) else A, dtype=self.dtype)
+            IA[np.diag_indices(self.n)] += 1
+            self.lu, self.piv = sla.lu_factor(IA, overwrite_a=True, check_finite=False)
+            if self.dtype != np.float64:
+                # the caller's A (no copy) for the residuals of the refinement
+                self.A = A
+                self.refine = refine
+
+    # A for the residuals of the refinement (float32 mode), e.g. bg['A'] after loading;
+    # dense or sparse, in any precision
+    def attach(self, A):
+        self.A = A
+        return self
+
+    def _factorize(self):
+        self._splu = spla.splu(self.IA)
+
+    # GMRES, column by column
+    def _solve_iterative(self, b, trans):
+        IA = self.IA.T if trans == 'T' else self.IA
+        b = np.asarray(b, dtype=np.float64)
+        b2 = b.reshape((self.n, -1))
+        out = np.empty(b2.shape)
+        for k in range(b2.shape[1]):
+            out[:, k], info = spla.gmres(IA, b2[:, k], rtol=iterative_rtol, atol=0)
+            if info != 0:
+                raise RuntimeError('GMRES did not converge for column %d (info = %d)' % (k, info))
+        return out.reshape(b.shape)
+
+    # A * x (or A' * x) in float64, upcasting a block of rows of A at a time
+    def _matvec_A(self, x, trans):
+        out = np.zeros(x.shape)
+        for r0 in range(0, self.n, refine_chunk):
+            r1 = min(r0 + refine_chunk, self.n)
+            A_ = self.A[r0:r1].astype(np.float64)
+            if trans:
+                out += np.asarray(A_.T @ x[r0:r1])
+            else:
+                out[r0:r1] = np.asarray(A_ @ x)
+        return out
+
+    # Dense LU solve, with iterative refinement in float32 mode
+    def _solve_dense(self, b, trans):
+        if self.dtype == np.float64:
+            return sla.lu_solve((self.lu, self.piv), b, trans=trans, check_finite=False)
+        b = np.asarray(b, dtype=np.float64)
+        x = sla.lu_solve((self.lu, self.piv), b.astype(self.dtype), trans=trans, check_finite=False).astype(np.float64)
+        if self.refine and self.A is None:
+            raise RuntimeError('No A for the refinement of the %s solve, call attach(A) after loading the solver' % self.dtype.name)
+        for k in range(self.refine):
+            r = b - x + self._matvec_A(x, trans)
+            d = sla.lu_solve((self.lu, self.piv), r.astype(self.dtype), trans=trans, check_finite=False)
+            x += d
+            if np.abs(d).max() <= refine_rtol * np.abs(x).max():
+                break
+        return x
+
+    @property
+    def shape(self):
+        return (self.n, self.n)
+
+    # L * y, for a vector or for a matrix of demand columns
+    def solve(self, y):
+        if self.sparse:
+            if self.method == 'iterative':
+                return self._solve_iterative(y, 'N')
+            if self._splu is None:
+                self._factorize()
+            return self._splu.solve(np.asarray(y, dtype=np.float64))
+        return self._solve_dense(y, 0)
+
+    # L' * b, for a vector or for a matrix of columns
+    def solve_T(self, b):
+        if self.sparse:
+            if self.method == 'iterative':
+                return self._solve_iterative(b, 'T')
+            if self._splu is None:
+                self._factorize()
+            return self._splu.solve(np.asarray(b, dtype=np.float64), trans='T')
+        return self._solve_dense(b, 1)
+
+    # Single column of L, computed on first access
+    def column(self, j):
+        if j not in self._cols:
+            e = np.zeros(self.n)
+            e[j] = 1
+            self._cols[j] = self.solve(e)
+        return self._cols[j]
+
+    # B * L, i.e. the multipliers of the extensions in B
+    def multipliers(self, B):
+        return self.solve_T(np.asarray(B).T).T
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_splu'] = None
+        state['_cols'] = {}
+        state.pop('A', None)  # stored with the background, see attach
+        return state
+
+
+##############################################
+# Low-rank updates for A-matrix scenarios
+##############################################
+
+# Leontief system of A + dA from the factorisation of A, see update_leontief
+class UpdatedLeontiefSolver(LeontiefSolver):
+
+    def __init__(self, base, dA):
+        dA = sp.csr_matrix(dA)
+        rows = np.unique(dA.nonzero()[0])
+        cols = np.unique(dA.nonzero()[1])
+        self.base = base
+        self.n = base.n
+        self.sparse = base.sparse
+        self._cols = {}
+        # dA = U * Vt, with the changed columns or the changed rows as factor
+        if len(cols) <= len(rows):
+            self.U = dA[:, cols].toarray()
+            self.Vt = sp.csr_matrix((np.ones(len(cols)), (np.arange(len(cols)), cols)), shape=(len(cols), self.n))
+        else:
+            self.U = sp.csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))), shape=(self.n, len(rows))).toarray()
+            self.Vt = dA[rows, :]
+        self.rank = self.U.shape[1]
+        self.W = base.solve(self.U)  # L * U
+        self._LV = None  # L' * V, only needed for transposed solves
+        C = np.eye(self.rank) - self.Vt @ self.W  # capacitance matrix I - V' L U
+        self.C_lu = sla.lu_factor(C, check_finite=False)
+
+    # L' * V, computed on first use
+    def _get_LV(self):
+        if self._LV is None:
+            self._LV = self.base.solve_T(self.Vt.T.toarray())
+        return self._LV
+
+    def solve(self, y):
+        x = self.base.solve(y)
+        return x + self.W @ sla.lu_solve(self.C_lu, self.Vt @ x, check_finite=False)
+
+    def solve_T(self, b):
+        z = self.base.solve_T(b)
+        return z + self._get_LV() @ sla.lu_solve(self.C_lu, self.W.T @ b, trans=1, check_finite=False)
+
+    # B * L for A + dA, from the baseline multipliers M = B * L if given
+    def multipliers(self, B, M=None):
+        B = np.asarray(B)
+        if M is None:
+            M = self.base.multipliers(B)
+        BW = B @ self.W
+        return M + sla.lu_solve(self.C_lu, BW.T, trans=1, check_finite=False).T @ self._get_LV().T
+
+
+# Leontief system for A + dA, where dA holds the changed coefficients of A
+#   L: factorisation of the baseline (I - A)
+#   max_rank: above this rank of dA the system is factorised again from scratch
+def update_leontief(L, A, dA, max_rank=100):
+    dA = sp.csr_matrix(dA)
+    rank = min(len(np.unique(dA.nonzero()[0])), len(np.unique(dA.nonzero()[1])))
+    if rank > max_rank:
+        # same settings as the baseline factorisation (of the base of an updated solver)
+        base = L.base if isinstance(L, UpdatedLeontiefSolver) else L
+        opts = {'sparse': base.sparse, 'method': base.method, 'dtype': base.dtype, 'refine': base.refine}
+        if sp.issparse(A):
+            return LeontiefSolver(A + dA, **opts)
+        return LeontiefSolver(np.asarray(A) + dA.toarray(), **opts)
+    return UpdatedLeontiefSolver(L, dA)
+
+
+##############################################
+# Derived matrices
+##############################################
+
+# Total output x = L * y of the process step (exiobase_3_7-process2025.py), y the sum of
+# the columns of Y. L is unpickled from leontief<year>.pkl without A, A is attached
+# first so that a float32 solver can refine
+def calc_output(L, A, Y):
+    L.attach(A)
+    return L.solve(np.asarray(Y).sum(1).reshape((-1, 1)))
+
+# 1 / x where x is non-zero and 0 elsewhere
+def calc_xinv(x):
+    x = np.asarray(x)
+    xinv = np.zeros(x.shape)
+    np.divide(1, x, out=xinv, where=x != 0)
+    return xinv
+
+# M * diag(s) as a column scaling, instead of a product with an n x n diagonal matrix
+#   out: array for the result, may be M itself (in place); a new array is allocated if None
+# The dense path allocates at most the result, the sparse path returns a CSR matrix
+def scale_columns(M, s, out=None):
+    s = np.asarray(s).reshape(-1)
+    if sp.issparse(M):
+        return sp.csr_matrix(M @ sp.diags(s))
+    if out is None:
+        out = np.empty(M.shape, dtype=np.result_type(M.dtype, s.dtype))
+    return np.multiply(M, s[None, :], out=out)
+
+
+##############################################
+# Helper functions
+##############################################
+
+# Share of non-zero entries in a dense or sparse matrix
+def calc_density(A):
+    if sp.issparse(A):
+        return A.nnz / (A.shape[0] * A.shape[1])
+    return np.count_nonzero(A) / A.size
+
+
+# L * Y where L is either an explicit inverse or a LeontiefSolver
+def leontief_solve(L, Y):
+    if isinstance(L, LeontiefSolver):
+        return L.solve(Y)
+    return np.dot(L, Y)
+
+
+# B * L where L is either an explicit inverse or a LeontiefSolver
+@traced()
+def calc_multipliers(B, L):
+    if isinstance(L, LeontiefSolver):
+        return L.multipliers(B)
+    return np.dot(B, L)
+
+
+# Density of A and timing of the dense and the sparse path on the same system
+# The crossover density is where the sparse path is estimated to be as fast as
+# the dense one, assuming sparse cost grows linearly with the number of non-zeros
+def report_sparsity(A, nrhs=4, method='direct'):
+    density = calc_density(A)
+    y = np.ones((A.shape[0], nrhs))
+
+    tstart = time.time()
+    LeontiefSolver(A, sparse=False).solve(y)
+    t_dense = time.time() - tstart
+
+    tstart = time.time()
+    LeontiefSolver(A, sparse=True, method=method).solve(y)
+    t_sparse = time.time() - tstart
+
+    crossover = density * t_dense / t_sparse
+    print('Density of A: %6.4f (%d non-zeros)' % (density, round(density * A.shape[0] * A.shape[1])))
+    print('Dense LU: %5.2f s, sparse %s: %5.2f s' % (t_dense, method, t_sparse))
+    print('Estimated crossover density: %6.4f, %s path is faster\n' % (crossover, 'sparse' if t_sparse < t_dense else 'dense'))
+    return {'density': density, 't_dense': t_dense, 't_sparse': t_sparse, 'crossover': crossover}
@@ -19,13 +19,13 @@ Tasks main.py:
 """
 import pandas as pd
 import numpy as np
-import numpy.matlib
 import os
 import sys
-import matplotlib.pyplot as plt
 from functions2025 import *  # see 2C if this does not work
-from matplotlib.backends.backend_pdf import PdfPages # Added this to save multiple plots in one pdf
+from figures2025 import save_figure_data, plot_figures  # matplotlib is imported in 7F only
 
+# Set EXIO_PROFILE to a folder to record the time and memory of every step (see profile2025.py)
+# Single steps (background, footprint totals, reports, figures) run faster with cli2025.py
 # These options determine the way floating point numbers, arrays and other NumPy objects are displayed.
 np.set_printoptions(precision=2) 
 
@@ -41,7 +41,7 @@ np.set_printoptions(precision=2)
 if str(os.getcwd()).endswith('scripts') == True:
     os.chdir(str(os.getcwd())[:-8])
 
-if str(os.getcwd()).endswith('envr-footprint-healthcare2025') == False:
+if os.path.isdir(os.path.join(os.getcwd(), 'data')) == False:
     print("Please set working directory to envr-footprint-healthcare2025 folder")
     sys.exit()
 
@@ -90,20 +90,31 @@ print("CBS data loaded from local CSV.")
 cbs_data.iloc[1, 0] = 1  # assumed no conversion in calculation
 
 # 2B) Create background object 
+step('2B background')
 # That is, containing exiobase and stimulus
-year = '2016'
+year = os.environ.get('EXIO_YEAR', '2016')  # year of the Exiobase IOT, see pipeline2025.py --years for several years
+precision = 'float64'  # 'float32' halves memory, check the error with calc_precision_error(bg)
 #To rerun a second time faster comment the next
-#line and uncomment the follow-up ones
-bg = createBackground(mrio_dir, cbs_data, bg_dir, year)  
-#bg_tmp = open(excel_dir + 'gddz_background_information.pkl',"rb")
-#bg = pkl.load(bg_tmp)
-#bg_tmp.close()
+#line and uncomment the follow-up one (memory-maps the stored background),
+#or set EXIO_LOAD_BACKGROUND=1 (as cli2025.py report does)
+# Optional: expenditure and direct emissions of other regions (layout in stimulus2025.py),
+# for the footprint of the healthcare sector of all these regions in 7G
+country_file = data_dir + 'country_data_2025.csv'
+country_data = read_country_data(country_file) if os.path.exists(country_file) else None
+if os.environ.get('EXIO_LOAD_BACKGROUND') == '1':
+    bg = load_background(bg_dir, year)
+else:
+    bg = createBackground(mrio_dir, cbs_data, bg_dir, year, precision, country_data)  
+#bg = load_background(bg_dir, year)
+if precision == 'float32':
+    calc_precision_error(bg)  # relative error of the Table 1 totals in float32
 
 
 
 ##############################################
 #3)  Create labels, classification (incl for aggregation)
 ##############################################
+step('3 labels')
 
 
 # 3A) Labels name countries/regions
@@ -134,19 +145,28 @@ sec_labels = pd.read_excel(data_dir + '\\exiobase_v3.7\\'  + excel_str, sheet_na
 sec_labels = sec_labels[['Code', 'Description', 'AggPos', 'AggDescription', 'AggCode', 'Scope', 'Scope_hotspot']]
 sec_labels.rename(columns={'Code':'SecTxtCode', 'Description':'SecName', 'AggPos':'SAggPos', 'AggDescription':'SAggDescription', 'AggCode':'SAggCode'}, inplace = True)
 fig_labels = pd.read_excel(data_dir + '\\exiobase_v3.7\\'  + excel_str, sheet_name = 'agg_ind_fig', skiprows = 5)
+# groups of the figures as sector labels, so figures are aggregated like the reports
+# (one figure group per SAggCode, validate raises MergeError on a duplicate row in the sheet)
+sec_labels = pd.merge(sec_labels, fig_labels[['SAggCode', 'Contribution', 'Hotspot']], on = 'SAggCode', how = 'left', validate = 'm:1')
 
 
 # 3D) Create multi-index for 163 sectors and 49 regions
 multiindex = pd.MultiIndex.from_tuples(list(zip(list(df_labels['regiso3']), list(df_labels['sectxtcode']))))
 
+# 3E) Region and sector labels coded by position, attached to the results without merges
+# (GLO is used for the indirect impacts of travel in the hotspot analysis)
+reg_labels_glo = pd.DataFrame({'ISO3': ['GLO'], 'RegName': ['Global'], 'Region': ['Global']})
+labels = LabelTable(pd.concat([reg_labels, reg_labels_glo], ignore_index = True), sec_labels, multiindex)
+
 
 
 ##############################################
 # 4)  EE-IOA footprint calculation
 ##############################################
+step('4 footprint')
 
 # Arrays results
-array_contrib = calc_contrib(bg['B'], bg['L'], bg['Ystim'])
+array_contrib = calc_contrib(bg['B'], bg['L'], bg['Ystim'], bg['M'])
 array_hotspot = calc_hotspot(bg['B'], bg['L'], bg['Ystim'])
 
 # Turn arrays to dataframes
@@ -163,6 +183,7 @@ df_hotspot = df_fromarray(array_hotspot, char_labels, multiindex, cols_impcat)
 ##############################################
 # 5) Adding direct impacts and other healthcare specific impacts
 ##############################################
+step('5 direct impacts')
 
 cols_df = df_contrib[0].columns  # same for all
 
@@ -205,6 +226,7 @@ visit_h_indir_row = pd.Series(['GLO', 'B_REST'] + list(BU_data.loc['Visitor trav
 ##############################################
 # 6) Compile total results
 ##############################################
+step('6 compile results')
 
 # 6A) Append the additional rows to the input-output results
 rows_c = [hc_dir_row, anae_row, mdi_row, commute_c_row, visit_c_row]
@@ -226,16 +248,13 @@ df_hotspot[1] = pd.concat([df_hotspot[1], add_rows_h], ignore_index = True)
 # .. for the contribution analysis
 df_c = []
 for x in df_contrib:
-    x = pd.merge(x, reg_labels, on = 'ISO3', how = 'left' )
-    x = pd.merge(x, sec_labels[['SecTxtCode', 'SecName','SAggDescription', 'Scope']], on = 'SecTxtCode', how = 'left' )
+    x = labels.attach(x, ['RegName', 'Region', 'SecName', 'SAggDescription', 'Scope'])
     df_c.append(x)
 
 # .. for the hotspot analysis
 df_h = []
 for x in df_hotspot:
-    x = pd.merge(x, reg_labels, on = 'ISO3', how = 'left' )
-    x = pd.merge(x, sec_labels[['SecTxtCode', 'SecName', 'SAggDescription', 'Scope_hotspot']], on = 'SecTxtCode', how = 'left' )
-    x.rename(columns = {'Scope_hotspot': 'Scope'}, inplace = True)
+    x = labels.attach(x, ['RegName', 'Region', 'SecName', 'SAggDescription', 'Scope_hotspot'], rename = {'Scope_hotspot': 'Scope'})
     df_h.append(x)
 
 
@@ -252,42 +271,55 @@ for x in df_hotspot:
 
 os.chdir(output_dir)
 
+# Format of the reports ExpenditureVector, Intensities, ContributionAnalysis and HotspotAnalysis:
+# 'xlsx' (streamed by xlsxwriter), 'csv', 'parquet' or 'feather' (one file per sheet)
+output_format = 'xlsx'
+
 # 7A) Expenditure vector
+step('7A expenditure vector')
 # column 'Total (MEUR)' is the sum of the expenditure on Healthcare services,
 # Pharmaceuticals & consumables and Medical durable goods
 cols_Y = ['Total (MEUR)','Healthcare services','Pharmaceuticals and consumables','Medical durables goods']
 Y_df = pd.DataFrame(bg['Ystim'], columns = cols_Y, index = multiindex)
 Y_df = Y_df.reset_index()
 Y_df.columns = ['ISO3', 'SecTxtCode'] + cols_Y
-Y_df = pd.merge(Y_df, reg_labels, on = 'ISO3', how = 'left' )
-Y_df = pd.merge(Y_df, sec_labels[['SecTxtCode', 'SecName', 'SAggDescription']], on = 'SecTxtCode', how = 'left' )
+Y_df = labels.attach(Y_df, ['RegName', 'Region', 'SecName', 'SAggDescription'])
 Y_df = Y_df[['ISO3', 'RegName', 'Region', 'SecTxtCode', 'SecName',
        'SAggDescription'] + cols_Y]
 
-Y_allsec = Y_df.groupby(['SecTxtCode', 'SecName'])[cols_Y].sum()
-Y_aggsec_aggreg = Y_df.groupby(['RegName', 'SAggDescription'])[cols_Y].sum()
-Y_aggsec = Y_df.groupby(['SAggDescription'])[cols_Y].sum()
-
-# Read expenditure vector to xlsx for several aggregation levels
-writer = pd.ExcelWriter('ExpenditureVector.xlsx', engine='xlsxwriter')
-Y_df.to_excel(writer, sheet_name='full')
-Y_allsec.to_excel(writer, sheet_name='allsec')
-Y_aggsec_aggreg.to_excel(writer, sheet_name='aggsec_aggreg')
-Y_aggsec.to_excel(writer, sheet_name='aggsec')
+# all aggregation levels in one sparse product (see AggregationCube in labels2025.py)
+cube_Y = AggregationCube(labels, Y_df, cols_Y, {'allsec': ['SecTxtCode', 'SecName'],
+                                                'aggsec_aggreg': ['RegName', 'SAggDescription'],
+                                                'aggsec': ['SAggDescription']})
+Y_allsec = cube_Y['allsec']
+Y_aggsec_aggreg = cube_Y['aggsec_aggreg']
+Y_aggsec = cube_Y['aggsec']
+
+# Write expenditure vector for several aggregation levels
+writer = open_report('ExpenditureVector', output_format)
+writer.write(Y_df, 'full')
+writer.write(Y_allsec, 'allsec')
+writer.write(Y_aggsec_aggreg, 'aggsec_aggreg')
+writer.write(Y_aggsec, 'aggsec')
 writer.close()
 
 
 # 7B) Multipliers / Coefficients / Intensities
+step('7B intensities')
 # join the impact results with the expenditure vector
-mult_all = pd.concat([Y_df.iloc[:,:-3], df_contrib[0].iloc[:163 * 49, 2:]], axis = 1)
-mult_all = mult_all[mult_all['Total (MEUR)'] != 0]  # cannot divide by zero
+mult_full = pd.concat([Y_df.iloc[:,:-3], df_contrib[0].iloc[:163 * 49, 2:]], axis = 1)
 for x in cols_impcat:
-    mult_all[x] = mult_all[x].astype('float')
+    mult_full[x] = mult_full[x].astype('float')
+nonzero = (mult_full['Total (MEUR)'] != 0).values  # cannot divide by zero
+mult_all = mult_full[nonzero]
 
 # Aggregate to later get the weighted average per (aggregated) product group
-mult_aggsec_aggreg = mult_all.groupby(['RegName', 'SAggDescription'])[['Total (MEUR)', 'Global warming (ktCO2eq)', 'Material extraction (kt)', 'Blue water consumption (Mm3)','Land use (km2)', 'Waste generation (kt)']].sum()
-mult_aggsec = mult_all.groupby(['SAggDescription'])[cols_impcat + ['Total (MEUR)']].sum()
-mult_allsec = mult_all.groupby(['SecName'])[cols_impcat + ['Total (MEUR)']].sum()
+cube_mult = AggregationCube(labels, mult_full, cols_impcat + ['Total (MEUR)'], {'aggsec_aggreg': ['RegName', 'SAggDescription'],
+                                                                               'aggsec': ['SAggDescription'],
+                                                                               'allsec': ['SecName']}, rows = nonzero)
+mult_aggsec_aggreg = cube_mult['aggsec_aggreg'][['Total (MEUR)'] + cols_impcat]
+mult_aggsec = cube_mult['aggsec']
+mult_allsec = cube_mult['allsec']
 
 for df in [mult_all, mult_aggsec_aggreg, mult_aggsec, mult_allsec]:
     for x in cols_impcat:
@@ -295,16 +327,17 @@ for df in [mult_all, mult_aggsec_aggreg, mult_aggsec, mult_allsec]:
         del df[x]
 
 
-# Write coefficients/multipliers/intensities to xlsx for several aggregation levels
-writer = pd.ExcelWriter('Intensities.xlsx', engine='xlsxwriter')
-mult_all.to_excel(writer, sheet_name='full')
-mult_allsec.to_excel(writer, sheet_name='allsec')
-mult_aggsec_aggreg.to_excel(writer, sheet_name='aggsec_aggreg')
-mult_aggsec.to_excel(writer, sheet_name='aggsec')
+# Write coefficients/multipliers/intensities for several aggregation levels
+writer = open_report('Intensities', output_format)
+writer.write(mult_all, 'full')
+writer.write(mult_allsec, 'allsec')
+writer.write(mult_aggsec_aggreg, 'aggsec_aggreg')
+writer.write(mult_aggsec, 'aggsec')
 writer.close()
 
 
 # 7C) Dataframe for Table 1 
+step('7C Table 1')
 s1 = df_contrib[0].iloc[:,2:].sum()
 s2 = df_contrib[1].iloc[:(163 * 49) + 1, 2:].sum()  # total plus direct impacts
 s3 = df_contrib[2].iloc[:,2:].sum()
@@ -330,12 +363,13 @@ t1.to_excel('Table1.xlsx')
 
 
 # 7D)  Results Table S5
+step('7D Table S5')
 R_HC = df_contrib[0].iloc[:,2:].sum()  # Healthcare footprint totals
 
 # Final consumption footprint
 k_NL = 20  # Netherlands position among 49 countries
 Y_nl = bg['Y'][:, k_NL * 7: (k_NL + 1)* 7].sum(1)  # Total final demand NL
-BxL_NL = np.dot(bg['B'], bg['L'])  # Calculate multipliers/intensities/coefficients
+BxL_NL = bg['M']  # Multipliers/intensities/coefficients from the background
 R_ind = np.dot(BxL_NL, Y_nl)  # Indirect impacts from NL total final demand 
 
 R_y = bg['H'][:, k_NL * 7: (k_NL + 1)* 7].sum(1)  # Direct impacts from NL total final demand 
@@ -352,67 +386,79 @@ share_hc.to_excel('TableS5.xlsx')
 
 
 # 7E) Contribution analysis (underlying data for Figure 1 and Table S6)
+step('7E contribution and hotspot reports')
 df_c_all = df_c[0][['ISO3','RegName', 'Region', 'SecTxtCode', 'SecName', 'SAggDescription', 'Scope'] + cols_impcat]
-df_c_aggsec = df_c[0].groupby(['SAggDescription'])[cols_impcat].sum()
-df_c_allsec = df_c[0].groupby(['SecTxtCode', 'SecName'])[cols_impcat].sum()
+cube_c = AggregationCube(labels, df_c[0], cols_impcat, {'aggsec': ['SAggDescription'],
+                                                        'allsec': ['SecTxtCode', 'SecName'],
+                                                        'fig_1': (['Contribution'], ['SAggDescription'])})
+df_c_aggsec = cube_c['aggsec']
+df_c_allsec = cube_c['allsec']
 
 # coefficients/multipliers/intensities to csv for several aggregation levels
-writer = pd.ExcelWriter('ContributionAnalysis.xlsx', engine='xlsxwriter')
-df_c_all.to_excel(writer, sheet_name='full')
-df_c_allsec.to_excel(writer, sheet_name='allsec')
-df_c_aggsec.to_excel(writer, sheet_name='aggsec')
+writer = open_report('ContributionAnalysis', output_format)
+writer.write(df_c_all, 'full')
+writer.write(df_c_allsec, 'allsec')
+writer.write(df_c_aggsec, 'aggsec')
 writer.close()
 
 # Hotspot analysis (underlying data for Figure 2, 3 and Table S7, S8)
 df_h_all = df_h[0][['ISO3','RegName', 'Region', 'SecTxtCode', 'SecName', 'SAggDescription', 'Scope'] + cols_impcat]
-df_h_all.loc[df_h_all['ISO3']=='GLO', ['RegName', 'Region']] = 'Global'
-
-df_h_aggsec = df_h_all.groupby(['Scope','SAggDescription'])[cols_impcat].sum()
-df_h_aggsec_aggreg = df_h_all.groupby(['Scope', 'RegName','SAggDescription'])[cols_impcat].sum()
-df_h_aggreg = df_h_all.groupby(['Scope', 'Region', 'RegName'])[cols_impcat].sum()
-df_h_allreg = df_h_all.groupby(['Scope', 'RegName'])[cols_impcat].sum()
-df_h_allsec = df_h_all.groupby(['Scope', 'SecTxtCode', 'SecName'])[cols_impcat].sum()
-
-writer = pd.ExcelWriter('HotspotAnalysis.xlsx', engine='xlsxwriter')
-df_h_all.to_excel(writer, sheet_name='full')
-df_h_aggsec.to_excel(writer, sheet_name='aggsec')
-df_h_aggsec_aggreg.to_excel(writer, sheet_name='aggsec_aggreg')
-df_h_aggreg.to_excel(writer, sheet_name='aggreg')
-df_h_allreg.to_excel(writer, sheet_name='allreg')
-df_h_allsec.to_excel(writer, sheet_name='allsec')
+
+cube_h = AggregationCube(labels, df_h_all, cols_impcat, {'aggsec': ['Scope', 'SAggDescription'],
+                                                         'aggsec_aggreg': ['Scope', 'RegName', 'SAggDescription'],
+                                                         'aggreg': ['Scope', 'Region', 'RegName'],
+                                                         'allreg': ['Scope', 'RegName'],
+                                                         'allsec': ['Scope', 'SecTxtCode', 'SecName'],
+                                                         'fig_2': (['Hotspot'], ['Scope', 'SAggDescription']),
+                                                         'fig_3': ['Region']}, rename = {'Scope_hotspot': 'Scope'})
+df_h_aggsec = cube_h['aggsec']
+df_h_aggsec_aggreg = cube_h['aggsec_aggreg']
+df_h_aggreg = cube_h['aggreg']
+df_h_allreg = cube_h['allreg']
+df_h_allsec = cube_h['allsec']
+
+writer = open_report('HotspotAnalysis', output_format)
+writer.write(df_h_all, 'full')
+writer.write(df_h_aggsec, 'aggsec')
+writer.write(df_h_aggsec_aggreg, 'aggsec_aggreg')
+writer.write(df_h_aggreg, 'aggreg')
+writer.write(df_h_allreg, 'allreg')
+writer.write(df_h_allsec, 'allsec')
 writer.close()
 
 
 # 7F) plot figures (figures in manuscript are composed in MS Excel)
-# Figure 1
-fig_1 = pd.merge(df_c_aggsec.reset_index(), sec_labels[['SAggDescription','SAggCode']].drop_duplicates(), on = 'SAggDescription', how = 'left')
-fig_1 = pd.merge(fig_1, fig_labels, on = 'SAggCode', how = 'left') 
-fig_1 = fig_1.groupby('Contribution')[cols_impcat].sum()
-
-# Figure 2
-fig_2 = pd.merge(df_h_aggsec.reset_index(), sec_labels[['SAggDescription','SAggCode']].drop_duplicates(), on = 'SAggDescription', how = 'left')
-fig_2 = pd.merge(fig_2, fig_labels, on = 'SAggCode', how = 'left') 
-fig_2 = fig_2.groupby('Hotspot')[cols_impcat].sum()
-
-# Figure 3
-fig_3 = df_h_all.groupby(['Region'])[cols_impcat].sum()
-
-# Plot and save figures
-pdf_path = 'AllFigures.pdf'
-with PdfPages(pdf_path) as pdf:
-    n = 1
-    for df in [fig_1, fig_2, fig_3]:
-        for col in df.columns:
-            df[col] = 100 * df[col]/df[col].sum()
-        ax = df.T.plot(kind='bar', stacked=True, colormap='tab10', figsize=(10, 6))
-        plt.legend(bbox_to_anchor=(1.05, 1.0), loc='upper left')
-        plt.xlabel("Impact category")
-        plt.ylabel("Share of footprint")
-        plt.tight_layout()
-        png_name = f'fig_{n}.png'
-        plt.savefig(png_name)
-        pdf.savefig(ax.get_figure())
-        plt.close()  # Close the figure to avoid popups and memory issues
-        print(png_name)
-        n += 1
-print(f"All figures saved to {pdf_path}")
\ No newline at end of file
+step('7F figures')
+# Figure 1, 2 and 3 from the aggregation cubes (groups of agg_ind_fig are sector labels, see 3C)
+fig_1 = cube_c['fig_1']
+fig_2 = cube_h['fig_2']
+fig_3 = cube_h['fig_3']
+
+# Data of the figures, drawn again with cli2025.py figures
+save_figure_data({'fig_1': fig_1, 'fig_2': fig_2, 'fig_3': fig_3}, 'FigureData.pkl')
+
+# Plot and save figures (see figures2025.py), EXIO_FIGURES=0 skips them (cli2025.py report)
+if os.environ.get('EXIO_FIGURES', '1') == '1':
+    plot_figures({'fig_1': fig_1, 'fig_2': fig_2, 'fig_3': fig_3}, 'AllFigures.pdf')
+
+
+# 7G) Healthcare footprint of all regions in country_data (international benchmark)
+step('7G all regions')
+# Contribution and hotspot results of the stimulus of every region in one batch
+if 'Ystim_reg' in bg:
+    stim_reg = pd.MultiIndex.from_tuples(bg['stim_reg'], names = ['Country', 'Stimulus'])
+    reg_totals = region_totals(bg, stim_reg, char_labels)
+    reg_c = region_levels(labels, calc_contrib_batch(bg['M'], bg['Ystim_reg']), multiindex, stim_reg, char_labels,
+                          {'aggsec': ['SAggDescription'], 'aggreg': ['Region']})
+    reg_h = region_levels(labels, calc_hotspot_batch(bg['B'], bg['L'], bg['Ystim_reg']), multiindex, stim_reg, char_labels,
+                          {'aggsec': ['SAggDescription'], 'aggreg': ['Region']})
+
+    writer = open_report('RegionFootprints', output_format)
+    writer.write(reg_totals[cols_impcat], 'totals')
+    writer.write(reg_c['aggsec'][cols_impcat], 'contrib_aggsec')
+    writer.write(reg_c['aggreg'][cols_impcat], 'contrib_aggreg')
+    writer.write(reg_h['aggsec'][cols_impcat], 'hotspot_aggsec')
+    writer.write(reg_h['aggreg'][cols_impcat], 'hotspot_aggreg')
+    writer.close()
+
+end_step()
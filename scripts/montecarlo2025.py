@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks montecarlo2025.py:
+
+    1. Sample the uncertain inputs of the Table 1 footprint: expenditure and
+       conversion factors (cbs_data), direct emissions, the rows of
+       bottomup_data.txt and the coefficients of B
+    2. Evaluate the draws in batches on a pool of worker processes
+    3. Accumulate mean, standard deviation and percentiles in constant memory
+
+Every input is sampled as a factor on its point value, so a draw of the
+footprint of stimulus c (healthcare services, pharmaceuticals, appliances) is
+    (B o E) * x_c * s_c
+with x_c = L * Ystim[:, c] the output of the point estimate, E the factors on
+the coefficients of B and s_c the factor on the expenditure of c. The solves
+with L are done once; the workers only need B and the output vectors x_c,
+which are placed in shared memory instead of being pickled to every worker.
+
+Percentiles are read from fixed-bin histograms of the ratio draw / point
+estimate, which are merged between batches and workers; memory does not grow
+with the number of draws.
+
+Usage, from the envr-footprint-healthcare2025 folder, after the background is stored:
+    python scripts/montecarlo2025.py --year 2016 --draws 100000 --jobs 4
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from leontief2025 import leontief_solve
+
+
+# Distribution of the factor on each group of inputs: (kind, spread), or a
+# dict {label: (kind, spread)} for separate settings per label (None = fixed)
+#   'normal': mean 1, standard deviation spread (clipped at 0)
+#   'lognormal': mean 1, standard deviation of the log spread
+#   'uniform': between 1 - spread and 1 + spread
+#   'triangular': between 1 - spread and 1 + spread, mode 1
+default_uncertainty = {
+    'expenditure': ('normal', 0.05),
+    'conversion': ('uniform', 0.05),
+    'directem': ('normal', 0.1),
+    'bottomup': ('lognormal', 0.3),
+    'B': ('lognormal', 0.2),
+}
+
+# Stimulus columns of Ystim used in the draws, and the rows of bottomup_data.txt in the Table 1 total
+stim_names = ['Healthcare services', 'Pharmaceuticals', 'Appliances']
+bottomup_rows = ['Anaesthetic', 'pMDI', 'Commute (total)', 'Visitor travel (total)']
+output_names = ['Total'] + stim_names
+
+# Percentiles reported, and the range and number of bins of the ratio draw / point estimate
+percentiles = [2.5, 5, 25, 50, 75, 95, 97.5]
+ratio_range = (0.0, 5.0)
+ratio_bins = 20000
+
+
+##############################################
+# Streaming statistics
+##############################################
+
+# Count, mean, variance (Welford/Chan) and a histogram per output, mergeable
+class StreamingStats:
+
+    def __init__(self, point, lo=ratio_range[0], hi=ratio_range[1], nbins=ratio_bins):
+        self.point = np.asarray(point, dtype=np.float64).ravel()
+        self.scale = np.where(self.point != 0, np.abs(self.point), 1)
+        self.lo = lo
+        self.hi = hi
+        self.nbins = nbins
+        nout = self.point.size
+        self.count = 0
+        self.mean = np.zeros(nout)
+        self.m2 = np.zeros(nout)
+        self.min = np.full(nout, np.inf)
+        self.max = np.full(nout, -np.inf)
+        # bin 0 and bin nbins + 1 collect the values outside [lo, hi)
+        self.hist = np.zeros((nout, nbins + 2), dtype=np.int64)
+
+    # Add a batch of draws (ndraw x nout)
+    def add(self, values):
+        values = values.reshape((values.shape[0], -1))
+        nb = values.shape[0]
+        if nb == 0:
+            return
+        mean_b = values.mean(0)
+        m2_b = ((values - mean_b) ** 2).sum(0)
+        self._combine(nb, mean_b, m2_b)
+        self.min = np.minimum(self.min, values.min(0))
+        self.max = np.maximum(self.max, values.max(0))
+
+        r = (values / self.scale - self.lo) / (self.hi - self.lo) * self.nbins
+        b = np.clip(np.floor(r), -1, self.nbins).astype(np.int64) + 1
+        nout = values.shape[1]
+        flat = (b + np.arange(nout) * (self.nbins + 2)).ravel()
+        self.hist += np.bincount(flat, minlength=nout * (self.nbins + 2)).reshape(self.hist.shape)
+
+    def _combine(self, nb, mean_b, m2_b):
+        n = self.count + nb
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * nb / n
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.count * nb / n
+        self.count = n
+
+    # Merge the statistics of another set of draws of the same outputs
+    def merge(self, other):
+        if other.count == 0:
+            return
+        self._combine(other.count, other.mean, other.m2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.hist += other.hist
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    # Percentile p (0-100) of every output, interpolated within the bins
+    def percentile(self, p):
+        width = (self.hi - self.lo) / self.nbins
+        out = np.empty(self.point.size)
+        for k in range(self.point.size):
+            cum = np.cumsum(self.hist[k])
+            target = p / 100 * self.count
+            b = min(np.searchsorted(cum, target), self.nbins + 1)
+            before = cum[b - 1] if b > 0 else 0
+            frac = (target - before) / max(self.hist[k, b], 1)
+            if b == 0:
+                lo_, hi_ = self.min[k], self.lo * self.scale[k]
+            elif b == self.nbins + 1:
+                lo_, hi_ = self.hi * self.scale[k], self.max[k]
+            else:
+                lo_ = (self.lo + (b - 1) * width) * self.scale[k]
+                hi_ = lo_ + width * self.scale[k]
+            out[k] = min(max(lo_ + frac * (hi_ - lo_), self.min[k]), self.max[k])
+        return out
+
+
+##############################################
+# Sampling of the input factors
+##############################################
+
+def _sample(rng, dist, size):
+    if dist is None:
+        return np.ones(size)
+    kind, spread = dist
+    if kind == 'normal':
+        return np.maximum(rng.normal(1, spread, size), 0)
+    if kind == 'lognormal':
+        return rng.lognormal(-spread ** 2 / 2, spread, size)
+    if kind == 'uniform':
+        return rng.uniform(1 - spread, 1 + spread, size)
+    if kind == 'triangular':
+        return rng.triangular(1 - spread, 1, 1 + spread, size)
+    raise ValueError('Unknown distribution: %s' % kind)
+
+# Factors for a group of inputs, one column per label (ndraw x nlabel)
+def sample_factors(rng, spec, labels, ndraw):
+    out = np.empty((ndraw, len(labels)))
+    for k, label in enumerate(labels):
+        dist = spec.get(label) if isinstance(spec, dict) else spec
+        out[:, k] = _sample(rng, dist, ndraw)
+    return out
+
+
+##############################################
+# Model of the Table 1 totals
+##############################################
+
+# Point values needed by the draws, from the background and the bottom-up data
+# (expenditure, conversion and direct emissions of cbs_data are part of Ystim and Hstim)
+#   BU_data: bottomup_data.txt indexed by 'Source'
+#   char_labels: impact labels 'Name (Unit)', the rows of B
+def prepare_montecarlo(bg, BU_data, char_labels):
+    nq = len(char_labels)
+    Ystim = np.asarray(bg['Ystim'], dtype=np.float64)[:, 1:4]
+    X = leontief_solve(bg['L'], Ystim)  # output per stimulus column
+    B = np.asarray(bg['B'], dtype=np.float64)
+
+    # direct emissions of the healthcare sector: GWP from cbs_data, the rest scales with expenditure
+    Hdir = np.array(bg['Hstim'][:, 1], dtype=np.float64)
+    Hem = np.zeros(nq)
+    Hem[0], Hdir[0] = Hdir[0], 0
+
+    BU = np.zeros((len(bottomup_rows), nq))
+    for (q, label) in enumerate(char_labels):
+        if label in BU_data.columns:
+            BU[:, q] = BU_data.loc[bottomup_rows, label].values
+
+    return {'B': B, 'X': X, 'Hdir': Hdir, 'Hem': Hem, 'BU': BU, 'char_labels': list(char_labels)}
+
+# Table 1 totals for a batch of factors, shape (ndraw, 4 outputs, nq)
+#   f_stim: factors on the expenditure of the stimulus columns (ndraw x 3)
+#   f_em, f_bu: factors on the direct emissions (ndraw x 1) and bottom-up rows (ndraw x 4)
+#   E: factors on the coefficients of B (ndraw x nq x n), or None
+def eval_totals(data, f_stim, f_em, f_bu, E=None):
+    B, X = data['B'], data['X']
+    if E is None:
+        ind = (B @ X)[None, :, :] * f_stim[:, None, :]
+    else:
+        ind = np.einsum('bqj,qj,jc->bqc', E, B, X, optimize=True) * f_stim[:, None, :]
+    out = np.empty((f_stim.shape[0], len(output_names), B.shape[0]))
+    out[:, 1] = ind[:, :, 0] + f_stim[:, [0]] * data['Hdir'] + f_em * data['Hem']
+    out[:, 2] = ind[:, :, 1]
+    out[:, 3] = ind[:, :, 2]
+    out[:, 0] = out[:, 1:].sum(1) + f_bu @ data['BU']
+    return out
+
+# Draws of one batch, as factors on the point values
+def sample_batch(rng, uncertainty, nq, n, ndraw):
+    f_exp = sample_factors(rng, uncertainty.get('expenditure'), ['HC service', 'Pharm', 'MedAppl'], ndraw)
+    f_conv = sample_factors(rng, uncertainty.get('conversion'), ['Pharm', 'MedAppl'], ndraw)
+    f_stim = f_exp * np.concatenate((np.ones((ndraw, 1)), f_conv), 1)
+    f_em = sample_factors(rng, uncertainty.get('directem'), ['HC service'], ndraw)
+    f_bu = sample_factors(rng, uncertainty.get('bottomup'), bottomup_rows, ndraw)
+    E = None
+    if uncertainty.get('B') is not None:
+        E = _sample(rng, uncertainty['B'], (ndraw, nq, n))
+    return f_stim, f_em, f_bu, E
+
+
+##############################################
+# Worker processes
+##############################################
+
+# Arrays attached from shared memory in every worker
+_shared = {}
+
+def _to_shared(arrays):
+    blocks = {}
+    spec = {}
+    for key, arr in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+        view[...] = arr
+        blocks[key] = shm
+        spec[key] = (shm.name, arr.shape, arr.dtype.str)
+    return blocks, spec
+
+def _init_worker(spec, small):
+    for key, (name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + '_shm'] = shm  # keep the block open while the worker lives
+        _shared[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _shared.update(small)
+
+# Evaluate ndraw draws in batches and return their statistics
+def _run_draws(data, uncertainty, seed, ndraw, batch, point):
+    rng = np.random.default_rng(seed)
+    stats = StreamingStats(point)
+    nq, n = data['B'].shape
+    for k0 in range(0, ndraw, batch):
+        nb = min(batch, ndraw - k0)
+        f_stim, f_em, f_bu, E = sample_batch(rng, uncertainty, nq, n, nb)
+        stats.add(eval_totals(data, f_stim, f_em, f_bu, E))
+    return stats
+
+def _worker_task(args):
+    uncertainty, seed, ndraw, batch, point = args
+    return _run_draws(_shared, uncertainty, seed, ndraw, batch, point)
+
+
+# Monte Carlo of the Table 1 totals
+#   data: from prepare_montecarlo
+#   uncertainty: distributions per input group, see default_uncertainty
+#   ndraw: number of draws, split in tasks of task_size draws (one seed each)
+#   batch: draws evaluated together, bounds the memory of the factors on B (batch x nq x n)
+#   jobs: number of worker processes, 1 runs in this process
+# Returns a DataFrame with one row per (output, impact): point estimate, mean, std and percentiles
+def run_montecarlo(data, uncertainty=default_uncertainty, ndraw=10000, seed=0, batch=64, jobs=1, task_size=2000):
+    tstart = time.time()
+    ones = np.ones((1, 3))
+    point = eval_totals(data, ones, ones[:, :1], np.ones((1, len(bottomup_rows))))[0]
+
+    sizes = [min(task_size, ndraw - k) for k in range(0, ndraw, task_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(uncertainty, s, m, batch, point) for (s, m) in zip(seeds, sizes)]
+
+    stats = StreamingStats(point)
+    if jobs == 1:
+        for (u, s, m, b, p) in tasks:
+            stats.merge(_run_draws(data, u, s, m, b, p))
+    else:
+        blocks, spec = _to_shared({'B': data['B'], 'X': data['X']})
+        small = {key: data[key] for key in ['Hdir', 'Hem', 'BU']}
+        try:
+            with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(spec, small)) as pool:
+                for res in pool.map(_worker_task, tasks):
+                    stats.merge(res)
+        finally:
+            for shm in blocks.values():
+                shm.close()
+                shm.unlink()
+
+    index = pd.MultiIndex.from_product([output_names, data['char_labels']], names=['Output', 'Impact'])
+    res = pd.DataFrame({'point': point.ravel(), 'mean': stats.mean, 'std': stats.std}, index=index)
+    for p in percentiles:
+        res['p%g' % p] = stats.percentile(p)
+    print('Monte Carlo: %d draws in %5.2f s\n' % (stats.count, time.time() - tstart))
+    return res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo of the healthcare footprint totals (Table 1)')
+    parser.add_argument('--root', default=os.getcwd(), help='envr-footprint-healthcare2025 folder')
+    parser.add_argument('--year', default='2016')
+    parser.add_argument('--draws', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch', type=int, default=64, help='draws evaluated together')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-B', action='store_true', help='keep the coefficients of B fixed')
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(args.root, 'scripts'))
+    from background2025 import load_background
+
+    data_dir = os.path.join(args.root, 'data', '')
+    bg = load_background(os.path.join(args.root, 'data', 'bg', ''), args.year)
+    BU_data = pd.read_csv(data_dir + 'bottomup_data.txt', sep='\t').set_index('Source')
+    char_labels = [str(n) + ' (' + str(u) + ')' for (n, u) in zip(bg['label']['characterization']['Name'], bg['label']['characterization']['Unit'])]
+
+    uncertainty = dict(default_uncertainty)
+    if args.no_B:
+        uncertainty['B'] = None
+    data = prepare_montecarlo(bg, BU_data, char_labels)
+    res = run_montecarlo(data, uncertainty, args.draws, args.seed, args.batch, args.jobs)
+
+    output_dir = os.path.join(args.root, 'output')
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    res.to_csv(os.path.join(output_dir, 'MonteCarlo' + args.year + '.csv'))
+    print(res)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks output2025.py:
+
+    1. Write the reports of section 7 of main2025.py (one report = several sheets)
+    2. Select the format of all reports with one switch:
+           'xlsx'     one workbook per report, written row by row by xlsxwriter
+                      in constant-memory mode
+           'csv'      one folder per report, one .csv file per sheet
+           'parquet'  one folder per report, one .parquet file per sheet (pyarrow)
+           'feather'  one folder per report, one Arrow .feather file per sheet (pyarrow)
+
+In the columnar formats the index of a sheet becomes ordinary columns, so the
+files can be read back without knowing the index levels; a plain row number
+index is dropped. In the Excel sheets the index labels are repeated on every
+row instead of merged, so each sheet is a plain table; NaN is written as an
+empty cell, as by DataFrame.to_excel.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from profile2025 import span, traced
+
+
+output_formats = ['xlsx', 'csv', 'parquet', 'feather']
+
+# Rows of a sheet flattened and converted to Python values at a time by ExcelReport
+excel_chunk = 10000
+
+
+##############################################
+# Report writers
+##############################################
+
+# Sheet as a flat frame: index levels as columns, column names as strings
+def _flat(df, keep_range_index=False):
+    if isinstance(df.index, pd.RangeIndex) and not keep_range_index:
+        df = df.reset_index(drop=True)
+    else:
+        df = df.reset_index()
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+# Column as native Python values, as DataFrame.to_excel writes them: NaN and None
+# as empty cells (None is skipped by xlsxwriter), +-inf as the text inf and -inf
+def _cells(col):
+    values = col.astype(object).where(col.notna(), None)
+    if pd.api.types.is_float_dtype(col.dtype):
+        values[col == np.inf] = 'inf'
+        values[col == -np.inf] = '-inf'
+    return values.tolist()
+
+
+class ExcelReport:
+
+    def __init__(self, name):
+        import xlsxwriter
+        self.path = name + '.xlsx'
+        # rows are written in order and flushed to disk, memory does not grow with the sheet
+        self.workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True})
+
+    def write(self, df, sheet_name):
+        # same layout as DataFrame.to_excel: index columns first, header in the first row
+        header = [str(c) for c in df.index.names] if not isinstance(df.index, pd.RangeIndex) else ['']
+        header = ['' if c == 'None' else c for c in header] + [str(c) for c in df.columns]
+        with span('ExcelReport.write', report=self.path, sheet=sheet_name, rows=len(df), cols=len(header)):
+            ws = self.workbook.add_worksheet(sheet_name)
+            ws.write_row(0, 0, header)
+            # excel_chunk rows at a time, so the Python values never cover the whole sheet
+            for i in range(0, len(df), excel_chunk):
+                part = _flat(df.iloc[i:i + excel_chunk], keep_range_index=True)
+                columns = [_cells(part[c]) for c in part.columns]
+                for (r, row) in enumerate(zip(*columns)):
+                    ws.write_row(i + r + 1, 0, row)
+
+    @traced()
+    def close(self):
+        self.workbook.close()
+
+
+class ColumnarReport:
+
+    def __init__(self, name, fmt):
+        if fmt in ['parquet', 'feather']:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as err:
+                raise ImportError('Output format %s needs pyarrow (pip install pyarrow), or choose xlsx or csv (%s)' % (fmt, err))
+        self.path = name
+        self.fmt = fmt
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def write(self, df, sheet_name):
+        with span('ColumnarReport.write', report=self.path, sheet=sheet_name, rows=len(df), format=self.fmt):
+            df = _flat(df)
+            path = os.path.join(self.path, sheet_name + '.' + self.fmt)
+            if self.fmt == 'csv':
+                df.to_csv(path, index=False)
+            elif self.fmt == 'parquet':
+                df.to_parquet(path, index=False)
+            else:
+                df.to_feather(path)
+
+    def close(self):
+        pass
+
+
+# Writer for one report in the chosen format, used as
+#   writer = open_report('HotspotAnalysis', output_format)
+#   writer.write(df, 'full')
+#   writer.close()
+def open_report(name, fmt='xlsx'):
+    if fmt not in output_formats:
+        raise ValueError('Unknown output format %s, choose from %s' % (fmt, output_formats))
+    if fmt == 'xlsx':
+        return ExcelReport(name)
+    return ColumnarReport(name, fmt)
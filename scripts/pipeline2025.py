@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks pipeline2025.py:
+
+    1. Run the preparation of the background as a graph of stages
+           characterisation -> load -> leontief -> process -> background
+                                load -> waste ------------------^
+    2. Skip stages whose outputs are current (content hashes of inputs and parameters)
+    3. Run independent stages (e.g. waste next to leontief/process) concurrently
+
+The state of every completed stage is written to pipeline<year>.json in the
+pickled_mrio folder right after it finishes, so an interrupted run resumes
+from the last completed stage.
+
+Several years are run as one graph of stages (--years), with the number of
+stages running at the same time limited by --jobs and by a memory budget in
+GB (--memory, see stage_memory). The waste extension and the characterisation
+factors do not depend on the year and are built once, before the stages of the
+other years read them. The footprint totals of all years are written to
+output/FootprintYears.csv (Year, Impact, Stimulus, Value).
+
+Usage, from the envr-footprint-healthcare2025 folder:
+    python scripts/pipeline2025.py --year 2016 [--jobs 2] [--force]
+    python scripts/pipeline2025.py --years 1995-2022 --jobs 4 --memory 16
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from hashing2025 import file_hash
+
+
+##############################################
+# Fingerprints of files and parameters
+##############################################
+
+# Content hash of a file, reused from the cache while size and modification time are unchanged
+def cached_file_hash(path, cache):
+    st = os.stat(path)
+    key = [st.st_size, st.st_mtime_ns]
+    if path in cache and cache[path]['key'] == key:
+        return cache[path]['hash']
+    digest = file_hash(path)
+    cache[path] = {'key': key, 'hash': digest}
+    return digest
+
+# Fingerprint of a stage: hash of its script, its input files and its parameters
+def stage_fingerprint(stage, params, cache):
+    h = hashlib.sha256()
+    for path in stage['code'] + stage['inputs']:
+        h.update(path.encode('utf-8'))
+        h.update(cached_file_hash(path, cache).encode('utf-8'))
+    h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+##############################################
+# Stages of the background preparation
+##############################################
+
+# Paths of the inputs and outputs of every stage for a given year
+def define_stages(root, year):
+    scripts_dir = os.path.join(root, 'scripts')
+    prep_dir = os.path.join(scripts_dir, 'prep_background2025')
+    exio_dir = os.path.join(root, 'data', 'exiobase_v3.7')
+    iot_dir = os.path.join(exio_dir, 'IOT_' + year + '_ixi')
+    mrio_dir = os.path.join(root, 'data', 'bg', 'pickled_mrio')
+    bg_dir = os.path.join(root, 'data', 'bg')
+
+    exio_pkl = os.path.join(mrio_dir, 'exio' + year + '.pkl')
+    leontief_pkl = os.path.join(mrio_dir, 'leontief' + year + '.pkl')
+    mrio_pkl = os.path.join(mrio_dir, 'mrio' + year + '.pkl')
+    waste_pkl = os.path.join(mrio_dir, 'waste.pkl')
+    char_pkl = os.path.join(mrio_dir, 'characterisation.pkl')
+    char_xlsx = os.path.join(exio_dir, 'characterisation_DESIRE_version3.4_adapted.xlsx')
+    # optional expenditure and direct emissions of other regions, as in section 2B of main2025.py
+    country_csv = os.path.join(root, 'data', 'country_data_2025.csv')
+
+    iot_files = ['A.txt', 'Y.txt', 'finaldemands.txt', 'industries.txt', 'unit.txt',
+                 os.path.join('satellite', 'F.txt'), os.path.join('satellite', 'F_hh.txt'),
+                 os.path.join('satellite', 'unit.txt')]
+
+    stages = {
+        'characterisation': {
+            'script': os.path.join(prep_dir, 'exiobase_3_7-characterisation2025.py'),
+            'code': [os.path.join(scripts_dir, 'exioreader2025.py'), os.path.join(scripts_dir, 'hashing2025.py')],
+            'inputs': [char_xlsx, os.path.join(iot_dir, 'satellite', 'unit.txt')],
+            'outputs': [char_pkl],
+            'deps': []},
+        'load': {
+            'script': os.path.join(prep_dir, 'exiobase_3_7-load2025.py'),
+            'code': [os.path.join(scripts_dir, 'exioreader2025.py'), os.path.join(scripts_dir, 'hashing2025.py')],
+            'inputs': [os.path.join(iot_dir, x) for x in iot_files] +
+                      [os.path.join(exio_dir, 'regions_Dk2025.txt'), char_xlsx, char_pkl],
+            'outputs': [exio_pkl],
+            'deps': ['characterisation']},
+        'leontief': {
+            'script': os.path.join(prep_dir, 'exiobase_3_7-leontief2025.py'),
+            'code': [os.path.join(scripts_dir, 'leontief2025.py')],
+            'inputs': [exio_pkl],
+            'outputs': [leontief_pkl],
+            'deps': ['load']},
+        'process': {
+            'script': os.path.join(prep_dir, 'exiobase_3_7-process2025.py'),
+            'code': [],
+            'inputs': [exio_pkl, leontief_pkl],
+            'outputs': [mrio_pkl],
+            'deps': ['load', 'leontief']},
+        'waste': {
+            'script': os.path.join(prep_dir, 'exiobase_3_7-waste2025.py'),
+            'code': [os.path.join(scripts_dir, 'exioreader2025.py'), os.path.join(scripts_dir, 'hashing2025.py')],
+            'inputs': [exio_pkl, os.path.join(exio_dir, 'MR_HSUT_2011_v3_3_17_extensions.xlsb')],
+            'outputs': [waste_pkl],
+            'deps': ['load']},
+        'background': {
+            'script': os.path.join(scripts_dir, 'pipeline2025.py'),
+            'args': ['--run-background'],
+            'code': [os.path.join(scripts_dir, 'functions2025.py'), os.path.join(scripts_dir, 'background2025.py'),
+                     os.path.join(scripts_dir, 'stimulus2025.py')],
+            'inputs': [waste_pkl, leontief_pkl, mrio_pkl, os.path.join(root, 'data', 'DK_data_2025.csv')] +
+                      ([country_csv] if os.path.exists(country_csv) else []),
+            'outputs': [os.path.join(bg_dir, 'background' + year, 'meta.pkl')],
+            'deps': ['leontief', 'process', 'waste']},
+    }
+    for name, stage in stages.items():
+        stage['code'] = [stage['script']] + stage['code']
+        stage.setdefault('args', [])
+    return stages, mrio_dir
+
+
+# Stage 'background': createBackground as in section 2 of main2025.py
+def run_background(root, year):
+    sys.path.append(os.path.join(root, 'scripts'))
+    import pandas as pd
+    from functions2025 import createBackground
+    from stimulus2025 import read_country_data
+
+    data_dir = os.path.join(root, 'data', '')
+    bg_dir = os.path.join(root, 'data', 'bg', '')
+    mrio_dir = os.path.join(root, 'data', 'bg', 'pickled_mrio', '')
+    cbs_data = pd.read_csv(data_dir + 'DK_data_2025.csv', index_col=['Index', 'Unit'])
+    cbs_data.iloc[1, 0] = 1  # assumed no conversion in calculation
+    country_file = data_dir + 'country_data_2025.csv'
+    country_data = read_country_data(country_file) if os.path.exists(country_file) else None
+    createBackground(mrio_dir, cbs_data, bg_dir, year, os.environ.get('EXIO_PRECISION', 'float64'), country_data)
+
+
+##############################################
+# Runner
+##############################################
+
+def _read_manifest(path):
+    if os.path.exists(path):
+        f = open(path, 'r')
+        manifest = json.load(f)
+        f.close()
+        return manifest
+    return {'stages': {}, 'hashes': {}}
+
+def _write_manifest(path, manifest):
+    tmp = path + '.tmp'
+    f = open(tmp, 'w')
+    json.dump(manifest, f, indent=1)
+    f.close()
+    os.replace(tmp, path)
+
+def _run_stage(name, stage, root, env, log_path):
+    tstart = time.time()
+    cmd = [sys.executable, stage['script']] + stage['args']
+    log = open(log_path, 'w')
+    ret = subprocess.call(cmd, cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    if ret != 0:
+        raise RuntimeError('Stage %s failed (exit code %d), see %s' % (name, ret, log_path))
+    # the scripts exit without error when started from the wrong folder
+    missing = [x for x in stage['outputs'] if not os.path.exists(x)]
+    if missing:
+        raise RuntimeError('Stage %s did not write %s, see %s' % (name, ', '.join(missing), log_path))
+    return time.time() - tstart
+
+# Approximate peak memory of every stage in GB, for the full Exiobase system
+# (7987 sectors); used to keep the stages running at the same time within a budget
+stage_memory = {'characterisation': 0.5, 'load': 4.0, 'leontief': 3.0, 'process': 3.0, 'waste': 2.0, 'background': 4.0}
+
+# Stages whose outputs do not depend on the year, they only run for the first year
+shared_stages = ['characterisation', 'waste']
+
+# Stages of several years as one graph, nodes are named '<stage>:<year>'.
+def _year_graph(root, years):
+    nodes = {}
+    first = years[0]
+    for year in years:
+        stages, mrio_dir = define_stages(root, year)
+        for name, stage in stages.items():
+            if name in shared_stages and year != first:
+                continue
+            deps = [d + ':' + (first if d in shared_stages else year) for d in stage['deps']]
+            nodes[name + ':' + year] = {'name': name, 'year': year, 'stage': stage, 'deps': deps, 'mrio_dir': mrio_dir}
+    return nodes
+
+# Run the preparation of the background for several years
+#   params: parameters passed to the scripts, part of the fingerprint of every stage
+#   jobs: number of stages run at the same time
+#   memory: budget in GB for the stages running at the same time (see stage_memory), no limit if None
+#   force: rerun all stages
+#   targets: stages to run (with their dependencies), all if None
+def run_years(root, years, params=None, jobs=2, memory=None, force=False, targets=None):
+    years = [str(y) for y in years]
+    nodes = _year_graph(root, years)
+    params = dict(params or {})
+
+    manifests = {}
+    for year in years:
+        mrio_dir = nodes['load:' + year]['mrio_dir']
+        if not os.path.exists(mrio_dir):
+            os.makedirs(mrio_dir)
+        path = os.path.join(mrio_dir, 'pipeline' + year + '.json')
+        manifests[year] = (path, _read_manifest(path))
+
+    # stages needed for the targets
+    todo = set()
+    stack = [n for n in nodes if targets is None or nodes[n]['name'] in targets]
+    while stack:
+        node = stack.pop()
+        if node not in todo:
+            todo.add(node)
+            stack.extend(nodes[node]['deps'])
+
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(jobs) as pool:
+        while len(done) < len(todo):
+            for node in sorted(todo - done - set(running), key=lambda n: (nodes[n]['year'], n)):
+                info = nodes[node]
+                name, year, stage = info['name'], info['year'], info['stage']
+                if not all(d in done for d in info['deps']):
+                    continue
+                path, manifest = manifests[year]
+                params_year = dict(params, year=year)
+                fingerprint = stage_fingerprint(stage, params_year, manifest['hashes'])
+                record = manifest['stages'].get(name, {})
+                current = record.get('fingerprint') == fingerprint and all(os.path.exists(x) for x in stage['outputs'])
+                if current and not force:
+                    print('Stage %-16s up to date' % node)
+                    done.add(node)
+                    continue
+                # within the memory budget, a stage always runs when nothing else does
+                if memory is not None and running:
+                    used = sum(stage_memory.get(nodes[n]['name'], 0) for n in running)
+                    if used + stage_memory.get(name, 0) > memory:
+                        continue
+                if len(running) >= jobs:
+                    break
+                env = dict(os.environ)
+                env['EXIO_YEAR'] = year
+                env['EXIO_SPARSE'] = '1' if params.get('sparse') else '0'
+                env['EXIO_PRECISION'] = params.get('precision', 'float64')
+                print('Stage %-16s started' % node)
+                log_path = os.path.join(info['mrio_dir'], name + year + '.log')
+                running[node] = (pool.submit(_run_stage, node, stage, root, env, log_path), fingerprint)
+
+            if not running:
+                continue
+            finished, _ = wait([x[0] for x in running.values()], return_when=FIRST_COMPLETED)
+            for node in [n for n, x in running.items() if x[0] in finished]:
+                future, fingerprint = running.pop(node)
+                t = future.result()
+                # outputs changed, their hashes are recomputed by the stages downstream
+                path, manifest = manifests[nodes[node]['year']]
+                manifest['stages'][nodes[node]['name']] = {'fingerprint': fingerprint, 'seconds': t}
+                _write_manifest(path, manifest)
+                print('Stage %-16s done in %5.2f s' % (node, t))
+                done.add(node)
+    for (path, manifest) in manifests.values():
+        _write_manifest(path, manifest)
+    return {year: manifests[year][1] for year in years}
+
+# Run the preparation of the background for one year
+#   params: parameters passed to the scripts, part of the fingerprint of every stage
+#   jobs: number of stages run at the same time
+#   force: rerun all stages
+def run_pipeline(root, year, params=None, jobs=2, force=False, targets=None):
+    return run_years(root, [year], params, jobs, None, force, targets)[year]
+
+
+##############################################
+# Results of several years
+##############################################
+
+# Footprint totals of every year (indirect M * Ystim plus the direct emissions Hstim, the
+# Table 1 totals without the bottom-up rows) as a tidy table with columns Year, Impact,
+# Stimulus and Value
+def footprint_by_year(root, years):
+    sys.path.append(os.path.join(root, 'scripts'))
+    import numpy as np
+    import pandas as pd
+    from background2025 import load_background
+
+    bg_dir = os.path.join(root, 'data', 'bg', '')
+    frames = []
+    for year in years:
+        bg = load_background(bg_dir, str(year))
+        tot = np.dot(np.asarray(bg['M'], dtype=np.float64), np.asarray(bg['Ystim'], dtype=np.float64))
+        tot = tot + np.asarray(bg['Hstim'], dtype=np.float64)
+        char = bg['label']['characterization']
+        impacts = [str(n) + ' (' + str(u) + ')' for (n, u) in zip(char['Name'], char['Unit'])]
+        df = pd.DataFrame(tot, index=pd.Index(impacts, name='Impact'), columns=pd.Index(bg['excelname'], name='Stimulus'))
+        df = df.stack().rename('Value').reset_index()
+        df.insert(0, 'Year', int(year))
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+# Years from arguments such as '2016', '1995-2022' or '2010,2012,2016'
+def parse_years(args):
+    years = []
+    for arg in args:
+        for part in arg.split(','):
+            if '-' in part:
+                y0, y1 = part.split('-')
+                years.extend(str(y) for y in range(int(y0), int(y1) + 1))
+            elif part:
+                years.append(part)
+    return years
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prepare the background of the healthcare footprint model')
+    parser.add_argument('--root', default=os.getcwd(), help='envr-footprint-healthcare2025 folder')
+    parser.add_argument('--year', default='2016')
+    parser.add_argument('--years', nargs='+', help="several years, e.g. 1995-2022 or 2010,2016; writes output/FootprintYears.csv")
+    parser.add_argument('--jobs', type=int, default=2, help='number of stages run at the same time')
+    parser.add_argument('--memory', type=float, help='memory budget in GB for the stages running at the same time')
+    parser.add_argument('--sparse', action='store_true', help='store A and R as sparse matrices')
+    parser.add_argument('--precision', default='float64', choices=['float64', 'float32'])
+    parser.add_argument('--force', action='store_true', help='rerun all stages')
+    parser.add_argument('--stage', action='append', help='run only this stage and its dependencies')
+    parser.add_argument('--run-background', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    params = {'sparse': args.sparse, 'precision': args.precision}
+    if args.run_background:
+        run_background(args.root, os.environ.get('EXIO_YEAR', args.year))
+    elif args.years:
+        years = parse_years(args.years)
+        run_years(args.root, years, params, args.jobs, args.memory, args.force, args.stage)
+        if args.stage is None or 'background' in args.stage:
+            output_dir = os.path.join(args.root, 'output')
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            footprint_by_year(args.root, years).to_csv(os.path.join(output_dir, 'FootprintYears.csv'), index=False)
+    else:
+        run_pipeline(args.root, args.year, params, args.jobs, args.force, args.stage)
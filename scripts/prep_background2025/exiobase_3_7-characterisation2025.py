@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks exiobase_3_7-characterisation.py:
+
+    1. Build the characterisation matrix Q from the adapted DESIRE workbook
+    2. Store it in characterisation.pkl, shared by the load scripts of all years
+
+Q does not depend on the year, only on the workbook and the number of extensions
+of the IOT. pipeline2025.py runs this script once, before the load stages of all
+years (see exioreader2025.py for build_characterisation).
+"""
+
+import os
+import time
+import sys
+tstart = time.time()
+
+year = os.environ.get('EXIO_YEAR', '2016')  # set by pipeline2025.py (first year of the run)
+##############################################
+# Folder settings: Change to reflect the location in your computer relative to the current working directory (run os.getcwd() to find out whatthat is)
+# Set working directory to envr-footprint-healthcare folder
+if str(os.getcwd()).endswith('envr-footprint-healthcare2025'):
+    print("Starting to read files..\n")
+else:
+    print("Please set working directory to envr-footprint-healthcare2025 folder")
+    sys.exit()
+
+import pandas as pd
+sys.path.append(os.getcwd() + '\\scripts\\')
+from exioreader2025 import build_characterisation, save_characterisation
+from hashing2025 import file_hash
+from profile2025 import step  # spans recorded when EXIO_PROFILE is set
+
+# Folder to read the workbook and the extension list from
+exio_dir = os.getcwd() + '\\data\\exiobase_v3.7\\'
+iot_dir = exio_dir + 'IOT_'+ year +'_ixi\\'
+# Folder to write the pickle to
+pkl_dir = os.getcwd() + '\\data\\bg\\pickled_mrio\\'
+if not os.path.exists(pkl_dir):
+    os.makedirs(pkl_dir)
+
+##############################################
+# number of extensions, as in the load script
+step('read extensions')
+label_ext = pd.read_csv(iot_dir + 'satellite/unit.txt', sep='\t')
+n_ext = label_ext.shape[0]
+
+##############################################
+# characterisation factors
+step('characterisation')
+str_char = 'characterisation_DESIRE_version3.4_adapted.xlsx'
+char_key = [file_hash(exio_dir + str_char), n_ext]
+Q, label_char = build_characterisation(exio_dir + str_char, n_ext)
+save_characterisation(pkl_dir + 'characterisation.pkl', char_key, Q, label_char)
+
+tend = time.time()
+print('Characterisation factors of %d impacts stored in %5.2f s\n' % (Q.shape[0], tend - tstart))
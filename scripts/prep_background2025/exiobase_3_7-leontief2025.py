@@ -7,7 +7,7 @@ The Lancet Planetary Health
 
 Tasks exiobase_3_7-leontief.py:
 
-    1. Calculate Leontief inverse
+    1. Factorise the Leontief system (I - A), the inverse itself is never formed
     2. Store as pickle
 
 @author: Joao F. D. Rodrigues
@@ -15,6 +15,7 @@ minor additions by Michelle A. Steenmeijer
 """
 
 import numpy as np
+import scipy.sparse as sp
 import os
 import time
 import pickle as pkl
@@ -22,7 +23,8 @@ import sys
 np.set_printoptions(precision=2)
 
 tstart = time.time()
-year = '2016'
+year = os.environ.get('EXIO_YEAR', '2016')  # set by pipeline2025.py
+precision = os.environ.get('EXIO_PRECISION', 'float64')  # 'float32' stores the LU factors in single precision
 ##############################################
 ##############################################
 #TASK 1: Load Exiobase v3.7 and calibrate MRIO
@@ -39,10 +41,16 @@ else:
 # Folder to read MRIO from
 mrio_dir = os.getcwd() + '\\data\\bg\\pickled_mrio\\'
 
+# Scripts folder, for the LeontiefSolver in leontief2025.py
+sys.path.append(os.getcwd() + '\\scripts\\')
+from leontief2025 import LeontiefSolver, calc_density, report_sparsity
+from profile2025 import step  # spans recorded when EXIO_PROFILE is set
+
 
 ##############################################
 #Load MRIO
 
+step('read MRIO')
 tstart = time.time()
 
 mrio_str = 'exio' + year +'.pkl'  
@@ -55,19 +63,25 @@ print('Done reading in %5.2f s\n'% (tend - tstart))
 tstart = time.time()
 #Done reading in  0.80 s
 
-# Number of..
-nr = mrio['label']['region'].count()[0]  # number of regions
-ns = mrio['label']['industry'].count()[0]  # number of sectors
-
-# Leontief inverse calculation
-L = np.linalg.inv(np.eye(nr*ns) - mrio['A'])    
+# Factorisation of (I - A)
+step('factorise')
+print('Density of A: %6.4f\n' % calc_density(mrio['A']))
+# Uncomment to time the dense against the sparse path and find the crossover density
+#report_sparsity(mrio['A'], method = 'iterative')
+if sp.issparse(mrio['A']):
+    # sparse mode (see exiobase_3_7-load2025.py), GMRES on the sparse (I - A)
+    L = LeontiefSolver(mrio['A'], sparse = True, method = 'iterative')
+else:
+    # dense LU, or sparse LU if A is sparse enough
+    L = LeontiefSolver(mrio['A'], dtype = precision)
 
 tend = time.time()
-print('Done calculating Leontief inverse in %5.2f s\n'% (tend - tstart))
+print('Done factorising Leontief system in %5.2f s\n'% (tend - tstart))
 tstart = time.time()
 
 #############################################
 # save to pickle
+step('write pickle')
 mrio_str = 'leontief'+ year +'.pkl'  
 pkl_out = open(mrio_dir + mrio_str,"wb")
 pkl.dump(L, pkl_out)
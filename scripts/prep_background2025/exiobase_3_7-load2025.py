@@ -16,6 +16,7 @@ minor additions by Michelle A. Steenmeijer
 
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 import os
 import time
 import pickle as pkl
@@ -23,7 +24,8 @@ import sys
 np.set_printoptions(precision=2)
 tstart = time.time()
 
-year = '2016' # change this depending on the year of analysis
+year = os.environ.get('EXIO_YEAR', '2016') # change this depending on the year of analysis, or set EXIO_YEAR (see pipeline2025.py)
+sparse = os.environ.get('EXIO_SPARSE', '0') == '1' # store A and R as sparse (CSR) matrices, for the sparse solvers in leontief2025.py
 
 ##############################################
 ##############################################
@@ -68,9 +70,16 @@ mrio_dir = bg_dir + 'pickled_mrio\\'
 if not os.path.exists(mrio_dir):
     os.makedirs(mrio_dir)
 
+# Scripts folder, for the Exiobase reader in exioreader2025.py
+sys.path.append(os.getcwd() + '\\scripts\\')
+from exioreader2025 import read_exio_txt, build_characterisation, load_characterisation, save_characterisation
+from hashing2025 import file_hash
+from profile2025 import step  # spans recorded when EXIO_PROFILE is set
+
 
 ##############################################
 #Load categories
+step('read labels')
 
 # final demand list of categories
 str_fin = 'finaldemands.txt'  
@@ -143,114 +152,55 @@ str_char = 'characterisation_DESIRE_version3.4_adapted.xlsx'
 #There are apostrophes missing in entries 2-4
 #There are 1104 extensions in the characterization matrix, but 1113 in the extensions unit list. The extra 9 are appended at the end.
 
-Q_factorinputs = pd.read_excel(exio_dir + str_char, sheet_name = 'Q_factorinputs', index_col=[0,1], header=[0,1])
-
-Q_emissions = pd.read_excel(exio_dir + str_char, sheet_name = 'Q_emissions', index_col=[0,1,2,3], header=[0,1])
-
-Q_resources = pd.read_excel(exio_dir + str_char, sheet_name = 'Q_resources', index_col=[0,1], header=[0,1])
-
-Q_materials = pd.read_excel(exio_dir + str_char, sheet_name = 'Q_materials', index_col=[0,1], header=[0,1])
-
-# initial step that should be added to each
-# extension position to be in the right place:
-step_factorinputs = 0
-step_emissions = 23
-step_resources = 446
-step_materials = 466
-
-# build conversion factor matrix with selected
-# six themes and truncate extensions to only
-# those that matter
-# 6 themes - GWP100, Mat extr, Water use, LU, VA, Employment
-
-n_char = 6  
-Q = np.zeros((n_char, n_ext))
-Q_name = []
-Q_unit = []
-
-#GWP 100
-pos_gwp = 5  # position for impcat in characterisation table
-vtmp = np.array(Q_emissions.iloc[pos_gwp])  # select CFs for relevant impcat
-vpos = np.where(vtmp)[0]  # get indices number for which CF != 0
-Q[0, vpos + step_emissions]= vtmp[vpos]  # fill in CF for index in empty 6x1113 array
-Q_name.append(Q_emissions.index[pos_gwp][1])  # collect name of impact
-Q_unit.append(Q_emissions.index[pos_gwp][3])  # collect unit of impact
-
-# Abiotic material extraction
-pos_mat = 4  # position domestic extraction
-vtmp = np.array(Q_materials.iloc[pos_mat])
-vpos = np.where(vtmp)[0] #all positions v != 0
-Q[1,vpos + step_materials]= vtmp[vpos]
-Q_name.append(Q_materials.index[pos_mat][0])
-Q_unit.append(Q_materials.index[pos_mat][1])
-
-#Water use
-pos_water = 12
-vtmp = np.array(Q_materials.iloc[pos_water])
-vpos = np.where(vtmp)[0]
-Q[2,vpos + step_materials]= vtmp[vpos]
-Q_name.append(Q_materials.index[pos_water][0])
-Q_unit.append(Q_materials.index[pos_water][1])
-
-#Land use
-pos_land = 0
-vtmp = np.array(Q_resources.iloc[pos_land])
-vpos = np.where(vtmp)[0]
-Q[3,vpos + step_resources]= vtmp[vpos]
-Q_name.append(Q_resources.index[pos_land][0])
-Q_unit.append(Q_resources.index[pos_land][1])
-
-#Added value
-pos_gva = 0
-vtmp = np.array(Q_factorinputs.iloc[pos_gva])
-vpos = np.where(vtmp)[0]
-Q[4,vpos + step_factorinputs]= vtmp[vpos]
-Q_name.append(Q_factorinputs.index[pos_gva][0])
-Q_unit.append(Q_factorinputs.index[pos_gva][1])
-
-#Employment - eventually not used in the calculation
-pos_emp = 1
-vtmp = np.array(Q_factorinputs.iloc[pos_emp])
-vpos = np.where(vtmp)[0]
-Q[5,vpos + step_factorinputs]= vtmp[vpos]
-Q_name.append(Q_factorinputs.index[pos_emp][0])
-Q_unit.append(Q_factorinputs.index[pos_emp][1])
-
-Q_data = []
-for k in range(n_char):
-    Q_data.append([Q_name[k],Q_unit[k]]) 
-
-label_char = pd.DataFrame(index = list(range(n_char)), columns = ['Name', 'Unit'], data = Q_data)
+# Q and its labels do not depend on the year: they are built once by the stage
+# 'characterisation' of pipeline2025.py (exiobase_3_7-characterisation2025.py) and
+# reused while the characterisation workbook and the number of extensions are unchanged.
+# Without a usable cache (script run on its own, a corrupt file, another number of
+# extensions) Q is built here and the cache replaced atomically (save_characterisation)
+char_cache = mrio_dir + 'characterisation.pkl'
+step('characterisation')
+char_key = [file_hash(exio_dir + str_char), n_ext]
+char = load_characterisation(char_cache, char_key)
+if char is not None:
+    Q, label_char = char
+    print('Characterisation factors reused from ' + char_cache + '\n')
+else:
+    Q, label_char = build_characterisation(exio_dir + str_char, n_ext)
+    save_characterisation(char_cache, char_key, Q, label_char)
 
 #############################################
 #################################################
 #import numerical data
+step('read Y, F_hh and F')
 
+# Exiobase text files are parsed once each, with several threads (see exioreader2025.py)
 # final demand matrix
 Y_str = 'Y.txt'  
-Y_pd = pd.read_csv(iot_dir + Y_str, sep='\t', index_col=[0,1], header=[0,1])
-Y = np.array(Y_pd)
+Y, _, _ = read_exio_txt(iot_dir + Y_str, n_index = 2, n_header = 2)
 
 # household emissions
 H_str = 'satellite/F_hh.txt'  
-H_pd = pd.read_csv(iot_dir + H_str, sep='\t', index_col=[0], header=[0,1])
-H = np.array(H_pd)
+H, _, _ = read_exio_txt(iot_dir + H_str, n_index = 1, n_header = 2)
 
-# primary inputs and industry emissions # alleen de eerste 9 - employment niet meegenomen
+# primary inputs and industry emissions, read once
+# V: alleen de eerste 9 - employment niet meegenomen
 VR_str = 'satellite/F.txt'
-V_pd = pd.read_csv(iot_dir + VR_str, sep='\t', index_col=[0], header=[0,1]).iloc[pos_pri]
-V = np.array(V_pd)
-
-R_pd = pd.read_csv(iot_dir + VR_str, sep='\t', index_col=[0], header=[0,1])
-R = np.array(R_pd) #incl factor inputs/employment
+R, _, _ = read_exio_txt(iot_dir + VR_str, n_index = 1, n_header = 2)  #incl factor inputs/employment
+V = R[pos_pri].copy()
+if sparse:
+    R = sp.csr_matrix(R)
 
 tend = time.time()
 print('Done reading everything except intersectoral flows in %5.2f s\n'% (tend - tstart))
 tstart = time.time()
 
 # technical coefficients
+step('read A')
 A_str = 'A.txt'  
-A = np.array(pd.read_csv(iot_dir + A_str, sep='\t', index_col=[0,1], header=[0,1]))
+A, _, _ = read_exio_txt(iot_dir + A_str, n_index = 2, n_header = 2)
+if sparse:
+    A = sp.csr_matrix(A)
+print('Density of A: %6.4f' % (A.nnz / (A.shape[0] * A.shape[1]) if sparse else np.count_nonzero(A) / A.size))
 
 tend = time.time()
 print('Done reading technical coefficients in %5.2f s\n'% (tend - tstart))
@@ -267,6 +217,7 @@ mrio = {'Y': Y, 'A': A, 'V': V, 'R': R, 'H': H, 'Q': Q, 'label': label}
 
 #############################################
 # save to pickle
+step('write pickle')
 
 mrio_str = 'exio' + year + '.pkl'  
 pkl_out = open(mrio_dir + mrio_str,"wb")
@@ -14,6 +14,7 @@ minor additions by Michelle A. Steenmeijer
 """
 
 import numpy as np
+import scipy.sparse as sp
 import os
 import time
 import pickle as pkl
@@ -21,7 +22,7 @@ import sys
 np.set_printoptions(precision = 2)
 
 tstart = time.time()
-year = '2016'
+year = os.environ.get('EXIO_YEAR', '2016')  # set by pipeline2025.py
 ##############################################
 ##############################################
 #TASK 1: Load Exiobase v3.7 and calibrate MRIO
@@ -39,10 +40,16 @@ else:
 # Folder to read MRIO from
 mrio_dir = os.getcwd() + '\\data\\bg\\pickled_mrio\\'
 
+# Scripts folder, for calc_output and scale_columns in leontief2025.py
+sys.path.append(os.getcwd() + '\\scripts\\')
+from leontief2025 import scale_columns, calc_output
+from profile2025 import step  # spans recorded when EXIO_PROFILE is set
+
 
 ##############################################
 #Load MRIO
 
+step('read MRIO and Leontief system')
 tstart = time.time()
 
 mrio_str = 'exio'+ year +'.pkl'  
@@ -65,9 +72,14 @@ nr = mrio['label']['region'].count()[0]  # number of regions
 ns = mrio['label']['industry'].count()[0]  # number of sectors
 
 # Calculation x (total output)
-x = np.dot(L, mrio['Y'].sum(1).reshape((nr*ns,1)))    # x = L*y
+step('calculate x and Z')
+x = calc_output(L, mrio['A'], mrio['Y'])    # x = L*y, with A attached to L (not stored in the pickle)
+del L  # the LU factors are not needed anymore, release them before Z is allocated
+
 # Calculation Z matrix (intermediate demand matrix/transaction matrix)
-Z = np.dot(mrio['A'], np.diag(x[:,0]))  # Z = A*diagn(x)
+# Z = A*diag(x) as a column scaling: peak memory is A plus Z, no n x n diagonal
+# (sparse mode returns a CSR matrix, see exiobase_3_7-load2025.py)
+Z = scale_columns(mrio['A'], x[:,0])
 
 tend = time.time()
 print('Done calculating interindustry transactions in %5.2f s\n'% (tend - tstart))
@@ -78,9 +90,10 @@ mrio['x'] = x
 
 #############################################
 # save to pickle
+step('write pickle')
 mrio_str = 'mrio'+ year +'.pkl'  
 pkl_out = open(mrio_dir + mrio_str,"wb")
-pkl.dump(mrio, pkl_out)
+pkl.dump(mrio, pkl_out, protocol = 5)  # protocol 5 writes the arrays without an extra copy
 pkl_out.close()
 
 tend = time.time()
@@ -6,7 +6,7 @@ The Lancet Planetary Health
 
 Tasks exiobase_3_7-waste.py:
 
-    1. Import waste from excel
+    1. Import waste from excel (cached after the first run, see exioreader2025.py)
     2. Convert to dictionary and store as pickle
 
 @author: Joao F. D. Rodrigues
@@ -24,7 +24,7 @@ np.set_printoptions(precision=2)
 import sys
 tstart = time.time()
 
-year = '2016'
+year = os.environ.get('EXIO_YEAR', '2016')  # set by pipeline2025.py
 ##############################################
 ##############################################
 #TASK 1: Load data from excel
@@ -32,10 +32,10 @@ year = '2016'
 ##############################################
 # Folder settings: Change to reflect the location in your computer relative to the current working directory (run os.getcwd() to find out whatthat is)
 # Set working directory to envr-footprint-healthcare folder
-if str(os.getcwd()).endswith('envr-footprint-healthcare'):
+if str(os.getcwd()).endswith('envr-footprint-healthcare2025'):
     print("Starting to read files..\n")
 else:
-    print("Please set working directory to envr-footprint-healthcare folder")
+    print("Please set working directory to envr-footprint-healthcare2025 folder")
     sys.exit()
     
 # Folder to read Excel from
@@ -43,11 +43,19 @@ exio_dir = os.getcwd() + '\\data\\exiobase_v3.7\\'
 # Folder to write/read pickle 
 pkl_dir = os.getcwd() + '\\data\\bg\\pickled_mrio\\'
 
+# Scripts folder, for the cached sheets and the waste fill in exioreader2025.py
+sys.path.append(os.getcwd() + '\\scripts\\')
+from exioreader2025 import read_excel_cached, fill_waste
+from hashing2025 import file_hash
+from profile2025 import step  # spans recorded when EXIO_PROFILE is set
+
 ##############################################
 #Load Exiobase industry classification
 
-#Load rest of the system
-mrio_str = 'mrio' + year +'.pkl'  
+step('read labels')
+#Load labels of the system, from the output of the load script so that
+#this script can run alongside the Leontief and process scripts
+mrio_str = 'exio' + year +'.pkl'  
 pkl_in = open(pkl_dir + mrio_str,"rb")
 
 mrio = pkl.load(pkl_in)
@@ -61,6 +69,7 @@ del mrio
 
 ##############################################
 #Load source objects
+step('read waste sheets')
 
 tstart = time.time()
 
@@ -70,93 +79,39 @@ tstart = time.time()
 
 excel_str = 'MR_HSUT_2011_v3_3_17_extensions.xlsb'  
 
+#the parsed sheets are cached in pkl_dir\\waste_cache, keyed by the content
+#hash of the workbook; pyxlsb is only used when the workbook changes
+cache_dir = pkl_dir + 'waste_cache'
+digest = file_hash(exio_dir + excel_str)
+
 sheet_str = 'waste_sup_FD'  
-waste_final = pd.read_excel(exio_dir + excel_str, sheet_name = sheet_str, index_col=[0,1], header=[0,1,2,3], engine='pyxlsb')
+waste_final = read_excel_cached(exio_dir + excel_str, sheet_str, cache_dir, index_col=[0,1], header=[0,1,2,3], digest = digest)
 
 sheet_str = 'waste_from_stock'  
-waste_tmp = pd.read_excel(exio_dir + excel_str, sheet_name = sheet_str, index_col=[0,1], header=[0,1,2,3], engine='pyxlsb')
+waste_tmp = read_excel_cached(exio_dir + excel_str, sheet_str, cache_dir, index_col=[0,1], header=[0,1,2,3], digest = digest)
 waste_final = waste_final + waste_tmp
 
 sheet_str = 'waste_sup_act'  
-waste_industry = pd.read_excel(exio_dir + excel_str, sheet_name = sheet_str, index_col=[0,1], header=[0,1,2,3], engine='pyxlsb')
+waste_industry = read_excel_cached(exio_dir + excel_str, sheet_str, cache_dir, index_col=[0,1], header=[0,1,2,3], digest = digest)
+
+tend = time.time()
+print('Done reading in %5.2f s\n'% (tend - tstart))
+tstart = time.time()
 
 ##############################################
 # this SUT has 164 industries, 48 countries, 6 final demand categories
 # Processing to correspond with Exiobase v3.7  163 industries 49 countries, 7 final demand categories
 
-# Fill in right places
-nreg = region.shape[0]
-nreg_waste = nreg - 1
-nfin = final.shape[0]
-nfin_waste = nfin - 1
-nind = industry.shape[0]
-nind_waste = nind + 1
-
-#position of regions
-print('concordance of regions')
-reg_exio = list(region.index)
-reg_pos = -1 * np.ones((nreg_waste,1))
-
-reg_waste = []
-reg_waste_alt = []
-for i in range(nreg_waste):
-    val = waste_final.columns[i * nfin_waste][0]
-    print(val)
-    reg_waste.append(val)
-    pos = reg_exio.index(val)
-    reg_pos[i] = pos
-    val_alt = waste_industry.columns[i * nind_waste][0]
-    reg_waste_alt.append(val_alt)
-    if(val_alt != val):
-        print(i, val, val_alt)
-
-
-#position of industries
-print('concordance of industries')
-ind_exio = list(industry.index)
-ind_pos = -1 * np.ones((nind_waste,1))
-
-ind_waste = []
-for i in range(nind_waste):
-    val = waste_industry.columns[i][3]
-    ind_waste.append(val)
-    if(val == 'A_MGWG'):
-        ind_pos[i] = 109
-    else:     
-        try:
-            pos = ind_exio.index(val)
-            ind_pos[i] = pos
-        except:
-            print(i, val)
-
-#109 A_MGWG
-#In [85]: waste_industry.columns[i]
-#Out[85]: ('AU', 'Manufacture of gas;', 'i40.2.a', 'A_MGWG')
-
-#A_GASD   Manufacture of gas; distribution of gaseous fu...     i40.2
-#In [92]: ind_exio.index('A_GASD')
-#Out[92]: 109
-
-# Fill in values: final demand
-h = np.zeros((1, nreg * nfin))
-for i in range(nreg_waste):
-    for j in range(nfin_waste):
-        val = waste_final.iloc[:, i * nfin_waste + j].sum()
-        ipos = int(reg_pos[i])
-        jpos = int(j)
-        h[0, ipos * nfin + jpos] = val
-
-# Fill in values: industry
-r = np.zeros((1, nreg*nind))
-for i in range(nreg_waste):
-    for j in range(nind_waste):
-        val = waste_industry.iloc[:,i * nind_waste + j].sum()
-        ipos = int(reg_pos[i])
-        jpos = int(ind_pos[j])
-        r[0,ipos * nind + jpos] = val
+# Fill in right places (one scatter per sheet, see fill_waste in exioreader2025.py)
+step('fill waste extension')
+h, r = fill_waste(waste_final, waste_industry, region, final, industry)
+
+tend = time.time()
+print('Done filling in waste extension in %5.2f s\n'% (tend - tstart))
 
 ##############################################
 #Save as pickle
+step('write pickle')
 
 label = {'region': region, 'industry': industry, 'final': final, 'unit': 'tonne'}
 
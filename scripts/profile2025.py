@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks profile2025.py:
+
+    1. Record nested spans (wall time, CPU time, peak traced memory, RSS and the
+       sizes of the arrays involved) in the prep scripts, createBackground, the
+       footprint calculations, the aggregation and the report writers
+    2. Store the spans of every process as JSON, merge them into one Chrome
+       trace (chrome://tracing or https://ui.perfetto.dev) and summarise or
+       compare runs
+
+Profiling is off unless it is switched on, the spans then cost one check:
+
+    set EXIO_PROFILE=output\\profile          (before the prep scripts, pipeline2025.py or main2025.py)
+    python scripts/profile2025.py output/profile --trace output/profile.trace.json
+    python scripts/profile2025.py output/profile --compare output/profile_old
+
+or from Python with enable('output/profile') / enable('run.trace.json').
+Every process writes <script>-<pid>.json to the profile folder when it exits.
+
+CPU time is that of the whole process (all BLAS threads), so CPU/wall shows how
+well a span is parallelised. The traced peak is the largest memory allocated
+through Python and numpy (tracemalloc) while the span was open; RSS is read
+when the span closes, together with the high-water mark of the process.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import platform
+import threading
+import functools
+import tracemalloc
+import argparse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+##############################################
+# Process state
+##############################################
+
+class _State:
+    enabled = False
+    path = None
+    memory = True
+    records = []
+    meta = {}
+    root = None  # span of the whole script
+    step = None  # current step of the script (see step)
+    lock = threading.Lock()
+    local = threading.local()
+
+_state = _State()
+
+def _stack():
+    if not hasattr(_state.local, 'stack'):
+        _state.local.stack = []
+    return _state.local.stack
+
+# Resident set size of the process now and at its maximum, in MB (None if unknown)
+def _rss():
+    now = None
+    try:
+        with open('/proc/self/statm') as f:
+            now = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        try:
+            import psutil
+            now = psutil.Process().memory_info().rss / 2**20
+        except ImportError:
+            pass
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / 2**20 if sys.platform == 'darwin' else peak / 2**10  # bytes on macOS, kB on Linux
+    return now, peak
+
+# Threads of the BLAS libraries loaded by numpy
+def _blas_threads():
+    try:
+        from threadpoolctl import threadpool_info
+        return [{'library': p.get('internal_api'), 'threads': p.get('num_threads')} for p in threadpool_info()]
+    except ImportError:
+        return {k: os.environ[k] for k in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'] if k in os.environ}
+
+# Shapes of the array arguments of a call, as span attributes
+def _sizes(args, kwargs):
+    sizes = {}
+    for (k, a) in list(enumerate(args)) + list(kwargs.items()):
+        shape = getattr(a, 'shape', None)
+        if isinstance(shape, tuple):
+            sizes['arg%s' % k if isinstance(k, int) else k] = list(shape)
+    return sizes
+
+
+##############################################
+# Spans
+##############################################
+
+class Span:
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.peak = 0
+
+    # attributes known inside the span, e.g. span.set(rows = len(df))
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        if _state.memory and tracemalloc.is_tracing():
+            # the peak so far belongs to the enclosing span, start a new one
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        self.c0 = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.t0
+        cpu = time.process_time() - self.c0
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if _state.memory and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, self.peak)
+            tracemalloc.reset_peak()
+        rss, maxrss = _rss()
+        path = [self.name]
+        p = self.parent
+        while p is not None:
+            path.insert(0, p.name)
+            p = p.parent
+        record = {'name': self.name, 'path': '/'.join(path), 'depth': self.depth, 'pid': os.getpid(),
+                  'tid': threading.get_ident(), 'start': self.start, 'wall': wall, 'cpu': cpu,
+                  'peak_traced_mb': self.peak / 2**20 if _state.memory else None,
+                  'rss_mb': rss, 'maxrss_mb': maxrss, 'attrs': self.attrs}
+        with _state.lock:
+            _state.records.append(record)
+        return False
+
+
+class _NullSpan:
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_null = _NullSpan()
+
+# Span around a block: with span('write', sheet = 'full'): ...
+def span(name, **attrs):
+    if not _state.enabled:
+        return _null
+    return Span(name, attrs)
+
+# Span around every call of a function, with the shapes of its array arguments
+def traced(name=None):
+    def decorate(f):
+        label = name or f.__qualname__
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return f(*args, **kwargs)
+            with Span(label, _sizes(args, kwargs)):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Next step of a script: closes the previous step and opens a new span, so the
+# prep scripts and main2025.py only need one line per task
+def step(name, **attrs):
+    if not _state.enabled:
+        return
+    end_step()
+    _state.step = Span(name, attrs).__enter__()
+
+def end_step():
+    if _state.step is not None:
+        _state.step.__exit__(None, None, None)
+        _state.step = None
+
+
+##############################################
+# Switch and output
+##############################################
+
+# Start recording; path is a folder (one <script>-<pid>.json per process),
+# a .json file or a .trace.json file (Chrome trace)
+#   memory: trace allocations with tracemalloc (slows down code that makes many small objects)
+def enable(path, memory=True):
+    if _state.enabled:
+        return
+    _state.enabled = True
+    _state.path = path
+    _state.memory = memory
+    _state.records = []
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+    _state.meta = {'script': script, 'argv': sys.argv, 'pid': os.getpid(), 'host': platform.node(),
+                   'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+                   'year': os.environ.get('EXIO_YEAR'), 'start': time.time()}
+    try:
+        import numpy as np
+        _state.meta['numpy'] = np.__version__
+    except ImportError:
+        pass
+    _state.meta['blas'] = _blas_threads()
+    _state.root = Span(script, {}).__enter__()
+    atexit.register(dump)
+
+# Stop recording and write the spans
+def disable():
+    if _state.enabled:
+        dump()
+        _state.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+def records():
+    return list(_state.records)
+
+# Write the spans recorded so far (open spans are closed first)
+def dump(path=None):
+    if not _state.enabled:
+        return None
+    end_step()
+    if _state.root is not None:
+        _state.root.__exit__(None, None, None)
+        _state.root = None
+    path = path or _state.path
+    data = {'meta': _state.meta, 'spans': records()}
+    if path.endswith('.trace.json'):
+        data = to_chrome([data])
+    elif not path.endswith('.json'):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        path = os.path.join(path, '%s-%d.json' % (_state.meta['script'], os.getpid()))
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return path
+
+# Runs (dictionaries with meta and spans) of a .json file or of all files in a folder
+def load_runs(path):
+    files = [path] if os.path.isfile(path) else [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.json') and not f.endswith('.trace.json')]
+    runs = []
+    for fname in files:
+        with open(fname) as f:
+            runs.append(json.load(f))
+    return runs
+
+# Chrome trace of several runs, one process row per run
+def to_chrome(runs):
+    events = []
+    for run in runs:
+        pid = run['meta']['pid']
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': run['meta']['script']}})
+        for s in run['spans']:
+            args = dict(s['attrs'], cpu_s=s['cpu'], peak_traced_mb=s['peak_traced_mb'], rss_mb=s['rss_mb'], maxrss_mb=s['maxrss_mb'])
+            events.append({'name': s['name'], 'cat': run['meta']['script'], 'ph': 'X', 'ts': s['start'] * 1e6,
+                           'dur': s['wall'] * 1e6, 'pid': pid, 'tid': s['tid'], 'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'runs': [r['meta'] for r in runs]}}
+
+# Totals per span path: calls, wall and CPU time, largest traced peak and RSS
+def summary(runs):
+    import pandas as pd
+    rows = []
+    for run in runs:
+        for s in run['spans']:
+            rows.append({'script': run['meta']['script'], 'path': s['path'], 'wall': s['wall'], 'cpu': s['cpu'],
+                         'peak_traced_mb': s['peak_traced_mb'], 'maxrss_mb': s['maxrss_mb']})
+    df = pd.DataFrame(rows, columns=['script', 'path', 'wall', 'cpu', 'peak_traced_mb', 'maxrss_mb'])
+    return df.groupby(['script', 'path']).agg(calls=('wall', 'size'), wall=('wall', 'sum'), cpu=('cpu', 'sum'),
+                                                peak_traced_mb=('peak_traced_mb', 'max'), maxrss_mb=('maxrss_mb', 'max'))
+
+# Summary of a run next to that of an earlier run, with the ratio of the wall times
+def compare(runs, base_runs):
+    new = summary(runs)
+    old = summary(base_runs)
+    df = new[['wall', 'peak_traced_mb']].join(old[['wall', 'peak_traced_mb']], how='outer', rsuffix='_base')
+    df['wall_ratio'] = df['wall'] / df['wall_base']
+    return df
+
+
+if os.environ.get('EXIO_PROFILE') and __name__ != '__main__':
+    enable(os.environ['EXIO_PROFILE'], os.environ.get('EXIO_PROFILE_MEMORY', '1') == '1')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarise the spans recorded with EXIO_PROFILE')
+    parser.add_argument('path', help='profile folder or .json file')
+    parser.add_argument('--trace', default=None, help='write a Chrome trace (.trace.json) of all runs')
+    parser.add_argument('--compare', default=None, help='profile folder of an earlier run')
+    args = parser.parse_args()
+
+    import pandas as pd
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_rows', 500)
+    pd.set_option('display.max_columns', 20)
+    runs = load_runs(args.path)
+    if args.compare:
+        print(compare(runs, load_runs(args.compare)).round(3))
+    else:
+        print(summary(runs).round(3))
+    if args.trace:
+        with open(args.trace, 'w') as f:
+            json.dump(to_chrome(runs), f)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks scenarios2025.py:
+
+    1. Resolve (region, sector, impact, stimulus) labels to positions once
+    2. Apply scenario edits to B, Ystim and A as vectorised scatter operations
+    3. Evaluate many B/Y scenarios in one batch against the cached baseline
+
+Edits set absolute values, as in adapt_B/adapt_Ystim/adapt_A:
+    B edits: (impact, region, sector, value)
+    Y edits: (region, sector, stimulus column, value), columns 'HC', 'Pharm', 'Appl';
+             Tot is always HC + Pharm + Appl and is not edited directly
+    A edits: (region, sector, region, sector, value)
+For a batch of scenarios with B' = B + dB and y' = y + dy the footprint is
+    B' L y' = M y + M dy + dB (L y + L dy)
+with M = B L and L y from the baseline, and one multi-column solve for all dy.
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from leontief2025 import leontief_solve
+
+
+# Columns of Ystim, the first is the sum of the other three
+stim_labels = ['Tot', 'HC', 'Pharm', 'Appl']
+
+
+##############################################
+# Label index
+##############################################
+
+# Positions of (region, sector) pairs, impact labels and stimulus columns.
+# pandas builds the hash tables on first lookup and keeps them with the index.
+class ScenarioIndex:
+
+    def __init__(self, multiindex, char_labels, stim=stim_labels):
+        self.sectors = multiindex
+        self.impacts = pd.Index(char_labels)
+        self.stim = pd.Index(stim)
+
+    def _check(self, pos, keys, what):
+        if (pos < 0).any():
+            missing = [keys[k] for k in np.where(pos < 0)[0]]
+            raise KeyError('Unknown %s: %s' % (what, missing[:5]))
+        return pos
+
+    def sector_pos(self, regions, sectors):
+        keys = list(zip(regions, sectors))
+        return self._check(self.sectors.get_indexer(keys), keys, '(region, sector)')
+
+    def impact_pos(self, impacts):
+        keys = list(impacts)
+        return self._check(self.impacts.get_indexer(keys), keys, 'impact')
+
+    def stim_pos(self, cols):
+        keys = list(cols)
+        return self._check(self.stim.get_indexer(keys), keys, 'stimulus column')
+
+
+##############################################
+# Scatter edits
+##############################################
+
+def _fields(edits, n):
+    return [[x[k] for x in edits] for k in range(n)]
+
+# Copy of B with the edits (impact, region, sector, value) applied
+def scatter_B(B, idx, edits):
+    B = np.array(B)
+    if len(edits) > 0:
+        imp, reg, sec, val = _fields(edits, 4)
+        B[idx.impact_pos(imp), idx.sector_pos(reg, sec)] = val
+    return B
+
+# Positions of the edited stimulus columns; an edit of Tot is rejected, as Tot is
+# recomputed from the other columns (scatter_Ystim) or follows their changes (calc_scenarios)
+def _edit_stim_pos(idx, cols):
+    c = idx.stim_pos(cols)
+    if (c == 0).any():
+        raise ValueError('Stimulus column %s is the sum of %s, edit those instead' % (idx.stim[0], list(idx.stim[1:])))
+    return c
+
+# Copy of Ystim with the edits (region, sector, column, value) applied, Tot = HC + Pharm + Appl after the scatter
+def scatter_Ystim(Ystim, idx, edits):
+    Y = np.array(Ystim)
+    if len(edits) > 0:
+        reg, sec, col, val = _fields(edits, 4)
+        Y[idx.sector_pos(reg, sec), _edit_stim_pos(idx, col)] = val
+        Y[:, 0] = Y[:, 1:].sum(1)
+    return Y
+
+# Copy of A with the edits (region, sector, region, sector, value) applied
+def scatter_A(A, idx, edits):
+    if len(edits) == 0:
+        return A.copy()
+    reg0, sec0, reg1, sec1, val = _fields(edits, 5)
+    rows = idx.sector_pos(reg0, sec0)
+    cols = idx.sector_pos(reg1, sec1)
+    if sp.issparse(A):
+        A = A.tolil()
+        for (i, j, v) in zip(rows, cols, val):
+            A[i, j] = v
+        return A.tocsr()
+    A = np.array(A)
+    A[rows, cols] = val
+    return A
+
+
+##############################################
+# Batch evaluation of B/Y scenarios
+##############################################
+
+# Tidy table of edits: one row per (scenario, position), last edit of a position wins
+def _edit_table(scenarios, key, names):
+    rows = []
+    for s, name in enumerate(names):
+        for x in scenarios[name].get(key, []):
+            rows.append((s,) + tuple(x))
+    return rows
+
+# Footprint of every scenario for one stimulus column
+#   scenarios: {name: {'B': [B edits], 'Y': [Y edits]}}
+#   stim: stimulus column evaluated; Tot = HC + Pharm + Appl, as in scatter_Ystim, so it
+#         changes with the Y edits of all three columns
+# Returns a DataFrame with one row per scenario (plus 'baseline') and one column per impact
+def calc_scenarios(bg, idx, scenarios, stim='Tot'):
+    names = list(scenarios.keys())
+    nscen = len(names)
+    B = np.asarray(bg['B'], dtype=np.float64)
+    M = np.asarray(bg['M'], dtype=np.float64)
+    k = idx.stim_pos([stim])[0]
+    y = np.asarray(bg['Ystim'][:, k], dtype=np.float64)
+    x = leontief_solve(bg['L'], y)
+    base = M @ y
+
+    # changes in final demand, n x nscen, and the resulting changes in output
+    dY = np.zeros((len(y), nscen))
+    edits = _edit_table(scenarios, 'Y', names)
+    if edits:
+        df = pd.DataFrame(edits, columns=['s', 'reg', 'sec', 'col', 'val'])
+        df['pos'] = idx.sector_pos(df['reg'], df['sec'])
+        df['c'] = _edit_stim_pos(idx, df['col'])
+        df = df.drop_duplicates(['s', 'pos', 'c'], keep='last')
+        if k != 0:
+            df = df[df['c'] == k]
+        old = np.asarray(bg['Ystim'])[df['pos'].values, df['c'].values]
+        np.add.at(dY, (df['pos'].values, df['s'].values), df['val'].values - old)
+    used = np.where(np.abs(dY).sum(0) > 0)[0]
+    dX = np.zeros(dY.shape)
+    if len(used) > 0:
+        dX[:, used] = leontief_solve(bg['L'], dY[:, used])
+    tot = base[:, None] + M @ dY
+
+    # changes in coefficients, applied to the output of each scenario
+    edits = _edit_table(scenarios, 'B', names)
+    if edits:
+        df = pd.DataFrame(edits, columns=['s', 'imp', 'reg', 'sec', 'val'])
+        df['q'] = idx.impact_pos(df['imp'])
+        df['pos'] = idx.sector_pos(df['reg'], df['sec'])
+        df = df.drop_duplicates(['s', 'q', 'pos'], keep='last')
+        q, pos, s = df['q'].values, df['pos'].values, df['s'].values
+        dB = df['val'].values - B[q, pos]
+        np.add.at(tot, (q, s), dB * (x[pos] + dX[pos, s]))
+
+    res = pd.DataFrame(np.concatenate((base[None, :], tot.T)), index=['baseline'] + names, columns=idx.impacts)
+    res.index.name = 'scenario'
+    return res
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks service2025.py:
+
+    1. Keep a background (multipliers M, B and the factorised Leontief system)
+       in memory and answer footprint, contribution and hotspot queries for
+       arbitrary demand vectors, with an LRU cache of recent queries
+    2. Serve the queries as JSON over localhost HTTP or a Unix socket (asyncio,
+       no packages beyond the standard library); the solves run in a worker
+       thread, so the event loop keeps accepting and answering (cached)
+       requests while a query is computed
+
+Start the service from the envr-footprint-healthcare2025 folder after the
+background is stored (createBackground or pipeline2025.py):
+
+    python scripts/service2025.py --year 2016 --port 8765
+    python scripts/service2025.py --year 2016 --socket /tmp/footprint.sock
+
+Requests (POST with a JSON body, GET for /info):
+
+    /info        impacts, regions, sectors, stimulus columns and cache statistics
+    /footprint   {"demand": ...}                       totals per impact
+    /contrib     {"demand": ..., "by": ..., "top": 20}  contribution analysis
+    /hotspot     {"demand": ..., "by": ..., "top": 20}  hotspot analysis
+
+The demand (MEUR) is the sum of its parts, all optional:
+
+    {"stimulus": {"Tot": 1.0},                     columns of bg['Ystim'] times a factor
+     "add": [["NLD", "C_PHAR", 100.0], ...],       extra demand for single products
+     "vector": [...]}                              full demand vector (n values)
+
+"by" is 'region' or 'sector' for totals per region/sector of the breakdown,
+without it the "top" largest positions of every impact are returned. The
+queries can be answered without a server by FootprintService.query (offline).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+import numpy as np
+
+
+##############################################
+# Footprint queries
+##############################################
+
+class FootprintModel:
+
+    #   bg: background (dictionary or Background from load_background)
+    # The multipliers, B and the Leontief solver are read once, further queries
+    # only multiply or solve with the demand vector
+    def __init__(self, bg):
+        from leontief2025 import leontief_solve
+        self._solve = leontief_solve
+        label = bg['label']
+        self.regions = [str(r) for r in label['region']['ISO3']]
+        self.sectors = [str(s) for s in label['industry'].index]
+        self.impacts = [str(n) + ' (' + str(u) + ')' for (n, u) in zip(label['characterization']['Name'], label['characterization']['Unit'])]
+        self.stimulus = ['Tot', 'HC', 'Pharm', 'Appl']
+        self.M = np.asarray(bg['M'], dtype=np.float64)
+        self.B = np.asarray(bg['B'], dtype=np.float64)
+        self.L = bg['L']
+        self.Ystim = np.asarray(bg['Ystim'], dtype=np.float64)
+        self.n = self.M.shape[1]
+        self._reg_pos = {r: k for (k, r) in enumerate(self.regions)}
+        self._sec_pos = {s: k for (k, s) in enumerate(self.sectors)}
+
+    def info(self):
+        return {'impacts': self.impacts, 'regions': self.regions, 'sectors': self.sectors,
+                'stimulus': self.stimulus, 'n': self.n}
+
+    # Demand vector of a query (see the module docstring), ValueError/KeyError for bad input
+    def demand(self, spec):
+        y = np.zeros(self.n)
+        for (name, f) in spec.get('stimulus', {}).items():
+            if name not in self.stimulus:
+                raise KeyError('Unknown stimulus %s, choose from %s' % (name, self.stimulus))
+            y += float(f) * self.Ystim[:, self.stimulus.index(name)]
+        for (reg, sec, val) in spec.get('add', []):
+            if reg not in self._reg_pos or sec not in self._sec_pos:
+                raise KeyError('Unknown region/sector %s %s' % (reg, sec))
+            y[self._reg_pos[reg] * len(self.sectors) + self._sec_pos[sec]] += float(val)
+        if 'vector' in spec:
+            v = np.asarray(spec['vector'], dtype=np.float64)
+            if v.shape != (self.n,):
+                raise ValueError('Demand vector must have %d values' % self.n)
+            y += v
+        return y
+
+    def footprint(self, y):
+        tot = np.dot(self.M, y)
+        return {'impacts': self.impacts, 'total': tot.tolist()}
+
+    # impacts x positions of the contribution (M * y) or hotspot (B * (L y)) analysis
+    def breakdown(self, kind, y):
+        if kind == 'contrib':
+            return self.M * y
+        x = np.asarray(self._solve(self.L, y.reshape((-1, 1))), dtype=np.float64)[:, 0]
+        return self.B * x
+
+    # Breakdown summed by region or sector, or the largest positions of every impact
+    def summarise(self, R, by=None, top=20):
+        tot = R.sum(1)
+        if by in ['region', 'sector']:
+            R3 = R.reshape((R.shape[0], len(self.regions), len(self.sectors)))
+            names = self.regions if by == 'region' else self.sectors
+            vals = R3.sum(2) if by == 'region' else R3.sum(1)
+            return {'impacts': self.impacts, 'total': tot.tolist(), by: names, 'values': vals.tolist()}
+        if by is not None:
+            raise ValueError('by must be region or sector')
+        out = {}
+        for (q, name) in enumerate(self.impacts):
+            pos = np.argsort(-np.abs(R[q]), kind='stable')[:int(top)]
+            out[name] = [{'ISO3': self.regions[k // len(self.sectors)], 'SecTxtCode': self.sectors[k % len(self.sectors)],
+                          'value': float(R[q, k]), 'share': float(R[q, k] / tot[q]) if tot[q] != 0 else None} for k in pos]
+        return {'impacts': self.impacts, 'total': tot.tolist(), 'top': out}
+
+
+class FootprintService:
+
+    #   model: FootprintModel
+    #   cache: number of recent query results kept (LRU)
+    # The products and solves run one at a time in a worker thread: BLAS already uses
+    # all cores for each of them, and some OpenBLAS builds crash on concurrent calls
+    def __init__(self, model, cache=256):
+        self.model = model
+        self.cache_size = cache
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.pending = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    # Result of one query, computed without the cache (can be called offline)
+    def compute(self, kind, body):
+        if kind == 'info':
+            return dict(self.model.info(), cache={'size': len(self.cache), 'max': self.cache_size, 'hits': self.hits, 'misses': self.misses})
+        y = self.model.demand(body.get('demand', {}))
+        if kind == 'footprint':
+            return self.model.footprint(y)
+        if kind in ['contrib', 'hotspot']:
+            return self.model.summarise(self.model.breakdown(kind, y), body.get('by'), body.get('top', 20))
+        raise KeyError('Unknown query %s' % kind)
+
+    # Cached query; identical queries that arrive while one is computed wait for its result
+    async def query(self, kind, body=None):
+        body = body or {}
+        if kind == 'info':
+            return self.compute(kind, body)
+        key = json.dumps([kind, body], sort_keys=True)
+        if key in self.cache:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if key in self.pending:
+            self.hits += 1
+            return await asyncio.shield(self.pending[key])
+        self.misses += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self.compute, kind, body)
+        self.pending[key] = future
+        try:
+            result = await future
+        finally:
+            del self.pending[key]
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    ##############################################
+    # HTTP over asyncio streams
+
+    async def handle(self, reader, writer):
+        try:
+            status, result = await self._respond(reader)
+        except Exception as e:  # malformed request
+            status, result = 400, {'error': str(e)}
+        payload = json.dumps(result).encode()
+        head = 'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n' % (status, 'OK' if status == 200 else 'Error', len(payload))
+        writer.write(head.encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    async def _respond(self, reader):
+        request = (await reader.readline()).decode().split()
+        if len(request) < 2:
+            return 400, {'error': 'Bad request'}
+        method, path = request[0], request[1]
+        length = 0
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            (name, _, value) = line.partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        body = json.loads(await reader.readexactly(length)) if length else {}
+        kind = path.strip('/')
+        if kind not in ['info', 'footprint', 'contrib', 'hotspot']:
+            return 404, {'error': 'Unknown path %s' % path}
+        try:
+            t0 = time.perf_counter()
+            result = await self.query(kind, body)
+            return 200, dict(result, seconds=time.perf_counter() - t0)
+        except (KeyError, ValueError, TypeError) as e:
+            return 400, {'error': str(e.args[0]) if e.args else str(e)}
+
+    # Server on localhost:port or on a Unix socket
+    async def start(self, port=8765, socket_path=None):
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self.handle, path=socket_path)
+        return await asyncio.start_server(self.handle, host='127.0.0.1', port=port)
+
+
+##############################################
+# Client
+##############################################
+
+# One request to a running service, returns the decoded JSON
+async def request(path, body=None, port=8765, socket_path=None):
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    method = 'POST' if body is not None else 'GET'
+    writer.write(('%s /%s HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % (method, path.strip('/'), len(payload))).encode() + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+# Same, for use outside of asyncio code (e.g. from main2025.py or a notebook)
+def query(path, body=None, port=8765, socket_path=None):
+    return asyncio.run(request(path, body, port, socket_path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Footprint service, keeps the background in memory')
+    parser.add_argument('--root', default=os.getcwd(), help='envr-footprint-healthcare2025 folder')
+    parser.add_argument('--year', default='2016')
+    parser.add_argument('--port', type=int, default=8765, help='localhost port')
+    parser.add_argument('--socket', default=None, help='Unix socket path, instead of the port')
+    parser.add_argument('--cache', type=int, default=256, help='query results kept')
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(args.root, 'scripts'))
+    from background2025 import load_background
+
+    tstart = time.time()
+    service = FootprintService(FootprintModel(load_background(os.path.join(args.root, 'data', 'bg', ''), args.year)), args.cache)
+    print('Background loaded in %5.2f s\n' % (time.time() - tstart))
+
+    async def main():
+        server = await service.start(args.port, args.socket)
+        print('Serving on %s' % (args.socket or '127.0.0.1:%d' % args.port))
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
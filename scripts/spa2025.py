@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks spa2025.py:
+
+    1. Structural path analysis of the stimulus (a column of Ystim)
+    2. Return the top-k supply-chain paths per impact category, with their share of the total
+    3. Production-tier decomposition: the footprint of tier k (k = 0 the sectors
+       bought by the stimulus, k = 1 their direct suppliers, ...) is B * A^k * y,
+       with contribution and hotspot breakdowns per tier
+
+A path i0 <- i1 <- ... <- ik starts at a sector i0 bought by the stimulus y and
+goes upstream through the suppliers; its value for impact q is
+    B[q, ik] * A[ik, ik-1] * ... * A[i1, i0] * y[i0]
+The sum of all paths starting with a given path is bounded by
+    M[q, ik] * A[ik, ik-1] * ... * A[i1, i0] * y[i0]
+with M = B * L the multipliers. Paths are expanded best-first on this bound
+(heapq), and a branch is dropped as soon as its bound falls below the
+threshold (tol times the total footprint, or the k-th best path found so far).
+For non-negative A, B and y no path above the threshold is missed.
+
+The tiers are the terms of the power series L = I + A + A^2 + ..., computed with
+products of A and a few vectors (x_k = A x_(k-1) for the hotspots, B A^k = (B A^(k-1)) A
+for the contributions) until the tail of the series falls below tol times the
+footprint. The tail is M y minus the tiers when the multipliers M are given, and
+a geometric estimate from the decay of the tiers otherwise, so calc_tiers also
+gives the footprint without L (e.g. for a new A before it is factorised).
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import heapq
+from leontief2025 import refine_chunk
+
+
+##############################################
+# Structural path analysis
+##############################################
+
+# Top-k paths of one impact category
+#   q: row of B (impact category)
+#   y: stimulus vector (e.g. bg['Ystim'][:, 0])
+#   A: technical coefficients, preferably CSC (see spa_table)
+#   tol: paths and branches below tol * total are not expanded
+#   max_depth: number of upstream steps of the longest path
+#   max_expand: limit on the number of nodes taken from the queue
+# Returns (total, [(value, path), ...]) with path a tuple of positions i0, i1, ..., ik
+def calc_spa(A, B, M, y, q, k=20, tol=1e-4, max_depth=8, max_expand=200000):
+    A = sp.csc_matrix(A)
+    b = np.asarray(B[q], dtype=np.float64)
+    m = np.asarray(M[q], dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    total = np.dot(m, y)
+    thr = tol * abs(total)
+
+    # queue of branches: (-bound, counter, demand flowing into the last node, path)
+    queue = []
+    roots = np.where(y != 0)[0]
+    for (c, i) in enumerate(roots):
+        if m[i] * y[i] >= thr:
+            queue.append((-m[i] * y[i], c, y[i], (i,)))
+    heapq.heapify(queue)
+    counter = len(roots)
+
+    top = []  # min-heap of the k best paths: (value, counter, path)
+    nexpand = 0
+    while queue and nexpand < max_expand:
+        bound, _, f, path = heapq.heappop(queue)
+        if -bound < thr:
+            break
+        nexpand += 1
+        node = path[-1]
+
+        value = b[node] * f
+        if value >= thr:
+            heapq.heappush(top, (value, counter, path))
+            counter += 1
+            if len(top) > k:
+                heapq.heappop(top)
+            if len(top) == k:
+                thr = max(thr, top[0][0])
+
+        if len(path) <= max_depth:
+            lo, hi = A.indptr[node], A.indptr[node + 1]
+            rows = A.indices[lo:hi]
+            fchild = A.data[lo:hi] * f
+            bounds = m[rows] * fchild
+            keep = np.where(bounds >= thr)[0]
+            for j in keep:
+                heapq.heappush(queue, (-bounds[j], counter, fchild[j], path + (rows[j],)))
+                counter += 1
+
+    paths = sorted([(v, p) for (v, _, p) in top], key=lambda x: -x[0])
+    return total, paths
+
+
+# Top-k paths for several impact categories as a table
+#   bg: background (A, B and M are used)
+#   y: stimulus vector, e.g. bg['Ystim'][:, 0]
+#   multiindex: (region, sector) of the 7987 positions, used for the path labels
+#   char_labels: labels of the impact categories (rows of B)
+#   impacts: labels to analyse, all when None
+# Returns a DataFrame with one row per (impact, rank): value, share of the total, depth and path
+def spa_table(bg, y, multiindex, char_labels, impacts=None, k=20, tol=1e-4, max_depth=8):
+    A = sp.csc_matrix(bg['A'])  # one conversion, columns are read when a node is expanded
+    impacts = list(char_labels) if impacts is None else impacts
+    rows = []
+    for label in impacts:
+        q = list(char_labels).index(label)
+        total, paths = calc_spa(A, bg['B'], bg['M'], y, q, k, tol, max_depth)
+        for (rank, (value, path)) in enumerate(paths):
+            names = ' <- '.join(['%s/%s' % multiindex[i] for i in path])
+            rows.append([label, rank + 1, value, value / total if total != 0 else np.nan, len(path) - 1, names, path])
+    return pd.DataFrame(rows, columns=['Impact', 'Rank', 'Value', 'Share', 'Depth', 'Path', 'Positions'])
+
+
+##############################################
+# Production tiers
+##############################################
+
+# A * X (or A' * X) in float64; a float32 A is upcast a block of rows at a time
+def _matvec(A, X, trans=False):
+    if sp.issparse(A) or A.dtype == np.float64:
+        return np.asarray(A.T @ X if trans else A @ X, dtype=np.float64)
+    out = np.zeros((A.shape[1] if trans else A.shape[0],) + X.shape[1:])
+    for r0 in range(0, A.shape[0], refine_chunk):
+        r1 = min(r0 + refine_chunk, A.shape[0])
+        A_ = np.asarray(A[r0:r1], dtype=np.float64)
+        if trans:
+            out += np.dot(A_.T, X[r0:r1])
+        else:
+            out[r0:r1] = np.dot(A_, X)
+    return out
+
+# Footprint of the stimulus columns per production tier, B * A^k * Y for k = 0..K
+#   A, B: technical coefficients and (characterised) coefficients, e.g. bg['A'], bg['B']
+#   Y: stimulus, n x nstim (e.g. bg['Ystim'])
+#   tol: stop when the tail is below tol * |footprint| for every impact and column
+#   max_tier: last tier computed (K) if the tail is not below tol before
+#   M: multipliers B * L; the tail is then exact, otherwise estimated as a geometric
+#      series with the largest decay ratio of the output of the last two tiers
+# Returns a dictionary with
+#   'tiers'   (K+1, nq, nstim) footprint of every tier
+#   'tail'    (nq, nstim) footprint of the tiers after K
+#   'total'   (nq, nstim) sum of the tiers plus the tail (estimate of M * Y without M)
+#   'output'  (K+1, n, nstim) output of every tier, A^k * Y (for tier_hotspot)
+#   'BA'      (K+1, nq, n) B * A^k (for tier_contrib)
+#   'converged'
+def calc_tiers(A, B, Y, tol=1e-4, max_tier=30, M=None):
+    B = np.asarray(B, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64).reshape((B.shape[1], -1))
+    exact = None if M is None else np.dot(np.asarray(M, dtype=np.float64), Y)
+    X = [Y]
+    BA = [B]
+    T = [np.dot(B, Y)]
+    tail = np.full(T[0].shape, np.inf)
+    converged = False
+    for k in range(1, max_tier + 1):
+        X.append(_matvec(A, X[-1]))
+        BA.append(_matvec(A, BA[-1].T, trans=True).T)
+        T.append(np.dot(B, X[-1]))
+        done = np.sum(T, 0)
+        if exact is not None:
+            tail = exact - done
+        elif k >= 2:
+            # decay of the output of each column (the ratio tends to the spectral radius of A)
+            norm = [np.abs(x).sum(0) for x in X[-3:]]
+            rho = np.maximum(norm[2] / np.where(norm[1] > 0, norm[1], 1), norm[1] / np.where(norm[0] > 0, norm[0], 1))
+            rho = np.where(rho < 1, rho, np.inf)
+            tail = np.abs(T[-1]) * rho / (1 - np.minimum(rho, 0.999999))
+            tail[:, norm[2] == 0] = 0
+        if np.isfinite(tail).all() and (np.abs(tail) <= tol * np.abs(done + tail)).all():
+            converged = True
+            break
+    if not np.isfinite(tail).all():
+        tail = np.where(np.isfinite(tail), tail, np.nan)
+    return {'tiers': np.array(T), 'tail': tail, 'total': np.sum(T, 0) + tail, 'output': np.array(X),
+            'BA': np.array(BA), 'converged': converged}
+
+# Hotspot results of stimulus column s per tier: where the emissions of tier k occur,
+# diag(A^k y) B' (n x nq, as calc_hotspot), one array per tier
+def tier_hotspot(tiers, B, s=0):
+    BT = np.asarray(B, dtype=np.float64).T
+    return [tiers['output'][k][:, s][:, None] * BT for k in range(len(tiers['output']))]
+
+# Contribution results of stimulus column s per tier: the footprint of tier k
+# attributed to the products bought by the stimulus, (B A^k) diag(y) (n x nq, as calc_contrib)
+def tier_contrib(tiers, Y, s=0):
+    y = np.asarray(Y, dtype=np.float64).reshape((tiers['BA'].shape[2], -1))[:, s]
+    return [(tiers['BA'][k] * y).T for k in range(len(tiers['BA']))]
+
+# Footprint per tier as a table: one row per (stimulus, tier) and a last row 'tail',
+# with the value and the (cumulative) share of the total for every impact
+#   stim: labels of the stimulus columns, e.g. bg['excelname']
+def tier_table(tiers, char_labels, stim):
+    T = tiers['tiers']
+    K = T.shape[0]
+    frames = []
+    for (s, name) in enumerate(stim):
+        vals = np.concatenate((T[:, :, s], tiers['tail'][None, :, s]))
+        index = pd.MultiIndex.from_product([[name], list(range(K)) + ['tail']], names=['Stimulus', 'Tier'])
+        df = pd.DataFrame(vals, index=index, columns=char_labels)
+        total = tiers['total'][:, s]
+        share = vals / np.where(total != 0, total, np.nan)
+        df = df.join(pd.DataFrame(share, index=index, columns=[c + ' share' for c in char_labels]))
+        df = df.join(pd.DataFrame(np.cumsum(share, 0), index=index, columns=[c + ' cumulative' for c in char_labels]))
+        frames.append(df)
+    return pd.concat(frames)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks stimulus2025.py:
+
+    1. Build the healthcare stimulus (Ystim, Hstim, Vstim) of any number of
+       regions from their expenditure, price conversion and direct emissions
+    2. Totals of the footprint of every region and breakdowns of the
+       contribution and hotspot results to reporting levels, for all regions
+       at once (international benchmark)
+
+The inputs per region have the layout of the CBS/DK data file with the ISO3
+code of the region as first index level:
+
+    Region,Index,Unit,HC service,Pharm,MedAppl
+    NLD,Expenditure,MEUR,86096.0,5639.0,3107.0
+    NLD,Conversion,na,0.996,0.673,0.849
+    NLD,DirectEm,kt CO2e,1699.0,0.0,0.0
+    DNK,Expenditure,MEUR,...
+
+The stimulus has four columns per region (Tot, HC, Pharm, Appl, as bg['Ystim']),
+region after region.
+"""
+
+import numpy as np
+import pandas as pd
+from scenarios2025 import stim_labels
+from labels2025 import AggregationCube
+from profile2025 import traced
+
+
+# Positions of the stimulated products among the 163 Exiobase industries
+k_health = 137  # healthcare services
+k_pharm = 62  # pharmaceuticals
+k_appl = 89  # medical appliances
+k_GWP = 0  # row of the direct emissions in Hstim
+k_NL = 20  # the Netherlands among the 49 regions, for the stimulus of createBackground
+
+# positions used by createBackground, other MRIO sizes (e.g. bench2025.py) pass their own
+default_positions = {'region': k_NL, 'health': k_health, 'pharm': k_pharm, 'appl': k_appl}
+
+
+##############################################
+# Inputs per region
+##############################################
+
+# Expenditure and direct emissions of several regions, indexed by (Region, Index, Unit)
+def read_country_data(path):
+    return pd.read_csv(path, index_col=['Region', 'Index', 'Unit'])
+
+# Inputs of one region (cbs_data as read in main2025.py) in the layout of read_country_data
+def country_frame(cbs_data, region):
+    return pd.concat({region: cbs_data}, names=['Region'])
+
+# Values of one row of the inputs ('Expenditure', 'Conversion', 'DirectEm'), regions x (HC service, Pharm, MedAppl)
+def _country_values(country_data, regions, row):
+    df = country_data.xs(row, level='Index')
+    if 'Unit' in df.index.names:
+        df = df.droplevel('Unit')
+    return df.reindex(regions).iloc[:, :3].to_numpy(np.float64)
+
+
+##############################################
+# Stimulus
+##############################################
+
+# Stimulus of the healthcare sector of every region in country_data
+#   Z, x, B, V, Y: MRIO objects as in createBackground (B before the unit conversion)
+#   label_region: bg['label']['region'], regions are matched on its ISO3 column
+# Returns Ystim (n x 4 nreg), Hstim (nq x 4 nreg), Vstim (nv x 4 nreg) and the
+# (region, stimulus) label of every column. As in the original Dutch stimulus, the
+# expenditure on healthcare services is not converted to basic prices, and
+# pharmaceuticals and appliances are allocated over the regions of origin with
+# the final demand of the region for these products
+@traced()
+def build_stimulus(Z, x, B, V, Y, country_data, label_region, ns, ny, k_health=k_health, k_pharm=k_pharm, k_appl=k_appl):
+    regions = list(country_data.index.get_level_values('Region').unique())
+    reg_pos = pd.Index(label_region['ISO3']).get_indexer(regions)
+    if (reg_pos < 0).any():
+        raise KeyError('Regions not in the MRIO: %s' % [r for (r, k) in zip(regions, reg_pos) if k < 0])
+
+    expenditure = _country_values(country_data, regions, 'Expenditure')
+    conversion = _country_values(country_data, regions, 'Conversion')
+    direct = _country_values(country_data, regions, 'DirectEm')
+
+    n = Y.shape[0]
+    nr = n // ns
+    nreg = len(regions)
+    x = np.asarray(x).reshape(-1)
+    jcol = reg_pos * ns + k_health  # healthcare sector of every region
+
+    # final demand of every region for the products of every region, n x nreg
+    Yreg = np.stack([Y[:, k * ny: (k + 1) * ny].sum(1) for k in reg_pos], 1).reshape((nr, ns, nreg))
+
+    # scale factor of the healthcare column of Z to the expenditure
+    scale = expenditure[:, 0] / x[jcol]
+    Zcol = Z[:, jcol]
+    Zcol = Zcol.toarray() if hasattr(Zcol, 'toarray') else np.asarray(Zcol)
+
+    Ystim = np.zeros((nr, ns, nreg, 4))
+    Ystim[:, :, :, 1] = (Zcol * scale).reshape((nr, ns, nreg))
+    for (k_prod, s, val_bp) in [(k_pharm, 2, conversion[:, 1] * expenditure[:, 1]), (k_appl, 3, expenditure[:, 2] * conversion[:, 2])]:
+        vtmp = Yreg[:, k_prod, :]
+        Ystim[:, k_prod, :, s] = val_bp * (vtmp / vtmp.sum(0))
+    Ystim = Ystim.reshape((n, nreg, 4))
+
+    Hstim = np.zeros((B.shape[0], nreg, 4))
+    Hstim[:, :, 1] = B[:, jcol] * (x[jcol] * scale)
+    Hstim[k_GWP, :, 1] = direct[:, 0] * 1e6  # kt to kg
+
+    Vstim = np.zeros((V.shape[0], nreg, 4))
+    Vstim[:, :, 1] = V[:, jcol] * scale
+
+    # total of each region in its first column
+    for stim in [Ystim, Hstim, Vstim]:
+        stim[:, :, 0] = stim[:, :, 1] + stim[:, :, 2] + stim[:, :, 3]
+
+    columns = [(r, s) for r in regions for s in stim_labels]
+    return Ystim.reshape((n, 4 * nreg)), Hstim.reshape((-1, 4 * nreg)), Vstim.reshape((-1, 4 * nreg)), columns
+
+
+##############################################
+# Results for all regions
+##############################################
+
+# Footprint totals of every region and stimulus (indirect plus direct), one row per stimulus column
+#   stim_index: MultiIndex of the stimulus columns, from bg['stim_reg']
+def region_totals(bg, stim_index, char_labels):
+    tot = np.dot(np.asarray(bg['M'], dtype=np.float64), np.asarray(bg['Ystim_reg'], dtype=np.float64))
+    tot = tot + bg['Hstim_reg']
+    return pd.DataFrame(tot.T, index=stim_index, columns=char_labels)
+
+# Breakdown of contribution or hotspot results of all stimulus columns to reporting levels
+#   arr: results of shape (n_stim, n, nq), from calc_contrib_batch or calc_hotspot_batch
+#   levels, rename: as in AggregationCube
+# All columns are aggregated in one AggregationCube. Returns {level: frame}, indexed by
+# the stimulus (Country, Stimulus) and the labels of the level, one column per impact
+@traced()
+def region_levels(labels, arr, multiindex, stim_index, char_labels, levels, rename=None):
+    nstim, n, nq = arr.shape
+    value_cols = ['v%d' % k for k in range(nstim * nq)]
+    df = pd.DataFrame(np.asarray(arr).transpose((1, 0, 2)).reshape((n, nstim * nq)), columns=value_cols)
+    df.insert(0, 'ISO3', multiindex.get_level_values(0))
+    df.insert(1, 'SecTxtCode', multiindex.get_level_values(1))
+    cube = AggregationCube(labels, df, value_cols, levels, rename=rename)
+
+    out = {}
+    for name in levels:
+        agg = cube.levels[name]
+        ngroup = len(agg)
+        groups = agg.index.to_frame(index=False)
+        arrays = [np.repeat(stim_index.get_level_values(k), ngroup) for k in range(stim_index.nlevels)]
+        arrays += [np.tile(groups[c].to_numpy(), nstim) for c in groups.columns]
+        index = pd.MultiIndex.from_arrays(arrays, names=list(stim_index.names) + list(groups.columns))
+        values = agg.to_numpy().reshape((ngroup, nstim, nq)).transpose((1, 0, 2)).reshape((nstim * ngroup, nq))
+        out[name] = pd.DataFrame(values, index=index, columns=char_labels)
+    return out
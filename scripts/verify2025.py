@@ -0,0 +1,563 @@
+# -*- coding: utf-8 -*-
+"""
+Script for:
+The environmental footprint of the Dutch healthcare sector: beyond environmental impact (in press)
+Steenmeijer MA, Rodrigues JFD, Zijp MC, Waaijers-van der Loop SL
+The Lancet Planetary Health
+
+Tasks verify2025.py:
+
+    1. Reference versions of the footprint calculations, written as in the
+       original scripts: explicit Leontief inverse, diag(L y) B' for the
+       hotspots, (B L) diag(y) for the contributions and merge + groupby for
+       the reports
+    2. Run the engines of the 2025 scripts (LU/sparse/GMRES/float32 Leontief
+       solvers, low-rank updates, batched hotspots and contributions, stored
+       multipliers, production tiers, aggregation cubes, scenarios and the
+       footprint service) on the same background and compare every output
+       with tolerances; read_exio_txt is compared with pandas (small files and
+       A of the background), fill_waste with the loops of the original waste
+       script and the stimulus of createBackground with the original Dutch one
+    3. Check the balances x = Z 1 + y and (I - A) L = I, and M = B L, with a few
+       random probe vectors instead of full products, and the error of the
+       float32 totals (calc_precision_error) against the float32 rtol. x = Z 1 + y
+       is also checked on a table built from Z0 and y0, where the output x0 is
+       known without a Leontief solve
+
+Run from the envr-footprint-healthcare2025 folder, on a synthetic MRIO
+(bench2025.py) or on a stored background:
+
+    python scripts/verify2025.py --synthetic 25x60
+    python scripts/verify2025.py --year 2016 --mrio
+
+Exit code 1 when a check fails. The table lists the largest absolute and
+relative differences of every engine against the reference; tolerances are
+set per engine (default_tolerance: GMRES and refined float32 solves are
+checked with the 'approximate' tolerances, float32 results with the float32
+ones). The explicit inverse is only formed up to --max-dense sectors, above
+that the dense float64 LU solver is the reference.
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import shutil
+import pickle as pkl
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+# Tolerances (rtol, atol relative to the largest reference value) of exact float64 engines,
+# of engines that stop at a residual (GMRES, float32 LU with refinement) and of
+# float32 engines; the float32 rtol is also the bound on calc_precision_error
+default_tolerance = {'float64': (1e-8, 1e-12), 'approximate': (1e-5, 1e-8), 'float32': (1e-4, 1e-6)}
+
+
+##############################################
+# Comparison
+##############################################
+
+# Largest absolute and relative difference of alt against ref, and whether
+# |alt - ref| <= atol * max|ref| + rtol * |ref| everywhere
+def compare_arrays(ref, alt, rtol, atol):
+    ref = np.asarray(ref, dtype=np.float64)
+    alt = np.asarray(alt, dtype=np.float64)
+    if ref.shape != alt.shape:
+        return {'max_abs': np.nan, 'max_rel': np.nan, 'ok': False, 'note': 'shape %s != %s' % (alt.shape, ref.shape)}
+    scale = np.abs(ref).max() if ref.size else 0
+    diff = np.abs(alt - ref)
+    bound = atol * scale + rtol * np.abs(ref)
+    rel = diff / np.where(np.abs(ref) > atol * scale, np.abs(ref), max(atol * scale, np.finfo(float).tiny))
+    return {'max_abs': float(diff.max()) if diff.size else 0.0, 'max_rel': float(rel.max()) if rel.size else 0.0,
+            'ok': bool((diff <= bound).all()), 'note': ''}
+
+# Same for two report frames: same rows and columns (in any order), then the values
+def compare_frames(ref, alt, rtol, atol):
+    if set(ref.index) != set(alt.index) or set(ref.columns) != set(alt.columns):
+        return {'max_abs': np.nan, 'max_rel': np.nan, 'ok': False, 'note': 'rows or columns differ'}
+    alt = alt.loc[ref.index, ref.columns]
+    return compare_arrays(ref.to_numpy(np.float64), alt.to_numpy(np.float64), rtol, atol)
+
+
+class Harness:
+
+    def __init__(self, tolerance=None):
+        self.tolerance = dict(default_tolerance, **(tolerance or {}))
+        self.rows = []
+
+    # Compare one engine with the reference; precision selects the tolerance
+    def check(self, quantity, engine, ref, alt, precision='float64'):
+        rtol, atol = self.tolerance[precision]
+        if isinstance(ref, pd.DataFrame):
+            res = compare_frames(ref, alt, rtol, atol)
+        else:
+            res = compare_arrays(ref, alt, rtol, atol)
+        self.rows.append(dict(quantity=quantity, engine=engine, rtol=rtol, atol=atol, **res))
+        return res['ok']
+
+    # Record a balance check (residual against its tolerance)
+    def balance(self, quantity, residual, tol):
+        self.rows.append({'quantity': quantity, 'engine': 'probe', 'rtol': tol, 'atol': 0, 'max_abs': np.nan,
+                          'max_rel': residual, 'ok': bool(residual <= tol), 'note': ''})
+
+    def report(self):
+        return pd.DataFrame(self.rows, columns=['quantity', 'engine', 'max_abs', 'max_rel', 'rtol', 'atol', 'ok', 'note'])
+
+
+##############################################
+# Balance checks with random probes
+##############################################
+
+# Relative residual of x = Z 1 + y, one product with Z (no n x n temporaries)
+def probe_output(Z, x, y):
+    x = np.asarray(x).reshape(-1)
+    rhs = np.asarray(Z @ np.ones(Z.shape[1])).reshape(-1) + np.asarray(y).reshape(-1)
+    return float(np.abs(x - rhs).max() / np.abs(x).max())
+
+# Relative residual of (I - A) L v = v for nprobe random vectors v
+def probe_leontief(A, L, nprobe=4, seed=0):
+    from leontief2025 import leontief_solve
+    V = np.random.default_rng(seed).standard_normal((A.shape[0], nprobe))
+    X = np.asarray(leontief_solve(L, V), dtype=np.float64)
+    R = V - (X - np.asarray(A @ X))
+    return float(np.abs(R).max() / np.abs(V).max())
+
+# Relative residual of M v = B (L v) for nprobe random vectors v
+def probe_multipliers(M, B, L, nprobe=4, seed=0):
+    from leontief2025 import leontief_solve
+    V = np.random.default_rng(seed).standard_normal((np.shape(M)[1], nprobe))
+    lhs = np.asarray(M, dtype=np.float64) @ V
+    rhs = np.asarray(B, dtype=np.float64) @ np.asarray(leontief_solve(L, V), dtype=np.float64)
+    return float(np.abs(lhs - rhs).max() / np.abs(rhs).max())
+
+
+##############################################
+# Reference implementations
+##############################################
+
+# (I - A)^-1 as an explicit matrix (calcnew_L of the original scripts)
+def reference_L(A):
+    A = A.toarray() if sp.issparse(A) else np.asarray(A, dtype=np.float64)
+    return np.linalg.inv(np.eye(A.shape[0]) - A)
+
+# Hotspot results as in the original calc_hotspot: diag(L y) B' for every column y of Y
+def reference_hotspot(B, Linv, Y):
+    B = np.asarray(B, dtype=np.float64)
+    return [np.dot(np.diag(np.dot(Linv, Y[:, k])), B.T) for k in range(Y.shape[1])]
+
+# Contribution results as in the original calc_contrib: (B L) diag(y)
+def reference_contrib(B, Linv, Y):
+    M = np.dot(np.asarray(B, dtype=np.float64), Linv)
+    return [np.dot(M, np.diag(Y[:, k])).T for k in range(Y.shape[1])]
+
+# Table 1 as in sections 4 to 7C of main2025.py, without the bottom-up rows (anaesthetic
+# gases, pMDI, travel): contribution results of every stimulus column plus the direct
+# emissions of the healthcare sector (bg['Hstim']); rows stimulus, columns cols_impcat
+def reference_table1(bg, multiindex, char_labels, cols_impcat):
+    from functions2025 import calc_contrib, df_fromarray
+    df_contrib = df_fromarray(calc_contrib(bg['B'], bg['L'], bg['Ystim'], bg['M']), char_labels, multiindex, cols_impcat)
+    cols_df = df_contrib[0].columns
+    hc_dir_row = pd.Series(['NLD', 'B_HEAL'] + [bg['Hstim'][char_labels.index(c), 0] for c in cols_impcat], index=cols_df)
+    add_rows = pd.concat([hc_dir_row], axis=1, ignore_index=True).T
+    df_contrib[0] = pd.concat([df_contrib[0], add_rows], ignore_index=True)
+    df_contrib[1] = pd.concat([df_contrib[1], add_rows], ignore_index=True)
+    n = len(multiindex)
+    s1 = df_contrib[0].iloc[:, 2:].sum()
+    s2 = df_contrib[1].iloc[:n + 1, 2:].sum()
+    s3 = df_contrib[2].iloc[:, 2:].sum()
+    s4 = df_contrib[3].iloc[:, 2:].sum()
+    t1 = pd.concat([s1, s2, s3, s4], axis=1)
+    t1.columns = ['Total', 'Healthcare services', 'Pharmaceuticals and chemical products', 'Medical appliances']
+    return t1.T.astype(float)
+
+# Report as in the original main script: labels merged on ISO3 and SecTxtCode, then grouped
+def reference_report(df, reg_labels, sec_labels, keys, value_cols):
+    df = pd.merge(df, reg_labels, on='ISO3', how='left')
+    df = pd.merge(df, sec_labels, on='SecTxtCode', how='left')
+    return df.groupby(keys)[value_cols].sum()
+
+# Exiobase text file read in one go by pandas, as in the original load script
+def reference_exio_txt(path, n_index, n_header):
+    return np.array(pd.read_csv(path, sep='\t', index_col=list(range(n_index)), header=list(range(n_header))))
+
+# Waste extension (h, r) filled with the loops of the original waste script;
+# industries without a match are skipped (the original wrote them to position -1)
+def reference_waste(waste_final, waste_industry, region, final, industry):
+    nreg = region.shape[0]
+    nreg_waste = nreg - 1
+    nfin = final.shape[0]
+    nfin_waste = nfin - 1
+    nind = industry.shape[0]
+    nind_waste = nind + 1
+    reg_exio = list(region.index)
+    reg_pos = [reg_exio.index(waste_final.columns[i * nfin_waste][0]) for i in range(nreg_waste)]
+    ind_exio = list(industry.index)
+    ind_pos = []
+    for i in range(nind_waste):
+        val = waste_industry.columns[i][3]
+        ind_pos.append(109 if val == 'A_MGWG' else (ind_exio.index(val) if val in ind_exio else -1))
+    h = np.zeros((1, nreg * nfin))
+    for i in range(nreg_waste):
+        for j in range(nfin_waste):
+            h[0, reg_pos[i] * nfin + j] = waste_final.iloc[:, i * nfin_waste + j].sum()
+    r = np.zeros((1, nreg * nind))
+    for i in range(nreg_waste):
+        for j in range(nind_waste):
+            if ind_pos[j] >= 0:
+                r[0, reg_pos[i] * nind + ind_pos[j]] = waste_industry.iloc[:, i * nind_waste + j].sum()
+    return h, r
+
+# Stimulus of Dutch healthcare as hard-coded in the original createBackground
+# (region k_NL, products k_health, k_pharm, k_appl), after the unit conversion
+#   mrio: output of the process step (x, Z, Y, V, R, Q, label), waste: waste.pkl
+def reference_stimulus(mrio, waste, cbs_data, k_NL=20, k_health=137, k_pharm=62, k_appl=89):
+    x = np.asarray(mrio['x'], dtype=np.float64)
+    Z = mrio['Z'].toarray() if sp.issparse(mrio['Z']) else np.asarray(mrio['Z'])
+    Y = np.asarray(mrio['Y'])
+    V = np.asarray(mrio['V'])
+    R = np.asarray(mrio['Q'] @ mrio['R'])
+    R = np.concatenate((R, waste['r']), 0)
+    xinv = (x != 0) / (x + (x == 0))
+    B = R * xinv[:, 0][None, :]  # np.dot(R, np.diag(xinv[:,0])) without the n x n diagonal
+    nr = mrio['label']['region'].shape[0]
+    ns = mrio['label']['industry'].shape[0]
+    ny = mrio['label']['final'].shape[0]
+    nv = V.shape[0]
+    nq = R.shape[0]
+
+    val_GWP_health = float(cbs_data.iloc[2,0]) * 1e6  # kt to kg
+    val_pharm_bp = float(cbs_data.iloc[1,1]) * float(cbs_data.iloc[0,1])
+    val_appl_bp = float(cbs_data.iloc[0,2]) * float(cbs_data.iloc[1,2])
+    valloc = []
+    for k in [k_pharm, k_appl]:
+        vy = Y[:, k_NL * ny: (k_NL + 1)* ny].sum(1).reshape((nr,ns))
+        vtmp = vy[:,k]
+        vtmp = vtmp / vtmp.sum()
+        vy = np.zeros((nr, ns))
+        vy[:,k] = vtmp
+        valloc.append(vy.reshape((nr*ns, )))
+    scale_factor = float(cbs_data.iloc[0, 0]) / x[k_NL*ns + k_health].sum()
+
+    Ystim = np.zeros((nr*ns,3))
+    Hstim = np.zeros((nq,3))
+    Vstim = np.zeros((nv,3))
+    Ystim[:,0] = Z[:,k_NL*ns + k_health] * scale_factor
+    Ystim[:,1] = val_pharm_bp * valloc[0]
+    Ystim[:,2] = val_appl_bp * valloc[1]
+    Hstim[:,0] = B[:, k_NL*ns + k_health] * (x[k_NL*ns + k_health] * scale_factor)
+    Hstim[0,0] = val_GWP_health
+    Vstim[:,0] = V[:, k_NL*ns + k_health] * scale_factor
+    Ystim = np.concatenate((Ystim.sum(1).reshape((nr*ns,1)), Ystim),1)
+    Hstim = np.concatenate((Hstim.sum(1).reshape((nq,1)), Hstim),1)
+    Vstim = np.concatenate((Vstim.sum(1).reshape((nv,1)), Vstim),1)
+    Hstim[0,:] = Hstim[0,:] * 1e-6
+    Hstim[-1,:] = Hstim[-1,:] * 1e-3
+    return Ystim, Hstim, Vstim
+
+
+##############################################
+# Reader checks
+##############################################
+
+# Write values in the layout of the Exiobase text files: n_header label rows,
+# a row with the index names (n_index > 1), n_index label columns per row;
+# ending is written after the last row ('' for a file without final line break)
+def write_exio_txt(path, values, n_index=2, n_header=2, ending='\n'):
+    (n, m) = values.shape
+    lines = []
+    for k in range(n_header):
+        lines.append('\t'.join(['level%d' % k] + [''] * (n_index - 1) + ['c%d_%d' % (k, j // (k + 1)) for j in range(m)]))
+    if n_index > 1:
+        lines.append('\t'.join(['index%d' % k for k in range(n_index)] + [''] * m))
+    for i in range(n):
+        lines.append('\t'.join(['r%d_%d' % (k, i) for k in range(n_index)] + [repr(float(v)) for v in values[i]]))
+    with open(path, 'w', newline='') as f:
+        f.write('\n'.join(lines) + ending)
+
+# read_exio_txt against pandas on small files with the line endings that break a
+# line count: a trailing blank line and no final line break; and on A of the
+# background (A.txt layout) when given, split over the default number of threads
+def check_reader(h, work_dir, seed=0, A=None):
+    from exioreader2025 import read_exio_txt
+    rng = np.random.default_rng(seed)
+    values = rng.random((53, 7)) * (rng.random((53, 7)) < 0.5)
+    for (n_index, n_header) in [(2, 2), (1, 2)]:
+        for (name, ending) in [('final line break', '\n'), ('trailing blank line', '\n\n'), ('no final line break', '')]:
+            path = os.path.join(work_dir, 'exio_%d_%d.txt' % (n_index, len(ending)))
+            write_exio_txt(path, values, n_index, n_header, ending)
+            alt = read_exio_txt(path, n_index=n_index, n_header=n_header, n_threads=4)[0]
+            h.check('reader (%d index columns)' % n_index, 'read_exio_txt, %s' % name, reference_exio_txt(path, n_index, n_header), alt)
+    if A is not None:
+        path = os.path.join(work_dir, 'A.txt')
+        write_exio_txt(path, A.toarray() if sp.issparse(A) else np.asarray(A, dtype=np.float64))
+        h.check('reader (A.txt)', 'read_exio_txt', reference_exio_txt(path, 2, 2), read_exio_txt(path, n_index=2, n_header=2)[0])
+
+
+##############################################
+# Waste and balance checks
+##############################################
+
+# Sheets of the waste workbook for nreg Exiobase regions (the last one missing, as
+# RoW in the SUT), nind industries with A_MGWG after A_GASD (position 109), nfin categories
+def synthetic_waste(nreg=5, nind=112, nfin=7, nrow=4, seed=0):
+    rng = np.random.default_rng(seed)
+    region = pd.DataFrame({'Name': ['Region %d' % k for k in range(nreg)]}, index=['C%02d' % k for k in range(nreg)])
+    codes = ['I%03d' % k for k in range(nind)]
+    codes[109] = 'A_GASD'
+    industry = pd.DataFrame({'Name': codes}, index=codes)
+    final = pd.DataFrame({'Name': ['Final demand %d' % k for k in range(nfin)]})
+    ind_waste = codes[:110] + ['A_MGWG'] + codes[110:]
+    regs = list(region.index[:nreg - 1])
+    cols_fin = pd.MultiIndex.from_tuples([(r, 'f', 'f', 'F%d' % j) for r in regs for j in range(nfin - 1)])
+    cols_ind = pd.MultiIndex.from_tuples([(r, 'i', 'i', c) for r in regs for c in ind_waste])
+    waste_final = pd.DataFrame(rng.random((nrow, len(cols_fin))), columns=cols_fin)
+    waste_industry = pd.DataFrame(rng.random((nrow, len(cols_ind))), columns=cols_ind)
+    return waste_final, waste_industry, region, final, industry
+
+# x = L y and Z = A diag(x) (the process step) on a table built from Z0 and y0, so
+# that x0 = Z0 1 + y0 is known independently of the Leontief solve and A
+def balance_case(n, seed=0):
+    from leontief2025 import scale_columns, calc_xinv
+    rng = np.random.default_rng(seed)
+    Z0 = rng.lognormal(0, 1, (n, n)) * (rng.random((n, n)) < 0.3)
+    y0 = rng.lognormal(2, 1, n)
+    x0 = Z0.sum(1) + y0
+    return {'A': scale_columns(Z0, calc_xinv(x0)), 'x0': x0, 'y0': y0}
+
+
+##############################################
+# Harness
+##############################################
+
+# Background objects needed by the harness, in float64
+def _dense(bg):
+    return {k: np.asarray(bg[k], dtype=np.float64) for k in ['B', 'M', 'Ystim', 'Hstim']}
+
+# Run all engines against the references on one background
+#   bg: background (createBackground or load_background)
+#   reg_labels, sec_labels: label tables of the reports (ISO3, RegName, Region / SecTxtCode, SecName, ...)
+#   levels: report levels {name: [label columns]}
+#   mrio: optional output of the process step (mrio<year>.pkl), for the balance x = Z 1 + y
+#   waste, cbs_data, positions: waste.pkl, the CBS data and the stimulus positions of
+#         createBackground; with mrio the stimulus is compared with the original one
+#   max_dense: largest n for which the explicit inverse is the reference
+#   root, year: folder with data/bg/background<year> (the store of bg), for the yearly
+#               totals of pipeline2025.footprint_by_year
+def run_harness(bg, reg_labels, sec_labels, levels, mrio=None, tolerance=None, max_dense=3000, nprobe=4, seed=0, root=None, year=None,
+                waste=None, cbs_data=None, positions=None):
+    from leontief2025 import LeontiefSolver, update_leontief, leontief_solve, calc_multipliers
+    from functions2025 import calc_hotspot, calc_contrib, calc_contrib_batch, calc_hotspot_batch, calcnew_L, df_fromarray, calc_precision_error, adapt_A, adapt_L
+    from labels2025 import LabelTable, AggregationCube
+    from scenarios2025 import ScenarioIndex, calc_scenarios, scatter_Ystim
+    from service2025 import FootprintModel
+    from spa2025 import calc_tiers
+
+    from leontief2025 import scale_columns, calc_output
+    from exioreader2025 import fill_waste
+
+    h = Harness(tolerance)
+    work_dir = tempfile.mkdtemp(prefix='verify2025-reader-')
+    try:
+        check_reader(h, work_dir, seed, bg['A'] if bg['A'].shape[0] <= max_dense else None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    d = _dense(bg)
+    A = bg['A']
+    A64 = A.astype(np.float64) if sp.issparse(A) else np.asarray(A, dtype=np.float64)
+    n = A64.shape[0]
+    Y = d['Ystim']
+    B = d['B']
+
+    # balances
+    tol = h.tolerance['float64'][0]
+    h.balance('(I - A) L = I', probe_leontief(A64, bg['L'], nprobe, seed), tol)
+    h.balance('M = B L', probe_multipliers(d['M'], B, bg['L'], nprobe, seed), tol)
+    if mrio is not None:
+        h.balance('x = Z 1 + y', probe_output(mrio['Z'], mrio['x'], np.asarray(mrio['Y']).sum(1)), tol)
+    # process step (calc_output) on a table with known output x0, for solvers as unpickled
+    # from leontief<year>.pkl by the process script (a float32 solver without A)
+    case = balance_case(min(n, max_dense), seed)
+    for (name, L_, precision) in [('dense LU', LeontiefSolver(case['A'], sparse=False), 'float64'),
+                                  ('GMRES', LeontiefSolver(sp.csr_matrix(case['A']), sparse=True, method='iterative'), 'approximate'),
+                                  ('float32 LU', LeontiefSolver(case['A'], sparse=False, dtype=np.float32), 'approximate')]:
+        L_ = pkl.loads(pkl.dumps(L_))
+        x_ = calc_output(L_, case['A'], case['y0'].reshape((-1, 1)))
+        Z_ = scale_columns(case['A'], x_[:, 0])
+        h.balance('x = Z 1 + y (x = L y, Z = A diag(x))', probe_output(Z_, x_, case['y0']), h.tolerance[precision][0])
+        h.check('output x (reference: Z0 1 + y0)', 'process step, %s' % name, case['x0'], x_[:, 0], precision)
+
+    # waste extension: one scatter per sheet against the loops
+    sheets = synthetic_waste(seed=seed)
+    for (part, ref, alt) in zip(['h', 'r'], reference_waste(*sheets), fill_waste(*sheets)):
+        h.check('waste extension %s' % part, 'fill_waste', ref, alt)
+
+    # Dutch stimulus of createBackground (stimulus2025.build_stimulus) against the original
+    if mrio is not None and waste is not None and cbs_data is not None:
+        k = dict({'region': 20, 'health': 137, 'pharm': 62, 'appl': 89}, **(positions or {}))
+        ref = reference_stimulus(mrio, waste, cbs_data, k['region'], k['health'], k['pharm'], k['appl'])
+        for (name, arr) in zip(['Ystim', 'Hstim', 'Vstim'], ref):
+            h.check('stimulus %s' % name, 'createBackground', arr, np.asarray(bg[name], dtype=np.float64),
+                    'float32' if np.asarray(bg[name]).dtype == np.float32 else 'float64')
+
+    # Leontief engines, on the demand of all stimulus columns
+    if n <= max_dense:
+        Linv = reference_L(A64)
+        X_ref = Linv @ Y
+        ref_name = 'explicit inverse'
+    else:
+        Linv = None
+        X_ref = LeontiefSolver(A64, sparse=False).solve(Y)
+        ref_name = 'dense LU'
+    # float32 solver as stored: pickled without A, attached to the float32 A of a background
+    L32 = pkl.loads(pkl.dumps(LeontiefSolver(A64, sparse=False, dtype=np.float32)))
+    L32.attach(A64.astype(np.float32))
+    engines = {'stored L (%s)' % type(bg['L']).__name__: (bg['L'], 'float64'),
+               'calcnew_L': (calcnew_L({'A': A64}), 'float64'),
+               'dense LU': (LeontiefSolver(A64, sparse=False), 'float64'),
+               'sparse LU': (LeontiefSolver(sp.csr_matrix(A64), sparse=True), 'float64'),
+               'GMRES': (LeontiefSolver(sp.csr_matrix(A64), sparse=True, method='iterative'), 'approximate'),
+               'float32 LU + refinement': (LeontiefSolver(A64, sparse=False, dtype=np.float32), 'approximate'),
+               'float32 LU, pickled + attach(A)': (L32, 'approximate'),
+               'float32 LU, no refinement': (LeontiefSolver(A64, sparse=False, dtype=np.float32, refine=0), 'float32')}
+    for (name, (L_, precision)) in engines.items():
+        if name == 'dense LU' and ref_name == 'dense LU':
+            continue
+        h.check('L y (reference: %s)' % ref_name, name, X_ref, leontief_solve(L_, Y), precision)
+    h.balance('float32 totals (calc_precision_error)', float(calc_precision_error(bg).values.max()), h.tolerance['float32'][0])
+
+    # low-rank update of A against a new factorisation
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, n, 3)
+    cols = rng.integers(0, n, 3)
+    dA = sp.csr_matrix((0.05 * rng.random(3), (rows, cols)), shape=(n, n))
+    h.check('L y after a change of A', 'update_leontief', LeontiefSolver(A64 + dA.toarray(), sparse=False).solve(Y), update_leontief(bg['L'], A64, dA).solve(Y))
+
+    # multipliers, hotspots and contributions
+    M_ref = B @ Linv if Linv is not None else calc_multipliers(B, LeontiefSolver(A64, sparse=False))
+    h.check('multipliers B L', 'stored M', M_ref, d['M'], 'float32' if np.asarray(bg['M']).dtype == np.float32 else 'float64')
+    if Linv is not None:
+        hot_ref = np.stack(reference_hotspot(B, Linv, Y))
+        con_ref = np.stack(reference_contrib(B, Linv, Y))
+    else:
+        hot_ref = X_ref.T[:, :, None] * B.T[None, :, :]
+        con_ref = Y.T[:, :, None] * M_ref.T[None, :, :]
+    h.check('hotspot', 'calc_hotspot', hot_ref, np.stack(calc_hotspot(B, bg['L'], Y)))
+    h.check('hotspot', 'calc_hotspot_batch (chunk 1)', hot_ref, calc_hotspot_batch(B, bg['L'], Y, chunk=1))
+    h.check('contribution', 'calc_contrib (stored M)', con_ref, np.stack(calc_contrib(B, bg['L'], Y, d['M'])))
+    h.check('contribution', 'calc_contrib (M from B, L)', con_ref, np.stack(calc_contrib(B, bg['L'], Y)))
+    h.check('contribution', 'calc_contrib_batch', con_ref, calc_contrib_batch(d['M'], Y))
+
+    # totals as in Table 1 (indirect of every stimulus column plus the direct emissions)
+    tot_ref = con_ref.sum(1).T + d['Hstim']
+    model = FootprintModel(bg)
+    service = np.stack([model.footprint(Y[:, k])['total'] for k in range(Y.shape[1])], 1) + d['Hstim']
+    h.check('totals (Table 1)', 'footprint service', tot_ref, service)
+    char = bg['label']['characterization']
+    char_labels = [str(nm) + ' (' + str(u) + ')' for (nm, u) in zip(char['Name'], char['Unit'])]
+    multiindex = pd.MultiIndex.from_product([list(reg_labels['ISO3']), list(sec_labels['SecTxtCode'])])
+    tiers = calc_tiers(A64, B, Y, tol=1e-12, max_tier=1000)
+    h.check('totals (Table 1)', 'calc_tiers (power series, no L)', con_ref.sum(1).T, tiers['total'], 'approximate')
+    idx = ScenarioIndex(multiindex, char_labels)
+    # A scenario with a coefficient edited twice (the last edit wins) against a new factorisation
+    (p, q) = (multiindex[rows[0]], multiindex[cols[0]])
+    edits = [p + q + (0.01,), p + q + (0.02,), multiindex[rows[1]] + multiindex[cols[1]] + (0.03,)]
+    A_s = adapt_A({'A': A64}, multiindex, *edits)
+    h.check('L y after a change of A', 'adapt_L (repeated edit)', LeontiefSolver(A_s, sparse=False).solve(Y), adapt_L({'A': A64, 'L': bg['L']}, multiindex, *edits).solve(Y))
+    if root is not None:
+        from pipeline2025 import footprint_by_year
+        cols_impcat = [c for c in char_labels if c not in ['Value added (M.EUR)', 'Employment (1000 p.)', 'Emp (1000 p.)']]
+        t1 = reference_table1(bg, multiindex, char_labels, cols_impcat)
+        years = footprint_by_year(root, [year]).pivot(index='Impact', columns='Stimulus', values='Value')
+        h.check('totals (Table 1)', 'footprint_by_year', t1.to_numpy(), years.loc[cols_impcat, list(bg['excelname'])].to_numpy().T)
+    for (k, stim) in enumerate(['Tot', 'HC', 'Pharm', 'Appl']):
+        h.check('totals (Table 1)', 'calc_scenarios baseline, %s' % stim, con_ref[k].sum(0), calc_scenarios(bg, idx, {}, stim).loc['baseline'].values)
+    # Y edits of two columns (one position edited twice): every column against M y of scatter_Ystim
+    y_edits = [multiindex[rows[0]] + ('HC', 5.0), multiindex[rows[0]] + ('HC', 7.0), multiindex[rows[1]] + ('Pharm', 3.0)]
+    Y_s = scatter_Ystim(Y, idx, y_edits)
+    for (k, stim) in enumerate(['Tot', 'HC', 'Pharm', 'Appl']):
+        h.check('scenario totals', 'calc_scenarios Y edits, %s' % stim, M_ref @ Y_s[:, k], calc_scenarios(bg, idx, {'y': {'Y': y_edits}}, stim).loc['y'].values)
+
+    # reports: merge + groupby against LabelTable + AggregationCube
+    labels = LabelTable(reg_labels, sec_labels, multiindex)
+    for (k, (name, arr)) in enumerate([('hotspot', hot_ref[0]), ('contribution', con_ref[0])]):
+        df = df_fromarray([arr], char_labels, multiindex, char_labels)[0]
+        cube = AggregationCube(labels, df, char_labels, levels)
+        for (level, keys) in levels.items():
+            ref = reference_report(df, reg_labels, sec_labels, keys, char_labels)
+            h.check('report %s/%s' % (name, level), 'AggregationCube', ref, cube[level])
+        attached = labels.attach(df, [c for c in list(reg_labels.columns) + list(sec_labels.columns) if c not in ['ISO3', 'SecTxtCode']])
+        merged = pd.merge(pd.merge(df, reg_labels, on='ISO3', how='left'), sec_labels, on='SecTxtCode', how='left')
+        same = all((attached[c].astype(str).values == merged[c].astype(str).values).all() for c in merged.columns)
+        h.rows.append({'quantity': 'report %s/labels' % name, 'engine': 'LabelTable.attach', 'rtol': 0, 'atol': 0,
+                       'max_abs': np.nan, 'max_rel': np.nan, 'ok': bool(same), 'note': ''})
+    return h.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the footprint engines with the reference implementation')
+    parser.add_argument('--root', default=os.getcwd(), help='envr-footprint-healthcare2025 folder')
+    parser.add_argument('--synthetic', default=None, help='regions x sectors of a synthetic MRIO, e.g. 25x60')
+    parser.add_argument('--year', default='2016', help='year of the stored background (without --synthetic)')
+    parser.add_argument('--mrio', action='store_true', help='also check x = Z 1 + y and the stimulus with mrio<year>.pkl (always with --synthetic)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-dense', type=int, default=3000)
+    parser.add_argument('--rtol', type=float, default=None, help='float64 rtol')
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(args.root, 'scripts'))
+    from functions2025 import createBackground
+    from background2025 import load_background
+
+    tolerance = {'float64': (args.rtol, default_tolerance['float64'][1])} if args.rtol else None
+    mrio = None
+    work = None
+    if args.synthetic:
+        from bench2025 import synthetic_mrio, write_synthetic
+        (nr, ns) = [int(k) for k in args.synthetic.lower().split('x')]
+        synth = synthetic_mrio(nr, ns, args.seed)
+        work = tempfile.mkdtemp(prefix='verify2025-')
+        mrio_dir = os.path.join(work, 'pickled_mrio', '')
+        os.makedirs(mrio_dir)
+        write_synthetic(synth, mrio_dir)
+        bg = createBackground(mrio_dir, synth['cbs_data'], os.path.join(work, 'data', 'bg', ''), '2016', positions=synth['positions'])
+        (root, year) = (work, '2016')
+        reg_labels = synth['reg_labels']
+        sec_labels = synth['sec_labels']
+        (waste, cbs_data, positions) = (synth['waste'], synth['cbs_data'], synth['positions'])
+        with open(os.path.join(mrio_dir, 'mrio2016.pkl'), 'rb') as f:
+            mrio = pkl.load(f)
+        levels = {'aggsec': ['SAggDescription'], 'aggsec_aggreg': ['RegName', 'SAggDescription'],
+                  'aggreg': ['Region', 'RegName'], 'allsec': ['SecTxtCode', 'SecName']}
+    else:
+        bg = load_background(os.path.join(args.root, 'data', 'bg', ''), args.year)
+        (root, year) = (args.root, args.year)
+        reg_labels = bg['label']['region'][['ISO3', 'Name', 'DESIRE region name']]
+        reg_labels.columns = ['ISO3', 'RegName', 'Region']
+        sec_labels = pd.DataFrame({'SecTxtCode': list(bg['label']['industry'].index), 'SecName': list(bg['label']['industry']['Name'])})
+        (waste, cbs_data, positions) = (None, None, None)
+        if args.mrio:
+            mrio_dir = os.path.join(args.root, 'data', 'bg', 'pickled_mrio', '')
+            with open(mrio_dir + 'mrio' + args.year + '.pkl', 'rb') as f:
+                mrio = pkl.load(f)
+            with open(mrio_dir + 'waste.pkl', 'rb') as f:
+                waste = pkl.load(f)
+            # as read in main2025.py
+            cbs_data = pd.read_csv(os.path.join(args.root, 'data', 'DK_data_2025.csv'), index_col=['Index', 'Unit'])
+            cbs_data.iloc[1, 0] = 1
+        levels = {'allreg': ['RegName'], 'aggreg': ['Region', 'RegName'], 'allsec': ['SecTxtCode', 'SecName']}
+
+    try:
+        res = run_harness(bg, reg_labels, sec_labels, levels, mrio, tolerance, args.max_dense, seed=args.seed, root=root, year=year,
+                          waste=waste, cbs_data=cbs_data, positions=positions)
+    finally:
+        if work is not None:
+            shutil.rmtree(work, ignore_errors=True)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_rows', 200)
+    print(res.to_string(index=False, float_format=lambda v: '%.2e' % v))
+    if not res['ok'].all():
+        print('\n%d of %d checks failed' % ((~res['ok']).sum(), len(res)))
+        sys.exit(1)
+    print('\nAll %d checks passed' % len(res))